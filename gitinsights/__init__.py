@@ -2,33 +2,146 @@ import datetime
 import json
 import logging
 import os
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Union
 
 import azure.functions as func
 
+from .mods.event_log import EventLog
+from .mods.identity import IdentityIndexStore
+from .mods.incremental import IncrementalStateStore
+from .mods.instrumentation import MetricsInstrumentation
 from .mods.kv_client import KeyvaultClient
 from .mods.managers.ado import AzureDevopsClientManager
+from .mods.managers.ado import CollectionSettings
+from .mods.managers.sharded import CollectionTarget
+from .mods.managers.sharded import ShardedCollectionDriver
+from .mods.report_store import ParquetReportStore
+from .mods.response_cache import DirectoryResponseCache
 
 
-def main(mytimer: func.TimerRequest, outputBlob: func.Out[func.InputStream]) -> None:
-    # Required settings
-    keyVaultName = os.environ["KeyvaultName"]
-    patSecretName = os.environ["PatSecretName"]
-    adoProject = os.environ["AdoProjectName"]
-    adoOrg = os.environ["AdoOrgName"]
-    repos = os.environ["AdoRepos"]
-    teamId = os.environ["BacklogTeamId"]
+def _dateSetting(name: str) -> Optional[datetime.datetime]:
+    value = os.environ.get(name)
+
+    return datetime.datetime.fromisoformat(value) if value else None
 
-    # Optional settings
-    # Accounts for local git profile setup discrepencies
-    aliasDict = json.loads(os.environ.get("ProfileAliases", "{}").replace("\'", "\""))
 
-    groupByColumns = ['contributor', 'week', 'repo']
+def _runSettings() -> Dict[str, Any]:
+    # Collects a list of org, project, repos and team targets in worker processes instead of the single target below
+    adoTargets = json.loads(os.environ.get("AdoTargets") or "[]")
+    settings = {
+        # Required settings
+        'keyVaultName': os.environ["KeyvaultName"],
+        'patSecretName': os.environ["PatSecretName"],
+        'adoTargets': adoTargets,
+        'adoProject': os.environ["AdoProjectName"] if not adoTargets else os.environ.get("AdoProjectName"),
+        'adoOrg': os.environ["AdoOrgName"] if not adoTargets else os.environ.get("AdoOrgName"),
+        'repos': os.environ["AdoRepos"] if not adoTargets else os.environ.get("AdoRepos"),
+        'teamId': os.environ["BacklogTeamId"] if not adoTargets else os.environ.get("BacklogTeamId"),
 
-    if not keyVaultName or not patSecretName or not adoProject or not adoOrg or not repos:
+        # Optional settings
+        # Persistent directory holding the watermarks and partial aggregates of previous runs
+        'incrementalStateDirectory': os.environ.get("IncrementalStateDirectory"),
+        # Writes a run metrics summary (json or prometheus) alongside the output CSV
+        'metricsFormat': os.environ.get("MetricsFormat"),
+        # Worker processes of a multi target collection, and the in-flight requests each org allows across them
+        'maxProcesses': int(os.environ.get("MaxProcesses") or "0"),
+        'maxConcurrentRequestsPerOrg': int(os.environ.get("MaxConcurrentRequestsPerOrg") or "8"),
+        # Writes the report (and optionally the raw events) as Parquet datasets partitioned by year, week and repo instead of the output CSV
+        'outputFormat': os.environ.get("OutputFormat") or "csv",
+        'parquetOutputDirectory': os.environ.get("ParquetOutputDirectory"),
+        'parquetIncludeEvents': os.environ.get("ParquetIncludeEvents", "false").lower() == "true",
+        # Spills the raw records of the run to a gzipped event log, which the SDK can re-aggregate without a crawl
+        'eventLogPath': os.environ.get("EventLogPath"),
+        # Folds the records into per group aggregates as they are collected rather than building the full event frame
+        'streamingAggregation': os.environ.get("StreamingAggregation", "false").lower() == "true"
+    }
+    required = ['keyVaultName', 'patSecretName'] + (['adoProject', 'adoOrg', 'repos'] if not adoTargets else [])
+    fullSingleTargetRun = not settings['incrementalStateDirectory'] and not adoTargets
+
+    if not all(settings[name] for name in required):
         raise ValueError('Required environment variables are undefined')
 
-    kvURI = f"https://{keyVaultName}.vault.azure.net"
-    patToken = KeyvaultClient(kvURI).getSecretValue(patSecretName)
+    if settings['outputFormat'] not in ("csv", "parquet") or (settings['outputFormat'] == "parquet" and not settings['parquetOutputDirectory']):
+        raise ValueError('OutputFormat must be csv, or parquet along with a ParquetOutputDirectory')
+
+    if settings['parquetIncludeEvents'] and settings['incrementalStateDirectory']:
+        raise ValueError('Incremental runs only collect the changed events, which can not be written as the raw event dataset')
+
+    # the watermarks and partial aggregates of an incremental state directory belong to a single target
+    if settings['incrementalStateDirectory'] and adoTargets:
+        raise ValueError('IncrementalStateDirectory is only supported by single target runs')
+
+    if settings['eventLogPath'] and not fullSingleTargetRun:
+        raise ValueError('EventLogPath is only supported by full, single target runs')
+
+    if settings['streamingAggregation'] and (not fullSingleTargetRun or settings['outputFormat'] != "csv"):
+        raise ValueError('StreamingAggregation is only supported by full, single target runs with csv output')
+
+    return settings
+
+
+def _managerSettings(instrumentation: Optional[MetricsInstrumentation]) -> CollectionSettings:
+    # Optional settings of the manager of a single target run, or of the managers of every target of a sharded run
+    entitlementsCacheDirectory = os.environ.get("EntitlementsCacheDirectory")
+    entitlementsCacheTtlHours = float(os.environ.get("EntitlementsCacheTtlHours") or "24")
+    # Persistent directory caching ADO responses across runs
+    responseCacheDirectory = os.environ.get("ResponseCacheDirectory")
+
+    return CollectionSettings(
+        # Number of pull requests whose commits and comments are fetched concurrently
+        maxWorkers=int(os.environ.get("MaxWorkers", "1")),
+        maxConcurrentRequestsPerHost=int(os.environ.get("MaxConcurrentRequestsPerHost", "8")),
+        maxConcurrentWorkitemBatches=int(os.environ.get("MaxConcurrentWorkitemBatches", "4")),
+        # Narrows the in-flight requests per org to the throttling headers of ADO
+        adaptiveRateLimit=os.environ.get("AdaptiveRateLimit", "false").lower() == "true",
+        responseCache=DirectoryResponseCache(responseCacheDirectory) if responseCacheDirectory else None,
+        # Bounds the repo commit history fetched for change counts, or looks them up by the commit ids referenced by pull requests
+        commitsFromDate=_dateSetting("CommitsFromDate"),
+        changeCountsByCommitId=os.environ.get("ChangeCountsByCommitId", "false").lower() == "true",
+        # Work item types and reporting window pushed into the WIQL query
+        workItemTypes=[workItemType.strip() for workItemType in os.environ.get("WorkItemTypes", "User Story").split(",") if workItemType.strip()],
+        workitemsFromDate=_dateSetting("WorkitemsFromDate"),
+        # Reporting window of the pull request comments, by their last update
+        commentsFromDate=_dateSetting("CommentsFromDate"),
+        # Narrows the org profiles to the project or team members, and persists them across runs for the given hours
+        entitlementsScope=os.environ.get("EntitlementsScope") or "org",
+        identityStore=IdentityIndexStore(entitlementsCacheDirectory, datetime.timedelta(hours=entitlementsCacheTtlHours)) if entitlementsCacheDirectory else None,
+        instrumentation=instrumentation
+    )
+
+
+def _client(settings: Dict[str, Any], patToken: str, instrumentation: Optional[MetricsInstrumentation]) -> Union[AzureDevopsClientManager, ShardedCollectionDriver]:
+    managerSettings = _managerSettings(instrumentation)
+    # Accounts for local git profile setup discrepencies
+    profileAliases = json.loads(os.environ.get("ProfileAliases", "{}").replace("\'", "\""))
+
+    if settings['adoTargets']:
+        targets = [CollectionTarget(target["org"], target["project"], target["repos"], target["teamId"]) for target in settings['adoTargets']]
+
+        return ShardedCollectionDriver(targets, patToken, settings['maxProcesses'] or None, settings['maxConcurrentRequestsPerOrg'], settings=managerSettings, profileAliases=profileAliases)
+
+    return AzureDevopsClientManager(settings['adoOrg'], settings['adoProject'], settings['repos'].split(','), settings['teamId'], patToken, profileAliases,
+                                    settings=managerSettings._replace(
+                                        incrementalStore=IncrementalStateStore(settings['incrementalStateDirectory']) if settings['incrementalStateDirectory'] else None,
+                                        eventLog=EventLog(settings['eventLogPath']) if settings['eventLogPath'] else None))
+
+
+def main(mytimer: func.TimerRequest, outputBlob: func.Out[func.InputStream], metricsBlob: func.Out[str]) -> None:
+    settings = _runSettings()
+    groupByColumns = ['contributor', 'week', 'repo'] if settings['outputFormat'] != "parquet" else ['contributor', 'year', 'week', 'repo']
+
+    if settings['adoTargets']:
+        # every target of the run is reported side by side
+        groupByColumns = ['organization', 'project'] + groupByColumns
+
+    kvURI = f"https://{settings['keyVaultName']}.vault.azure.net"
+    patToken = KeyvaultClient(kvURI).getSecretValue(settings['patSecretName'])
+
+    if patToken.value is None:
+        raise ValueError('The key vault secret {} has no value'.format(settings['patSecretName']))
 
     utc_timestamp = datetime.datetime.utcnow().replace(
         tzinfo=datetime.timezone.utc).isoformat()
@@ -36,8 +149,24 @@ def main(mytimer: func.TimerRequest, outputBlob: func.Out[func.InputStream]) ->
     if mytimer.past_due:
         logging.info('The timer is past due!')
 
-    client = AzureDevopsClientManager(adoOrg, adoProject, repos.split(','), teamId, patToken.value, aliasDict)
-    dataframe = client.aggregatePullRequestActivity(groupByColumns)
-    outputBlob.set(dataframe.to_csv(index=True))
+    instrumentation = MetricsInstrumentation() if settings['metricsFormat'] else None
+    client = _client(settings, patToken.value, instrumentation)
+
+    if settings['outputFormat'] == "parquet":
+        # only the partitions whose rows changed since the last run are rewritten
+        store = ParquetReportStore(settings['parquetOutputDirectory'], client.ReportSchema())
+        events = client.collectPullRequestActivity()
+
+        if settings['parquetIncludeEvents']:
+            store.write('events', events)
+
+        store.write('aggregates', client.aggregateEvents(events, groupByColumns))
+    elif settings['streamingAggregation'] and isinstance(client, AzureDevopsClientManager):
+        outputBlob.set(client.aggregatePullRequestActivityStreaming(groupByColumns).to_csv(index=True))
+    else:
+        outputBlob.set(client.aggregatePullRequestActivity(groupByColumns).to_csv(index=True))
+
+    if instrumentation is not None:
+        metricsBlob.set(instrumentation.export(settings['metricsFormat']))
 
     logging.info('Python timer trigger function ran at %s', utc_timestamp)
@@ -0,0 +1,144 @@
+import asyncio
+import base64
+import datetime
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager
+from typing import AsyncIterator
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import aiohttp
+from requests.exceptions import RetryError
+from requests.structures import CaseInsensitiveDict
+from yarl import URL
+
+from .managers.repo_insights_base import ApiClient
+from .transport import JsonResponse
+
+RETRY_AFTER_STATUS_CODES = {413, 429, 503}
+
+
+@asynccontextmanager
+async def _unlimitedSlot() -> AsyncIterator[None]:
+    yield
+
+
+# asyncio variant of ApiClient. Request building and retry settings come from the wrapped sync client so both
+# transports hit the same endpoints with the same retry/backoff semantics as urllib3's Retry.
+class AsyncApiClient:
+    def __init__(self, apiClient: ApiClient, session: aiohttp.ClientSession):
+        self.apiClient = apiClient
+        self.session = session
+
+    def backoffSeconds(self, retryNumber: int, response: Optional[JsonResponse] = None) -> float:
+        if response is not None and response.status_code in RETRY_AFTER_STATUS_CODES and 'Retry-After' in response.headers:
+            try:
+                return max(float(response.headers['Retry-After']), 0)
+            except ValueError:
+                logging.warning('Ignoring a non numeric Retry-After header: %s', response.headers['Retry-After'])
+
+        # urllib3 retries the first failure immediately and doubles the backoff factor from there on
+        if retryNumber <= 1:
+            return 0
+
+        return self.apiClient.retry_backoff_factor * (2 ** (retryNumber - 1))
+
+    def requestSlot(self) -> AsyncContextManager:
+        # every attempt holds a slot of the limiter, which also holds it back while an adaptive limiter is paused
+        limiter = self.apiClient.concurrencyLimiter
+
+        return limiter.acquireAsync(self.apiClient.baseUrl) if limiter is not None else _unlimitedSlot()
+
+    # pylint: disable=too-many-locals
+    async def _send(self, method: str, resourcePath: str, parameters: Dict[str, str], postBody: Optional[dict] = None, maxAge: datetime.timedelta = None) -> JsonResponse:
+        rawUrl = self.apiClient.uri(resourcePath, parameters)
+        url = URL(rawUrl, encoded=True)
+        cache = self.apiClient.responseCache if method == 'GET' else None
+        cachedEntry = None
+
+        if cache is not None:
+            cachedResponse, cachedEntry = cache.lookup(rawUrl, maxAge)
+
+            if cachedResponse is not None:
+                return cachedResponse
+
+        headers = {'Authorization': 'Basic {}'.format(base64.b64encode(':{}'.format(self.apiClient.patToken).encode('utf-8')).decode('ascii'))}
+        timeout = aiohttp.ClientTimeout(total=self.apiClient.default_timeout)
+
+        if cachedEntry is not None:
+            headers.update(cachedEntry.conditionalHeaders())
+
+        retryNumber = 0
+        retryStatuses: List[Optional[int]] = []
+        started = time.perf_counter()
+        response: Optional[JsonResponse] = None
+        body = b''
+
+        try:
+            while True:
+                response = None
+                body = b''
+                limiter = self.apiClient.concurrencyLimiter
+
+                async with self.requestSlot():
+                    try:
+                        async with self.session.request(method, url, json=postBody, headers=headers, timeout=timeout) as httpResponse:
+                            body = await httpResponse.read()
+                            response = JsonResponse(httpResponse.status, CaseInsensitiveDict(httpResponse.headers), None, body)
+                    except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                        if retryNumber >= self.apiClient.retry_count:
+                            raise
+
+                    # fed back while the request still holds its slot, like the sync client does
+                    if response is not None and limiter is not None:
+                        limiter.observe(self.apiClient.baseUrl, response.status_code, response.headers, [])
+
+                if response is not None and response.status_code not in self.apiClient.retry_status_force_response_codes:
+                    if cache is not None:
+                        if response.status_code == 304 and cachedEntry is not None:
+                            return cache.revalidated(rawUrl, cachedEntry, maxAge)
+
+                        cache.store(rawUrl, response.status_code, response.headers, body, maxAge)
+
+                    return response
+
+                if retryNumber >= self.apiClient.retry_count:
+                    # a request that failed without a response has already re-raised its connection error
+                    raise RetryError("Max retries exceeded for {} with status {}".format(resourcePath, response.status_code if response is not None else None))
+
+                retryNumber += 1
+                retryStatuses.append(response.status_code if response is not None else None)
+                await asyncio.sleep(self.backoffSeconds(retryNumber, response))
+        finally:
+            self.recordRequest(method, started, response, body, postBody, retryStatuses)
+
+    # pylint: disable=too-many-arguments
+    def recordRequest(self, method: str, started: float, response: Optional[JsonResponse], body: bytes, postBody: Optional[dict], retryStatuses: List[Optional[int]]) -> None:
+        if not self.apiClient.instrumentation.enabled:
+            return
+
+        # aiohttp serializes the post body with json.dumps
+        self.apiClient.instrumentation.recordRequest(self.apiClient.baseUrl, method, response.status_code if response is not None else None, time.perf_counter() - started,
+                                                     len(json.dumps(postBody).encode('utf-8')) if postBody is not None else 0, len(body), retryStatuses)
+
+    async def sendGetRequest(self, resourcePath: str, parameters: Dict[str, str], maxAge: datetime.timedelta = None) -> JsonResponse:
+        return await self._send('GET', resourcePath, parameters, maxAge=maxAge)
+
+    async def iterPages(self, resourcePath: str, parameters: Dict[str, str], skipParameter: str = '$skip', topParameter: str = '$top', maxAge: datetime.timedelta = None) -> AsyncIterator[List[dict]]:
+        nextParameters: Optional[Dict[str, str]] = dict(parameters)
+
+        while nextParameters is not None:
+            pageParameters = nextParameters
+            response = await self.sendGetRequest(resourcePath, dict(pageParameters), maxAge)
+            page = response.json(**self.apiClient.pageDecodeOptions)['value']
+
+            yield page
+
+            nextParameters = ApiClient.nextPageParameters(pageParameters, page, response, skipParameter, topParameter)
+
+    async def sendPostRequest(self, resourcePath: str, postBody: dict, parameters: Dict[str, str]) -> JsonResponse:
+        return await self._send('POST', resourcePath, parameters, postBody)
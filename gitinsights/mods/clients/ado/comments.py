@@ -1,15 +1,63 @@
+import datetime
+from typing import Any
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Optional
 
-from dateutil import parser
 from requests import Response
 
+from ...async_client import AsyncApiClient
 from ...managers.repo_insights_base import ApiClient
 from ...managers.repo_insights_base import RepoInsightsManager
+from ...response_cache import IMMUTABLE
+from ...timestamps import parseIsoTimestamp
+from ...timestamps import utcDate
+
+COMMENT_FIELDS = ('author', 'lastUpdatedDate', 'commentType')
+
+
+# Decodes a threads page down to the fields a comment record is built from. The hook sees every object once its
+# members are decoded, so each comment is cut down to its author name, update date and type, each thread to its
+# comments, and the thread contexts, properties, iteration metadata and links are emptied as soon as they are parsed
+# rather than held until the whole page is decoded.
+def _threadFields(document: Dict[str, Any]) -> Any:
+    if 'value' in document:
+        return document
+
+    if 'comments' in document:
+        return {'comments': document['comments']}
+
+    if 'author' in document:
+        return {field: document[field] for field in COMMENT_FIELDS if field in document}
+
+    if 'displayName' in document:
+        return {'displayName': document['displayName']}
+
+    return {}
 
 
 class AdoPullRequestReviewCommentsClient(ApiClient):
+    pageDecodeOptions = {'object_hook': _threadFields}
+
+    def __init__(self, organization: str, baseUrl: str, version: str, patToken: str, reportableFieldDefaults: dict, fromDate: Optional[datetime.datetime] = None, toDate: Optional[datetime.datetime] = None, **kwargs):
+        # reporting window of the comments, by their last update
+        self.fromDate = utcDate(fromDate) if fromDate is not None else None
+        self.toDate = utcDate(toDate) if toDate is not None else None
+        super().__init__(organization, baseUrl, version, patToken, reportableFieldDefaults, **kwargs)
+
+    def InWindow(self, comment: dict) -> bool:
+        if self.fromDate is None and self.toDate is None:
+            return True
+
+        lastUpdated = parseIsoTimestamp(comment['lastUpdatedDate'])
+
+        return (self.fromDate is None or lastUpdated >= self.fromDate) and (self.toDate is None or lastUpdated <= self.toDate)
+
     def getDeserializedDataset(self, **kwargs) -> List[dict]:
+        return list(self.iterDeserializedDataset(**kwargs))
+
+    def iterDeserializedDataset(self, **kwargs) -> Iterator[dict]:
         required_args = {'repo', 'pullRequestId', 'project'}
         RepoInsightsManager.checkRequiredKwargs(required_args, **kwargs)
 
@@ -17,29 +65,49 @@ class AdoPullRequestReviewCommentsClient(ApiClient):
         repo: str = kwargs['repo']
         project: str = kwargs['project']
         uri_parameters: Dict[str, str] = {}
+        resourcePath = self.ResourcePath(project, repo, pullrequestId)
+        # threads of a completed pull request are frozen so a cached copy never needs revalidating
+        maxAge = IMMUTABLE if kwargs.get('immutable') else None
+
+        for page in self.iterPages(lambda pageParameters: self.GetResponse(resourcePath, pageParameters, maxAge), uri_parameters):
+            yield from self.deserialize(self.DeserializeThreads, page, repo)
+
+    async def getDeserializedDatasetAsync(self, asyncClient: AsyncApiClient, **kwargs) -> List[dict]:
+        RepoInsightsManager.checkRequiredKwargs({'repo', 'pullRequestId', 'project'}, **kwargs)
+        repo: str = kwargs['repo']
+        resourcePath = self.ResourcePath(kwargs['project'], repo, kwargs['pullRequestId'])
+        maxAge = IMMUTABLE if kwargs.get('immutable') else None
+        recordList: List[dict] = []
+
+        async for page in asyncClient.iterPages(resourcePath, {}, maxAge=maxAge):
+            recordList += self.deserialize(self.DeserializeThreads, page, repo)
 
-        resourcePath = "{}/{}/_apis/git/repositories/{}/pullrequests/{}/threads".format(self.organization, project, repo, pullrequestId)
-        return self.DeserializeResponse(self.GetResponse(resourcePath, uri_parameters), repo)
+        return recordList
 
-    def GetResponse(self, resourcePath: str, uri_parameters: Dict[str, str]) -> Response:
-        return self.sendGetRequest(resourcePath, uri_parameters)
+    def ResourcePath(self, project: str, repo: str, pullRequestId) -> str:
+        return "{}/{}/_apis/git/repositories/{}/pullrequests/{}/threads".format(self.organization, project, repo, pullRequestId)
+
+    def GetResponse(self, resourcePath: str, uri_parameters: Dict[str, str], maxAge: datetime.timedelta = None) -> Response:
+        return self.sendGetRequest(resourcePath, uri_parameters, maxAge)
 
     def DeserializeResponse(self, response: Response, repo: str) -> List[dict]:
+        return self.DeserializeThreads(response.json(**self.pageDecodeOptions)['value'], repo)
+
+    def DeserializeThreads(self, jsonResults: List[dict], repo: str) -> List[dict]:
         recordList = []
-        jsonResults = response.json()['value']
 
-        for comments in jsonResults:
-            recordList += self.DeserializeComments(comments['comments'], repo)
+        for thread in jsonResults:
+            recordList += self.DeserializeComments(thread.get('comments', []), repo)
 
         return recordList
 
     def DeserializeComments(self, comments: List[dict], repo: str) -> List[dict]:
         recordList = []
 
-        for comment in filter(lambda c: 'commentType' not in c or c['commentType'] != 'system', comments):
+        for comment in filter(lambda c: ('commentType' not in c or c['commentType'] != 'system') and self.InWindow(c), comments):
             recordList.append({**self.reportableFieldDefaults, **{
                 'contributor': comment['author']['displayName'],
-                'week': parser.parse(comment['lastUpdatedDate']).strftime("%V"),
+                'activity_date': comment['lastUpdatedDate'],
                 'pr_comments': 1,
                 'repo': repo
             }
@@ -1,80 +1,199 @@
+import asyncio
+import datetime
 import logging
+import threading
+from typing import AsyncIterator
 from typing import Dict
 from typing import Iterator
 from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Set
 from typing import Tuple
 
-from dateutil import parser
 from requests import Response
 
+from ...async_client import AsyncApiClient
+from ...identity import IdentityIndex
 from ...managers.repo_insights_base import ApiClient
 from ...managers.repo_insights_base import RepoInsightsManager
+from ...response_cache import IMMUTABLE
+from ...timestamps import utcDate
+
+# commit ids posted to a single commitsbatch request
+COMMITS_BATCH_SIZE = 100
+
+
+def searchCriteriaDate(value: datetime.datetime) -> str:
+    return utcDate(value).strftime('%Y-%m-%dT%H:%M:%SZ')
 
 
 class AdoPullRequestCommitsClient(ApiClient):
-    def __init__(self, organization: str, baseUrl: str, version: str, patToken: str, reportableFieldDefaults: dict):
+    def __init__(self, organization: str, baseUrl: str, version: str, patToken: str, reportableFieldDefaults: dict, fromDate: Optional[datetime.datetime] = None, toDate: Optional[datetime.datetime] = None,
+                 changeCountsByCommitId: bool = False, **kwargs):
         self.commitChangeCounts: Dict[str, dict] = {}
-        super().__init__(organization, baseUrl, version, patToken, reportableFieldDefaults)
+        # reporting window bounding the repo history paged into commitChangeCounts, commits outside of it aren't reported
+        self.fromDate = fromDate
+        self.toDate = toDate
+        # look up change counts for the commits referenced by pull requests instead of paging through the repo history
+        self.changeCountsByCommitId = changeCountsByCommitId
+        # repo histories carried over from a previous run miss the commits pushed since, which are looked up by id
+        self.storedHistoryRepos: Set[str] = set()
+        self._commitChangeCountsLock = threading.Lock()
+        self._asyncCommitChangeCountsLock: Optional[asyncio.Lock] = None
+        super().__init__(organization, baseUrl, version, patToken, reportableFieldDefaults, **kwargs)
 
     @staticmethod
     def ParseRepoCommits(commits: List[dict]) -> Iterator[Tuple[str, dict]]:
         for commit in commits:
             yield commit['commitId'], commit['changeCounts']
 
+    def loadCommitChangeCounts(self, commitChangeCounts: Dict[str, dict]) -> None:
+        self.commitChangeCounts = commitChangeCounts
+        self.storedHistoryRepos = set(commitChangeCounts)
+
     def getDeserializedDataset(self, **kwargs) -> List[dict]:
+        return list(self.iterDeserializedDataset(**kwargs))
+
+    def iterDeserializedDataset(self, **kwargs) -> Iterator[dict]:
         required_args = {'repo', 'entitlements', 'pullRequestId', 'project'}
         RepoInsightsManager.checkRequiredKwargs(required_args, **kwargs)
 
         pullrequestId: str = kwargs['pullRequestId']
-        entitlements: Dict[str, str] = kwargs['entitlements']
+        # the index is built once per run by the manager, a plain entitlements mapping is indexed once per call
+        entitlements = IdentityIndex.of(kwargs['entitlements'])
         repo: str = kwargs['repo']
         project: str = kwargs['project']
         uri_parameters: Dict[str, str] = {}
+        resourcePath = self.CommitsByPrResourcePath(project, repo, pullrequestId)
+        # a completed pull request can't receive new commits so a cached copy never needs revalidating
+        maxAge = IMMUTABLE if kwargs.get('immutable') else None
 
-        commitsByPrResourcePath = "{}/{}/_apis/git/repositories/{}/pullrequests/{}/commits".format(self.organization, project, repo, pullrequestId)
+        for page in self.iterPages(lambda pageParameters: self.GetCommitsByPrResponse(resourcePath, pageParameters, maxAge), uri_parameters):
+            yield from self.deserialize(self.ParsePrCommits, page, self.RepoCommitChangeCounts(repo, project, self.PrCommitIds(page)), repo, entitlements)
 
-        return self.DeserializeResponse(self.GetCommitsByPrResponse(commitsByPrResourcePath, uri_parameters), repo, project, entitlements)
+    async def getDeserializedDatasetAsync(self, asyncClient: AsyncApiClient, **kwargs) -> List[dict]:
+        RepoInsightsManager.checkRequiredKwargs({'repo', 'entitlements', 'pullRequestId', 'project'}, **kwargs)
+        repo: str = kwargs['repo']
+        project: str = kwargs['project']
+        entitlements = IdentityIndex.of(kwargs['entitlements'])
+        recordList: List[dict] = []
 
-    def GetCommitsByPrResponse(self, resourcePath: str, uri_parameters: Dict[str, str]) -> Response:
-        return self.sendGetRequest(resourcePath, uri_parameters)
+        async for page in asyncClient.iterPages(self.CommitsByPrResourcePath(project, repo, kwargs['pullRequestId']), {}, maxAge=IMMUTABLE if kwargs.get('immutable') else None):
+            repoCommitChangeCounts = await self.RepoCommitChangeCountsAsync(asyncClient, repo, project, self.PrCommitIds(page))
+            recordList += self.deserialize(self.ParsePrCommits, page, repoCommitChangeCounts, repo, entitlements)
+
+        return recordList
+
+    def CommitsByPrResourcePath(self, project: str, repo: str, pullRequestId) -> str:
+        return "{}/{}/_apis/git/repositories/{}/pullrequests/{}/commits".format(self.organization, project, repo, pullRequestId)
+
+    def CommitsByRepoResourcePath(self, project: str, repo: str) -> str:
+        return "{}/{}/_apis/git/repositories/{}/commits".format(self.organization, project, repo)
+
+    def CommitsBatchResourcePath(self, project: str, repo: str) -> str:
+        return "{}/{}/_apis/git/repositories/{}/commitsbatch".format(self.organization, project, repo)
+
+    def GetCommitsByPrResponse(self, resourcePath: str, uri_parameters: Dict[str, str], maxAge: datetime.timedelta = None) -> Response:
+        return self.sendGetRequest(resourcePath, uri_parameters, maxAge)
 
     def GetCommitsByRepoResponse(self, resourcePath: str, uri_parameters: Dict[str, str]) -> Response:
         return self.sendGetRequest(resourcePath, uri_parameters)
 
-    def DeserializeResponse(self, response: Response, repo: str, project: str, entitlements: Dict[str, str]) -> List[dict]:
-        recordList = []
+    def PostCommitsBatchResponse(self, resourcePath: str, json: dict, uri_parameters: Dict[str, str]) -> Response:
+        return self.sendPostRequest(resourcePath, json, uri_parameters)
+
+    @staticmethod
+    def PrCommitIds(commits: List[dict]) -> List[str]:
+        return [commit['commitId'] for commit in commits if 'commitId' in commit]
+
+    def _lookupMissingCommitIds(self, repo: str, project: str, commitIds: List[str], fromDate: Optional[datetime.datetime] = None, toDate: Optional[datetime.datetime] = None) -> Dict[str, dict]:
+        with self._commitChangeCountsLock:
+            missingIds = [c for c in commitIds if c not in self.commitChangeCounts.setdefault(repo, {})]
+
+        if missingIds:
+            fetched = self.getCommitChangeCountsByIds(repo, project, missingIds, fromDate, toDate)
+
+            with self._commitChangeCountsLock:
+                self.commitChangeCounts[repo].update(fetched)
+
+        return self.commitChangeCounts[repo]
+
+    def RepoCommitChangeCounts(self, repo: str, project: str, commitIds: List[str]) -> Dict[str, dict]:
+        if self.changeCountsByCommitId:
+            return self._lookupMissingCommitIds(repo, project, commitIds)
+
+        # pre-load the commits by repo, guarded so concurrent PR workers only page through the repo history once
+        with self._commitChangeCountsLock:
+            if repo not in self.commitChangeCounts:
+                self.commitChangeCounts[repo] = self.getAllCommitsByRepo(repo, project)
+
+            if repo not in self.storedHistoryRepos:
+                return self.commitChangeCounts[repo]
+
+        # the reporting window bounds the looked up commits the same way it bounds the paged repo history
+        return self._lookupMissingCommitIds(repo, project, commitIds, self.fromDate, self.toDate)
+
+    async def _lookupMissingCommitIdsAsync(self, asyncClient: AsyncApiClient, repo: str, project: str, commitIds: List[str], fromDate: Optional[datetime.datetime] = None,
+                                           toDate: Optional[datetime.datetime] = None) -> Dict[str, dict]:
+        missingIds = [c for c in commitIds if c not in self.commitChangeCounts.setdefault(repo, {})]
+
+        if missingIds:
+            self.commitChangeCounts[repo].update(await self.getCommitChangeCountsByIdsAsync(asyncClient, repo, project, missingIds, fromDate, toDate))
+
+        return self.commitChangeCounts[repo]
+
+    async def RepoCommitChangeCountsAsync(self, asyncClient: AsyncApiClient, repo: str, project: str, commitIds: List[str]) -> Dict[str, dict]:
+        if self.changeCountsByCommitId:
+            return await self._lookupMissingCommitIdsAsync(asyncClient, repo, project, commitIds)
+
+        # the lock is created lazily so it binds to the running event loop
+        if self._asyncCommitChangeCountsLock is None:
+            self._asyncCommitChangeCountsLock = asyncio.Lock()
+
+        async with self._asyncCommitChangeCountsLock:
+            if repo not in self.commitChangeCounts:
+                self.commitChangeCounts[repo] = await self.getAllCommitsByRepoAsync(asyncClient, repo, project)
+
+            if repo not in self.storedHistoryRepos:
+                return self.commitChangeCounts[repo]
+
+        return await self._lookupMissingCommitIdsAsync(asyncClient, repo, project, commitIds, self.fromDate, self.toDate)
+
+    def DeserializeResponse(self, response: Response, repo: str, project: str, entitlements: Mapping[str, str]) -> List[dict]:
         jsonResults = response.json()['value']
 
-        # pre-load the commits by repo
-        if repo not in self.commitChangeCounts:
-            self.commitChangeCounts[repo] = self.getAllCommitsByRepo(repo, project)
+        return self.ParsePrCommits(jsonResults, self.RepoCommitChangeCounts(repo, project, self.PrCommitIds(jsonResults)), repo, entitlements)
 
-        repoCommitChangeCounts = self.commitChangeCounts[repo]
-        contributor: str
+    def ParsePrCommits(self, jsonResults: List[dict], repoCommitChangeCounts: Dict[str, dict], repo: str, entitlements: Mapping[str, str]) -> List[dict]:
+        recordList = []
+        identities = IdentityIndex.of(entitlements)
+        contributor: Optional[str]
 
-        if len(repoCommitChangeCounts) == 0:
+        # an empty lookup is only suspicious when the entire repo history was paged through
+        if len(repoCommitChangeCounts) == 0 and not self.changeCountsByCommitId and self.fromDate is None and self.toDate is None:
             raise ValueError('Repo commit change counts are empty')
 
         for commit in filter(lambda c: 'commitId' in c and c['commitId'] in repoCommitChangeCounts, jsonResults):
             # If the author doesn't have their email configured within their local git profile
             if 'email' not in commit['author']:
                 # search by author displayname
-                authorAlias = {v: k for k, v in entitlements.items()}[commit['author']['name']].lower()
+                authorAlias = commit['author']['name']
+                contributor = identities.contributorByName(authorAlias)
             else:
                 authorAlias = commit['author']['email'].lower()
+                contributor = identities.contributorByEmail(authorAlias)
 
             # If the alias cannot be located in the registry then skip the commits from being included and ask the engineer to setup their local profile using their microsoft email.
-            if authorAlias not in entitlements:
+            if contributor is None:
                 logging.warning('Alias %s for commit %s has not contributed directly to any previous pull requests and cannot be found. Please configure the profileAliases setting with this commit email address.', authorAlias, commit['commitId'])
                 contributor = authorAlias
-            else:
-                contributor = entitlements[authorAlias]
 
             recordList.append(
                 {
                     **self.reportableFieldDefaults, **{
                         'contributor': contributor,
-                        'week': parser.parse(commit['author']['date']).strftime("%V"),
+                        'activity_date': commit['author']['date'],
                         'pr_commits_pushed': 1,
                         'commit_change_count_edits': repoCommitChangeCounts[commit['commitId']]['Edit'],
                         'commit_change_count_deletes': repoCommitChangeCounts[commit['commitId']]['Delete'],
@@ -84,21 +203,83 @@ class AdoPullRequestCommitsClient(ApiClient):
 
         return recordList
 
-    def getAllCommitsByRepo(self, repo: str, project: str, topRecords: int = 400) -> Dict[str, dict]:
-        new_results = True
-        commitChangeCountDictionary: Dict[str, dict] = {}
+    @staticmethod
+    def CommitsByRepoUriParameters(topRecords: int, fromDate: Optional[datetime.datetime] = None, toDate: Optional[datetime.datetime] = None) -> Dict[str, str]:
         uri_parameters: Dict[str, str] = {}
         uri_parameters['searchCriteria.$skip'] = '0'
         uri_parameters['searchCriteria.$top'] = str(topRecords)
 
-        commitsByRepoResourcePath = "{}/{}/_apis/git/repositories/{}/commits".format(self.organization, project, repo)
-        page_count = 1
+        if fromDate is not None:
+            uri_parameters['searchCriteria.fromDate'] = searchCriteriaDate(fromDate)
+
+        if toDate is not None:
+            uri_parameters['searchCriteria.toDate'] = searchCriteriaDate(toDate)
+
+        return uri_parameters
+
+    @staticmethod
+    def CommitIdBatches(commitIds: List[str], batchSize: int = COMMITS_BATCH_SIZE) -> List[List[str]]:
+        return [commitIds[i:i + batchSize] for i in range(0, len(commitIds), batchSize)]
+
+    @staticmethod
+    def CommitsBatchBody(commitIds: List[str], fromDate: Optional[datetime.datetime] = None, toDate: Optional[datetime.datetime] = None) -> dict:
+        body: dict = {'ids': commitIds}
+
+        if fromDate is not None:
+            body['fromDate'] = searchCriteriaDate(fromDate)
+
+        if toDate is not None:
+            body['toDate'] = searchCriteriaDate(toDate)
+
+        return body
+
+    @staticmethod
+    def CommitsBatchUriParameters(commitIds: List[str]) -> Dict[str, str]:
+        uri_parameters: Dict[str, str] = {}
+        uri_parameters['$top'] = str(len(commitIds))
+
+        return uri_parameters
+
+    def getCommitChangeCountsByIds(self, repo: str, project: str, commitIds: List[str], fromDate: Optional[datetime.datetime] = None, toDate: Optional[datetime.datetime] = None) -> Dict[str, dict]:
+        commitChangeCountDictionary: Dict[str, dict] = {}
+
+        for batch in AdoPullRequestCommitsClient.CommitIdBatches(commitIds):
+            response = self.PostCommitsBatchResponse(self.CommitsBatchResourcePath(project, repo), AdoPullRequestCommitsClient.CommitsBatchBody(batch, fromDate, toDate),
+                                                     AdoPullRequestCommitsClient.CommitsBatchUriParameters(batch)).json()['value']
+            commitChangeCountDictionary.update(AdoPullRequestCommitsClient.ParseRepoCommits(response))
+
+        return commitChangeCountDictionary
 
-        while new_results:
-            response = self.GetCommitsByRepoResponse(commitsByRepoResourcePath, uri_parameters).json()['value']
-            commitChangeCountDictionary = {**dict(AdoPullRequestCommitsClient.ParseRepoCommits(response)), **commitChangeCountDictionary}
-            new_results = len(response) == topRecords
-            page_count += 1
-            uri_parameters['searchCriteria.$skip'] = str(topRecords * page_count)
+    async def getCommitChangeCountsByIdsAsync(self, asyncClient: AsyncApiClient, repo: str, project: str, commitIds: List[str], fromDate: Optional[datetime.datetime] = None,
+                                              toDate: Optional[datetime.datetime] = None) -> Dict[str, dict]:
+        commitChangeCountDictionary: Dict[str, dict] = {}
+        responses = await asyncio.gather(*(asyncClient.sendPostRequest(self.CommitsBatchResourcePath(project, repo), AdoPullRequestCommitsClient.CommitsBatchBody(batch, fromDate, toDate),
+                                                                       AdoPullRequestCommitsClient.CommitsBatchUriParameters(batch))
+                                           for batch in AdoPullRequestCommitsClient.CommitIdBatches(commitIds)))
+
+        for response in responses:
+            commitChangeCountDictionary.update(AdoPullRequestCommitsClient.ParseRepoCommits(response.json()['value']))
 
         return commitChangeCountDictionary
+
+    def getAllCommitsByRepo(self, repo: str, project: str, topRecords: int = 400, fromDate: Optional[datetime.datetime] = None, toDate: Optional[datetime.datetime] = None) -> Dict[str, dict]:
+        return dict(self.iterCommitsByRepo(repo, project, topRecords, fromDate, toDate))
+
+    def iterCommitsByRepo(self, repo: str, project: str, topRecords: int = 400, fromDate: Optional[datetime.datetime] = None, toDate: Optional[datetime.datetime] = None) -> Iterator[Tuple[str, dict]]:
+        uri_parameters = AdoPullRequestCommitsClient.CommitsByRepoUriParameters(topRecords, fromDate or self.fromDate, toDate or self.toDate)
+        commitsByRepoResourcePath = self.CommitsByRepoResourcePath(project, repo)
+
+        for page in self.iterPages(lambda pageParameters: self.GetCommitsByRepoResponse(commitsByRepoResourcePath, pageParameters), uri_parameters, 'searchCriteria.$skip', 'searchCriteria.$top'):
+            yield from AdoPullRequestCommitsClient.ParseRepoCommits(page)
+
+    async def getAllCommitsByRepoAsync(self, asyncClient: AsyncApiClient, repo: str, project: str, topRecords: int = 400, fromDate: Optional[datetime.datetime] = None,
+                                       toDate: Optional[datetime.datetime] = None) -> Dict[str, dict]:
+        return {commitId: changeCounts async for commitId, changeCounts in self.iterCommitsByRepoAsync(asyncClient, repo, project, topRecords, fromDate, toDate)}
+
+    async def iterCommitsByRepoAsync(self, asyncClient: AsyncApiClient, repo: str, project: str, topRecords: int = 400, fromDate: Optional[datetime.datetime] = None,
+                                     toDate: Optional[datetime.datetime] = None) -> AsyncIterator[Tuple[str, dict]]:
+        uri_parameters = AdoPullRequestCommitsClient.CommitsByRepoUriParameters(topRecords, fromDate or self.fromDate, toDate or self.toDate)
+
+        async for page in asyncClient.iterPages(self.CommitsByRepoResourcePath(project, repo), uri_parameters, 'searchCriteria.$skip', 'searchCriteria.$top'):
+            for commit in AdoPullRequestCommitsClient.ParseRepoCommits(page):
+                yield commit
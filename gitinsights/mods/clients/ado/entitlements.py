@@ -1,27 +1,71 @@
+from typing import AbstractSet
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Tuple
 
 from requests import Response
 
+from ...async_client import AsyncApiClient
 from ...managers.repo_insights_base import ApiClient
 
+# The org profiles can be narrowed down to the members of the configured project or team
+ENTITLEMENTS_SCOPES = ('org', 'project', 'team')
+
 
 # We need to fetch the org profiles to account for local git profile <> ADO profile discrepencies
 class AdoGetOrgEntitlementsClient(ApiClient):
-    # pylint: disable=unused-argument
     def getDeserializedDataset(self, **kwargs) -> List[dict]:
-        uri_parameters: Dict[str, str] = {}
+        return [dict(self.iterDeserializedDataset(**kwargs))]
+
+    def iterDeserializedDataset(self, **kwargs) -> Iterator[Tuple[str, str]]:
+        principalNames: Optional[AbstractSet[str]] = kwargs.get('principalNames')
+
+        # the graph API pages users by continuation token, each page is resolved before the next one is requested
+        for page in self.iterPages(lambda pageParameters: self.GetResponse(self.ResourcePath(), pageParameters), self.UriParameters(kwargs.get('scopeDescriptor'))):
+            yield from self.deserialize(AdoGetOrgEntitlementsClient.DeserializeProfiles, page, principalNames).items()
+
+    async def getDeserializedDatasetAsync(self, asyncClient: AsyncApiClient, **kwargs) -> List[dict]:
+        entitlements: Dict[str, str] = {}
+
+        async for page in asyncClient.iterPages(self.ResourcePath(), self.UriParameters(kwargs.get('scopeDescriptor'))):
+            entitlements.update(self.deserialize(AdoGetOrgEntitlementsClient.DeserializeProfiles, page, kwargs.get('principalNames')))
+
+        return [entitlements]
+
+    def getScopeDescriptor(self, storageKey: str) -> str:
+        return self.GetResponse(self.DescriptorResourcePath(storageKey), {}).json()['value']
+
+    async def getScopeDescriptorAsync(self, asyncClient: AsyncApiClient, storageKey: str) -> str:
+        return (await asyncClient.sendGetRequest(self.DescriptorResourcePath(storageKey), {})).json()['value']
 
-        resourcePath = "{}/_apis/graph/users".format(self.organization)
-        return [AdoGetOrgEntitlementsClient.DeserializeResponse(self.GetResponse(resourcePath, uri_parameters))]
+    def ResourcePath(self) -> str:
+        return "{}/_apis/graph/users".format(self.organization)
+
+    def DescriptorResourcePath(self, storageKey: str) -> str:
+        return "{}/_apis/graph/descriptors/{}".format(self.organization, storageKey)
+
+    @staticmethod
+    def UriParameters(scopeDescriptor: Optional[str] = None) -> Dict[str, str]:
+        # only aad profiles are kept, filtering them server side trims the pages of large tenants
+        uri_parameters: Dict[str, str] = {'subjectTypes': 'aad'}
+
+        if scopeDescriptor is not None:
+            uri_parameters['scopeDescriptor'] = scopeDescriptor
+
+        return uri_parameters
 
     def GetResponse(self, resourcePath: str, uri_parameters: Dict[str, str]) -> Response:
         return self.sendGetRequest(resourcePath, uri_parameters)
 
     @staticmethod
     def DeserializeResponse(response: Response) -> Dict[str, str]:
-        jsonResults = response.json()['value']
+        return AdoGetOrgEntitlementsClient.DeserializeProfiles(response.json()['value'])
+
+    @staticmethod
+    def DeserializeProfiles(jsonResults: List[dict], principalNames: AbstractSet[str] = None) -> Dict[str, str]:
+        profiles = [profile for profile in jsonResults if profile['origin'] == 'aad' and (principalNames is None or profile['principalName'].lower() in principalNames)]
 
-        return {
-            profile['principalName'].lower(): profile['displayName'] for profile in jsonResults if profile['origin'] == 'aad'
-        }
+        # commit authors are matched on either the principal name or the mail address of a profile
+        return {email.lower(): profile['displayName'] for profile in profiles for email in (profile['principalName'], profile.get('mailAddress')) if email}
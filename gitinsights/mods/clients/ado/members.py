@@ -0,0 +1,59 @@
+from typing import AsyncIterator
+from typing import Dict
+from typing import Iterator
+from typing import List
+
+from requests import Response
+
+from ...async_client import AsyncApiClient
+from ...managers.repo_insights_base import ApiClient
+from ...managers.repo_insights_base import RepoInsightsManager
+
+TEAM_MEMBERS_PAGE_SIZE = '100'
+
+
+# Resolves the project and team the org profiles are scoped to
+class AdoProjectMembersClient(ApiClient):
+    def getDeserializedDataset(self, **kwargs) -> List[dict]:
+        return list(self.iterDeserializedDataset(**kwargs))
+
+    def iterDeserializedDataset(self, **kwargs) -> Iterator[dict]:
+        RepoInsightsManager.checkRequiredKwargs({'project', 'teamId'}, **kwargs)
+        resourcePath = self.TeamMembersResourcePath(kwargs['project'], kwargs['teamId'])
+
+        for page in self.iterPages(lambda uri_parameters: self.GetResponse(resourcePath, uri_parameters), self.UriParameters()):
+            yield from self.deserialize(AdoProjectMembersClient.DeserializeTeamMembers, page)
+
+    async def getDeserializedDatasetAsync(self, asyncClient: AsyncApiClient, **kwargs) -> List[dict]:
+        return [record async for record in self.iterDeserializedDatasetAsync(asyncClient, **kwargs)]
+
+    async def iterDeserializedDatasetAsync(self, asyncClient: AsyncApiClient, **kwargs) -> AsyncIterator[dict]:
+        RepoInsightsManager.checkRequiredKwargs({'project', 'teamId'}, **kwargs)
+
+        async for page in asyncClient.iterPages(self.TeamMembersResourcePath(kwargs['project'], kwargs['teamId']), self.UriParameters()):
+            for record in self.deserialize(AdoProjectMembersClient.DeserializeTeamMembers, page):
+                yield record
+
+    def getProjectId(self, project: str) -> str:
+        return self.GetResponse(self.ProjectResourcePath(project), {}).json()['id']
+
+    async def getProjectIdAsync(self, asyncClient: AsyncApiClient, project: str) -> str:
+        return (await asyncClient.sendGetRequest(self.ProjectResourcePath(project), {})).json()['id']
+
+    def ProjectResourcePath(self, project: str) -> str:
+        return "{}/_apis/projects/{}".format(self.organization, project)
+
+    def TeamMembersResourcePath(self, project: str, teamId: str) -> str:
+        return "{}/_apis/projects/{}/teams/{}/members".format(self.organization, project, teamId)
+
+    @staticmethod
+    def UriParameters() -> Dict[str, str]:
+        return {'$top': TEAM_MEMBERS_PAGE_SIZE}
+
+    def GetResponse(self, resourcePath: str, uri_parameters: Dict[str, str]) -> Response:
+        return self.sendGetRequest(resourcePath, uri_parameters)
+
+    @staticmethod
+    def DeserializeTeamMembers(jsonResults: List[dict]) -> List[dict]:
+        # the unique name of a team member is the principal name of its org profile
+        return [{'principalName': member['identity']['uniqueName'], 'displayName': member['identity']['displayName']} for member in jsonResults if member['identity'].get('uniqueName')]
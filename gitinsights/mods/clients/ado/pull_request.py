@@ -1,13 +1,18 @@
+import datetime
 from enum import Enum
+from typing import AsyncIterator
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Optional
 
 import numpy as np
-from dateutil import parser
 from requests import Response
 
+from ...async_client import AsyncApiClient
 from ...managers.repo_insights_base import ApiClient
 from ...managers.repo_insights_base import RepoInsightsManager
+from ...timestamps import parseIsoTimestamp
 
 
 class PullRequestVoteStatus(Enum):
@@ -17,17 +22,38 @@ class PullRequestVoteStatus(Enum):
 
 class AdoPullRequestsClient(ApiClient):
     def getDeserializedDataset(self, **kwargs) -> List[dict]:
-        required_args = {'repo', 'project'}
-        RepoInsightsManager.checkRequiredKwargs(required_args, **kwargs)
+        return list(self.iterDeserializedDataset(**kwargs))
 
+    def iterDeserializedDataset(self, **kwargs) -> Iterator[dict]:
+        RepoInsightsManager.checkRequiredKwargs({'repo', 'project'}, **kwargs)
         repo = kwargs['repo']
-        project = kwargs['project']
+        resourcePath = self.ResourcePath(kwargs['project'], repo)
+        changedSince: Optional[datetime.datetime] = kwargs.get('changedSince')
+
+        for page in self.iterPages(lambda uri_parameters: self.GetResponse(resourcePath, uri_parameters), self.UriParameters()):
+            yield from self.deserialize(self.DeserializePullRequests, page, repo, changedSince)
+
+    async def getDeserializedDatasetAsync(self, asyncClient: AsyncApiClient, **kwargs) -> List[dict]:
+        return [record async for record in self.iterDeserializedDatasetAsync(asyncClient, **kwargs)]
+
+    async def iterDeserializedDatasetAsync(self, asyncClient: AsyncApiClient, **kwargs) -> AsyncIterator[dict]:
+        RepoInsightsManager.checkRequiredKwargs({'repo', 'project'}, **kwargs)
+        repo = kwargs['repo']
+
+        async for page in asyncClient.iterPages(self.ResourcePath(kwargs['project'], repo), self.UriParameters()):
+            for record in self.deserialize(self.DeserializePullRequests, page, repo, kwargs.get('changedSince')):
+                yield record
+
+    def ResourcePath(self, project: str, repo: str) -> str:
+        return "{}/{}/_apis/git/repositories/{}/pullrequests".format(self.organization, project, repo)
+
+    @staticmethod
+    def UriParameters() -> Dict[str, str]:
         uri_parameters: Dict[str, str] = {}
         uri_parameters['searchCriteria.status'] = 'all'
         uri_parameters['$top'] = '1000'
 
-        resourcePath = "{}/{}/_apis/git/repositories/{}/pullrequests".format(self.organization, project, repo)
-        return self.DeserializeResponse(self.GetResponse(resourcePath, uri_parameters), repo)
+        return uri_parameters
 
     def GetResponse(self, resourcePath: str, uri_parameters: Dict[str, str]) -> Response:
         return self.sendGetRequest(resourcePath, uri_parameters)
@@ -38,30 +64,41 @@ class AdoPullRequestsClient(ApiClient):
                     'contributor': pullrequest['createdBy']['displayName'],
                     'prs_submitted': 1,
                     'prs_merged': 1 if pullrequest['status'] == 'completed' else 0,
-                    'week': parser.parse(pullrequest['creationDate']).strftime("%V"),
-                    'creation_datetime': parser.parse(pullrequest['creationDate']),
-                    'completion_date': parser.parse(pullrequest['closedDate']) if pullrequest['status'] == 'completed' else np.nan,
-                    'pr_completion_days': RepoInsightsManager.dateStrDiffInDays(pullrequest['closedDate'], pullrequest['creationDate']) if pullrequest['status'] == 'completed' else np.nan,
+                    # dates stay raw ISO 8601 strings, the week and completion days are derived in bulk from these
+                    'activity_date': pullrequest['creationDate'],
+                    'creation_datetime': pullrequest['creationDate'],
+                    'completion_date': pullrequest['closedDate'] if pullrequest['status'] == 'completed' else np.nan,
                     'repo': repo,
                     'pullRequestId': pullrequest['pullRequestId'],
                     'repoId': pullrequest['repository']['id']
                 },
                 }
 
-    def DeserializeResponse(self, response: Response, repo: str) -> List[dict]:
+    @staticmethod
+    def ChangedSince(pullrequest: dict, changedSince: datetime.datetime) -> bool:
+        # active pull requests can pick up new commits, votes and comments at any point
+        return pullrequest['status'] == 'active' \
+            or parseIsoTimestamp(pullrequest['creationDate']) >= changedSince \
+            or ('closedDate' in pullrequest and parseIsoTimestamp(pullrequest['closedDate']) >= changedSince)
+
+    def DeserializeResponse(self, response: Response, repo: str, changedSince: Optional[datetime.datetime] = None) -> List[dict]:
+        return self.DeserializePullRequests(response.json()['value'], repo, changedSince)
+
+    def DeserializePullRequests(self, jsonResults: List[dict], repo: str, changedSince: Optional[datetime.datetime] = None) -> List[dict]:
         recordList = []
-        jsonResults = response.json()['value']
 
-        for pr in jsonResults:
+        for pr in jsonResults if changedSince is None else [pr for pr in jsonResults if AdoPullRequestsClient.ChangedSince(pr, changedSince)]:
             recordList.append(self.DeserializePullRequest(pr, repo))
 
             for review in filter(lambda rv: rv['vote'] in [PullRequestVoteStatus.APPROVED.value, PullRequestVoteStatus.APPROVED_WITH_SUGGESTIONS.value] and 'isContainer' not in rv, pr['reviewers']):
                 recordList.append(
                     {**self.reportableFieldDefaults, **{
                         'contributor': review['displayName'],
-                        'week': parser.parse(pr['creationDate']).strftime("%V"),
+                        'activity_date': pr['creationDate'],
                         'prs_reviewed': 1,
-                        'repo': repo
+                        'repo': repo,
+                        'pullRequestId': pr['pullRequestId'],
+                        'repoId': pr['repository']['id']
                     }})
 
         return recordList
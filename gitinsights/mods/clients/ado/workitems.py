@@ -1,138 +1,344 @@
+import asyncio
+import datetime
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Awaitable
+from typing import Callable
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Mapping
 from typing import Optional
+from typing import Tuple
+from typing import TypeVar
 
 import numpy as np
-from dateutil import parser
 from requests import Response
 
+from ...async_client import AsyncApiClient
 from ...managers.repo_insights_base import ApiClient
 from ...managers.repo_insights_base import RepoInsightsManager
+from ...pull_request_index import PullRequestIndex
+from ...timestamps import utcDate
+
+# Work items in these states are unlikely to change again so their details are served from the response cache, for as
+# long as their revision is still the current one
+CLOSED_WORKITEM_STATES = {'Closed', 'Resolved', 'Done'}
+WORKITEM_BATCH_SIZE = 200
+# WIQL refuses queries matching more ids than this, queries that reach it are split into created date shards
+WIQL_RESULT_CAP = 20000
+# No work item predates the service, so the created date shards of an open ended window start here
+WIQL_EPOCH = datetime.datetime(2005, 1, 1, tzinfo=datetime.timezone.utc)
+MIN_SHARD_SPAN = datetime.timedelta(minutes=1)
+
+# Posts a WIQL query and returns the matching work item references
+WiqlQueryRunner = Callable[[str], List[dict]]
+# Work item ids, or the work items themselves, batched by WorkitemIdBatches
+BatchItem = TypeVar('BatchItem')
+
+
+def wiqlDate(value: datetime.datetime) -> str:
+    return utcDate(value).strftime('%Y-%m-%dT%H:%M:%SZ')
 
 
 class AdoGetProjectWorkItemsClient(ApiClient):
-    def _dateDiffBetweenPrSubmissionAndStoryActivation(self, workitem: dict, repo: str, pullRequestSubmitters: Dict[str, Dict[int, str]]) -> Optional[Dict]:
-        # Filter for pull requests linked to the workitem
-        activatedDate = parser.parse(workitem['fields']['Microsoft.VSTS.Common.ActivatedDate'])
-        relationLinkDelimitter = "%2f"
-        initialPR: dict = {}
-        linkedPullRequests = list(filter(lambda relation: relation['rel'] == "ArtifactLink"
-                                         and {"resourceCreatedDate", "name"} <= relation['attributes'].keys()
-                                         and {"url"} <= relation.keys()
-                                         and relation['attributes']['name'] == 'Pull Request'
-                                         and parser.parse(relation['attributes']['resourceCreatedDate']) >= activatedDate,
-                                         workitem['relations'] if 'relations' in workitem else []))
-
-        for pr in linkedPullRequests:
-            if not bool(initialPR) or parser.parse(initialPR['attributes']['resourceCreatedDate']) > parser.parse(pr['attributes']['resourceCreatedDate']):
-                initialPR = pr
-
-        if bool(initialPR):
-            # Get the earliest submission date for workitems linked to multiple PRs
-            prLinkSplitArray = initialPR['url'].lower().split(relationLinkDelimitter)
-
-            if len(prLinkSplitArray) != 3:
-                raise ValueError("The URL for the submitted PR seems to be malformed as the expected format is vstfs:///Git/PullRequestId/%2F=[ProjectId]%2F=[RepoId]%2F=[PullRequestId]")
-
-            prId = int(prLinkSplitArray[2])
-            repoId = prLinkSplitArray[1]
-
-            if repoId not in pullRequestSubmitters:
-                raise ValueError("Linked Pull Request has an invalid repo ID reference: {}".format(repoId))
-
-            if prId not in pullRequestSubmitters[repoId]:
-                raise ValueError("Linked Pull Request has an invalid identifier: {}".format(prId))
-
-            prSubmissionDate = parser.parse(initialPR['attributes']['resourceCreatedDate'])
-            timeDelta = divmod((prSubmissionDate - activatedDate).total_seconds(), 60)[0] / 60 / 24
-
-            return {**self.reportableFieldDefaults, **{
-                    'contributor': pullRequestSubmitters[repoId][prId],
-                    'week': prSubmissionDate.strftime("%V"),
-                    'user_story_initial_pr_submission_days': timeDelta,
-                    'repo': repo
-                    }}
-
-        return None
+    # pylint: disable=too-many-arguments
+    def __init__(self, organization: str, baseUrl: str, version: str, patToken: str, reportableFieldDefaults: dict, maxConcurrentBatches: int = 4, workItemTypes: List[str] = None,
+                 fromDate: Optional[datetime.datetime] = None, toDate: Optional[datetime.datetime] = None, wiqlResultCap: int = WIQL_RESULT_CAP, **kwargs):
+        if maxConcurrentBatches < 1:
+            raise ValueError('maxConcurrentBatches must be a positive integer')
+
+        # work item detail batches in flight at once, on top of the per host limit shared with the other clients
+        self.maxConcurrentBatches = maxConcurrentBatches
+        self.workItemTypes = workItemTypes or ['User Story']
+        # reporting window, only work items changed after fromDate and created before toDate are queried
+        self.fromDate = fromDate
+        self.toDate = toDate
+        self.wiqlResultCap = wiqlResultCap
+        super().__init__(organization, baseUrl, version, patToken, reportableFieldDefaults, **kwargs)
+
+    def InitialPullRequestRecords(self, repo: str, activatedWorkitems: List[dict], pullRequestIndex: PullRequestIndex) -> List[dict]:
+        initialPullRequests, unresolvedLinks = pullRequestIndex.initialPullRequests(activatedWorkitems)
+
+        if any(unresolvedLinks.values()):
+            # links to pull requests outside of the collected repos are expected, they're reported instead of raised
+            logging.warning('Skipped unresolved work item links to pull requests: %s', unresolvedLinks)
+
+            for reason, count in unresolvedLinks.items():
+                self.instrumentation.recordUnresolvedLinks(reason, count)
+
+        # the submission delay and week are derived in bulk from the raw dates
+        return [{**self.reportableFieldDefaults, **{
+                'contributor': link.contributor,
+                'activity_date': link.pr_submission_date,
+                'activated_date': link.activated_date,
+                'pr_submission_date': link.pr_submission_date,
+                'repo': repo,
+                'workItemId': link.workItemId
+                }} for link in initialPullRequests.itertuples(index=False)]
 
     def getDeserializedDataset(self, **kwargs) -> List[dict]:
+        return list(self.iterDeserializedDataset(**kwargs))
+
+    def iterDeserializedDataset(self, **kwargs) -> Iterator[dict]:
         required_args = {'teamId', 'project', 'repo', 'pullRequestSubmitters'}
         RepoInsightsManager.checkRequiredKwargs(required_args, **kwargs)
 
-        wiQLQuery = "Select [System.Id] From WorkItems Where [System.WorkItemType] = 'User Story' AND [State] <> 'Removed'"
-        uri_parameters: Dict[str, str] = {}
-        uri_parameters['api-version'] = "6.0"
         project: str = kwargs['project']
         teamId: str = kwargs['teamId']
         repo: str = kwargs['repo']
-        pullRequestSubmitters: Dict[str, Dict[int, str]] = kwargs['pullRequestSubmitters']
+        # a plain submitters mapping is indexed once per call, the manager passes the index it builds once per run
+        pullRequestSubmitters = PullRequestIndex.of(kwargs['pullRequestSubmitters'])
+        changedSince: Optional[datetime.datetime] = kwargs.get('changedSince')
+        wiqlResourcePath = self.WiqlResourcePath(project, teamId)
+        workitemIds = self.ShardedWorkitemIds(lambda query: self.PostResponse(wiqlResourcePath, {"query": query}, self.WiqlUriParameters()).json()['workItems'], changedSince)
+        batches = self.WorkitemIdBatches(workitemIds)
+
+        # WIQL only returns ids, the detail batches are fetched concurrently and streamed in WIQL order
+        with ThreadPoolExecutor(max_workers=self.maxConcurrentBatches) if self.maxConcurrentBatches > 1 and len(batches) > 1 else nullcontext() as executor:
+            batchMapper = executor.map if executor is not None else map
+
+            for workitems in batchMapper(lambda batch: self.GetWorkitemBatch(batch, project), batches):
+                yield from self.deserialize(self.ParseWorkitems, repo, workitems, pullRequestSubmitters)
+
+    async def getDeserializedDatasetAsync(self, asyncClient: AsyncApiClient, **kwargs) -> List[dict]:
+        RepoInsightsManager.checkRequiredKwargs({'teamId', 'project', 'repo', 'pullRequestSubmitters'}, **kwargs)
+        project: str = kwargs['project']
 
-        resourcePath = "{}/{}/{}/_apis/wit/wiql".format(self.organization, project, teamId)
-        return self.DeserializeResponse(self.PostResponse(resourcePath, {"query": wiQLQuery}, uri_parameters), project, repo, pullRequestSubmitters)
+        changedSince: Optional[datetime.datetime] = kwargs.get('changedSince')
+        wiqlResourcePath = self.WiqlResourcePath(project, kwargs['teamId'])
 
-    def GetResponse(self, resourcePath: str, uri_parameters: Dict[str, str]) -> Response:
-        return self.sendGetRequest(resourcePath, uri_parameters)
+        async def postQuery(query: str) -> List[dict]:
+            return (await asyncClient.sendPostRequest(wiqlResourcePath, {"query": query}, self.WiqlUriParameters())).json()['workItems']
 
-    def PostResponse(self, resourcePath: str, json: dict, uri_parameters: Dict[str, str]) -> Response:
-        return self.sendPostRequest(resourcePath, json, uri_parameters)
+        workitems = await self.GetWorkitemsAsync(asyncClient, await self.ShardedWorkitemIdsAsync(postQuery, changedSince), project)
 
-    def DeserializeResponse(self, response: Response, project: str, repo: str, pullRequestSubmitters: Dict[str, Dict[int, str]]) -> List[dict]:
-        recordList: List[dict] = []
-        jsonResults = response.json()['workItems']
+        pullRequestSubmitters = PullRequestIndex.of(kwargs['pullRequestSubmitters'])
 
-        recordsProcessed = 0
-        topElements = 200
+        # parsed a batch at a time, like the sync path, so both produce the records in the same order
+        return [record for batch in self.WorkitemIdBatches(workitems) for record in self.deserialize(self.ParseWorkitems, kwargs['repo'], batch, pullRequestSubmitters)]
 
-        while recordsProcessed < len(jsonResults):
-            workitemIds = [str(w['id']) for w in jsonResults[recordsProcessed:topElements+recordsProcessed]]
-            recordList += self.GetWorkitemDetails(workitemIds, project)
-            recordsProcessed += topElements
+    def WiqlQuery(self, changedSince: Optional[datetime.datetime] = None, createdFrom: Optional[datetime.datetime] = None, createdBefore: Optional[datetime.datetime] = None) -> str:
+        workItemTypes = ', '.join("'{}'".format(workItemType.replace("'", "''")) for workItemType in self.workItemTypes)
+        conditions = ["[System.WorkItemType] IN ({})".format(workItemTypes), "[State] <> 'Removed'"]
 
-        return self.ParseWorkitems(repo, recordList, pullRequestSubmitters)
+        if self.fromDate is not None:
+            conditions.append("[System.ChangedDate] >= '{}'".format(wiqlDate(self.fromDate)))
 
-    def GetWorkitemDetails(self, workItemIds: List[str], project: str) -> List[dict]:
-        if len(workItemIds) > 200:
+        if self.toDate is not None:
+            conditions.append("[System.CreatedDate] < '{}'".format(wiqlDate(self.toDate)))
+
+        if changedSince is not None:
+            conditions.append("[System.ChangedDate] > '{}'".format(wiqlDate(changedSince)))
+
+        # shards partition the matching work items by created date, so every work item lands in exactly one of them
+        if createdFrom is not None:
+            conditions.append("[System.CreatedDate] >= '{}'".format(wiqlDate(createdFrom)))
+
+        if createdBefore is not None:
+            conditions.append("[System.CreatedDate] < '{}'".format(wiqlDate(createdBefore)))
+
+        return "Select [System.Id] From WorkItems Where {}".format(' AND '.join(conditions))
+
+    def WiqlUriParameters(self) -> Dict[str, str]:
+        uri_parameters: Dict[str, str] = {}
+        uri_parameters['api-version'] = "6.0"
+        # WIQL compares dates at day precision unless asked otherwise
+        uri_parameters['timePrecision'] = 'true'
+        # a query reaching the cap comes back truncated instead of failing, which is the signal to shard it
+        uri_parameters['$top'] = str(self.wiqlResultCap)
+
+        return uri_parameters
+
+    def SplitShard(self, createdFrom: Optional[datetime.datetime], createdBefore: Optional[datetime.datetime]) -> Tuple[datetime.datetime, datetime.datetime, datetime.datetime]:
+        lower = createdFrom or WIQL_EPOCH
+        upper = createdBefore or utcDate(self.toDate or datetime.datetime.now(datetime.timezone.utc))
+
+        if upper - lower <= MIN_SHARD_SPAN:
+            raise ValueError('More than {} work items were created between {} and {}, narrow down the work item types'.format(self.wiqlResultCap, wiqlDate(lower), wiqlDate(upper)))
+
+        return lower, lower + (upper - lower) / 2, upper
+
+    def ShardedWorkitemIds(self, postQuery: WiqlQueryRunner, changedSince: Optional[datetime.datetime] = None, createdFrom: Optional[datetime.datetime] = None,
+                           createdBefore: Optional[datetime.datetime] = None) -> List[str]:
+        workitems = postQuery(self.WiqlQuery(changedSince, createdFrom, createdBefore))
+
+        if len(workitems) < self.wiqlResultCap:
+            return [str(w['id']) for w in workitems]
+
+        lower, middle, upper = self.SplitShard(createdFrom, createdBefore)
+
+        return self.ShardedWorkitemIds(postQuery, changedSince, lower, middle) + self.ShardedWorkitemIds(postQuery, changedSince, middle, upper)
+
+    async def ShardedWorkitemIdsAsync(self, postQuery: Callable[[str], Awaitable[List[dict]]], changedSince: Optional[datetime.datetime] = None, createdFrom: Optional[datetime.datetime] = None,
+                                      createdBefore: Optional[datetime.datetime] = None) -> List[str]:
+        workitems = await postQuery(self.WiqlQuery(changedSince, createdFrom, createdBefore))
+
+        if len(workitems) < self.wiqlResultCap:
+            return [str(w['id']) for w in workitems]
+
+        lower, middle, upper = self.SplitShard(createdFrom, createdBefore)
+        earlierIds, laterIds = await asyncio.gather(self.ShardedWorkitemIdsAsync(postQuery, changedSince, lower, middle), self.ShardedWorkitemIdsAsync(postQuery, changedSince, middle, upper))
+
+        return earlierIds + laterIds
+
+    def WiqlResourcePath(self, project: str, teamId: str) -> str:
+        return "{}/{}/{}/_apis/wit/wiql".format(self.organization, project, teamId)
+
+    def WorkitemsResourcePath(self, project: str) -> str:
+        return "{}/{}/_apis/wit/workitems".format(self.organization, project)
+
+    @staticmethod
+    def WorkitemIdBatches(workitemIds: List[BatchItem], topElements: int = WORKITEM_BATCH_SIZE) -> List[List[BatchItem]]:
+        return [workitemIds[i:i + topElements] for i in range(0, len(workitemIds), topElements)]
+
+    @staticmethod
+    def WorkitemDetailsUriParameters(workItemIds: List[str]) -> Dict[str, str]:
+        if len(workItemIds) > WORKITEM_BATCH_SIZE:
             raise SystemError('The workitems API only supports up to 200 items for a single call.')
 
         uri_parameters: Dict[str, str] = {}
         uri_parameters['ids'] = ','.join(workItemIds)
         uri_parameters['api-version'] = "6.0"
+        # the API rejects $expand alongside a fields list, and most stories of a backlog are activated and need their
+        # relations, so the full documents of a batch come in a single request rather than trimmed ones plus a relations request
         uri_parameters['$expand'] = "Relations"
 
-        resourcePath = "{}/{}/_apis/wit/workitems".format(self.organization, project)
+        return uri_parameters
 
-        return self.GetResponse(resourcePath, uri_parameters).json()['value']
+    @staticmethod
+    def WorkitemRevisionsUriParameters(workItemIds: List[str]) -> Dict[str, str]:
+        uri_parameters = AdoGetProjectWorkItemsClient.WorkitemDetailsUriParameters(workItemIds)
+        del uri_parameters['$expand']
+        uri_parameters['fields'] = 'System.Rev'
 
-    def ParseWorkitems(self, repo: str, workitems: List[dict], pullRequestSubmitters: Dict[str, Dict[int, str]]) -> List[dict]:
+        return uri_parameters
+
+    @staticmethod
+    def IsActivated(workitem: dict) -> bool:
+        return {'Microsoft.VSTS.Common.ActivatedDate', 'System.AssignedTo'} <= set(workitem['fields']) and workitem['fields']['System.State'] != 'New'
+
+    def WorkitemCacheUrl(self, project: str, workItemId: str) -> str:
+        # a cached work item holds its fields and relations
+        return self.uri("{}/{}".format(self.WorkitemsResourcePath(project), workItemId), {'$expand': 'Relations'})
+
+    def CachedWorkitems(self, workItemIds: List[str], project: str) -> Tuple[Dict[str, dict], List[str]]:
+        if self.responseCache is None:
+            return {}, workItemIds
+
+        cachedWorkitems: Dict[str, dict] = {}
+
+        for workItemId in workItemIds:
+            cachedResponse, _ = self.responseCache.lookup(self.WorkitemCacheUrl(project, workItemId), self.responseCache.ttl)
+
+            if cachedResponse is not None:
+                cachedWorkitems[workItemId] = cachedResponse.json()
+
+        return cachedWorkitems, [i for i in workItemIds if i not in cachedWorkitems]
+
+    @staticmethod
+    def CurrentCachedWorkitems(cachedWorkitems: Dict[str, dict], revisions: List[dict]) -> Tuple[Dict[str, dict], List[str]]:
+        # WIQL only returns ids, so a closed work item that was reopened, re-pointed or reassigned since it was cached
+        # is only told apart by its revision
+        currentRevisions = {str(workitem['id']): workitem.get('rev') for workitem in revisions}
+        current = {i: workitem for i, workitem in cachedWorkitems.items() if workitem.get('rev') is not None and currentRevisions.get(i) == workitem['rev']}
+
+        return current, [i for i in cachedWorkitems if i not in current]
+
+    def MergeCachedWorkitems(self, workItemIds: List[str], cachedWorkitems: Dict[str, dict], fetchedWorkitems: List[dict], project: str) -> List[dict]:
+        if self.responseCache is None:
+            return fetchedWorkitems
+
+        # details are fetched in batches but cached per work item so a batch with a single open item still benefits
+        for workitem in fetchedWorkitems:
+            if workitem['fields'].get('System.State') in CLOSED_WORKITEM_STATES:
+                self.responseCache.store(self.WorkitemCacheUrl(project, str(workitem['id'])), 200, {}, json.dumps(workitem).encode('utf-8'), self.responseCache.ttl)
+
+            cachedWorkitems[str(workitem['id'])] = workitem
+
+        return [cachedWorkitems[i] for i in workItemIds if i in cachedWorkitems]
+
+    def GetResponse(self, resourcePath: str, uri_parameters: Dict[str, str]) -> Response:
+        return self.sendGetRequest(resourcePath, uri_parameters)
+
+    def PostResponse(self, resourcePath: str, body: dict, uri_parameters: Dict[str, str]) -> Response:
+        return self.sendPostRequest(resourcePath, body, uri_parameters)
+
+    def GetWorkitemBatch(self, workItemIds: List[str], project: str) -> List[dict]:
+        cachedWorkitems, missingIds = self.CachedWorkitems(workItemIds, project)
+
+        if cachedWorkitems:
+            cachedWorkitems, staleIds = self.CurrentCachedWorkitems(cachedWorkitems, self.GetWorkitemRevisions(list(cachedWorkitems), project))
+            missingIds += staleIds
+
+        workitems = self.GetWorkitemDetails(missingIds, project) if missingIds else []
+
+        return self.MergeCachedWorkitems(workItemIds, cachedWorkitems, workitems, project)
+
+    async def GetWorkitemsAsync(self, asyncClient: AsyncApiClient, workItemIds: List[str], project: str) -> List[dict]:
+        cachedWorkitems, missingIds = self.CachedWorkitems(workItemIds, project)
+        batchSlots = asyncio.Semaphore(self.maxConcurrentBatches)
+
+        async def inBatches(request: Callable[[AsyncApiClient, List[str], str], Awaitable[List[dict]]], ids: List[str]) -> List[dict]:
+            async def batchRequest(batch: List[str]) -> List[dict]:
+                async with batchSlots:
+                    return await request(asyncClient, batch, project)
+
+            return [workitem for batch in await asyncio.gather(*(batchRequest(batch) for batch in self.WorkitemIdBatches(ids))) for workitem in batch]
+
+        if cachedWorkitems:
+            cachedWorkitems, staleIds = self.CurrentCachedWorkitems(cachedWorkitems, await inBatches(self.GetWorkitemRevisionsAsync, list(cachedWorkitems)))
+            missingIds += staleIds
+
+        return self.MergeCachedWorkitems(workItemIds, cachedWorkitems, await inBatches(self.GetWorkitemDetailsAsync, missingIds), project)
+
+    def GetWorkitemDetails(self, workItemIds: List[str], project: str) -> List[dict]:
+        return self.GetResponse(self.WorkitemsResourcePath(project), self.WorkitemDetailsUriParameters(workItemIds)).json()['value']
+
+    async def GetWorkitemDetailsAsync(self, asyncClient: AsyncApiClient, workItemIds: List[str], project: str) -> List[dict]:
+        return (await asyncClient.sendGetRequest(self.WorkitemsResourcePath(project), self.WorkitemDetailsUriParameters(workItemIds))).json()['value']
+
+    def GetWorkitemRevisions(self, workItemIds: List[str], project: str) -> List[dict]:
+        # the documents come back trimmed to their revision
+        return self.GetResponse(self.WorkitemsResourcePath(project), self.WorkitemRevisionsUriParameters(workItemIds)).json()['value']
+
+    async def GetWorkitemRevisionsAsync(self, asyncClient: AsyncApiClient, workItemIds: List[str], project: str) -> List[dict]:
+        return (await asyncClient.sendGetRequest(self.WorkitemsResourcePath(project), self.WorkitemRevisionsUriParameters(workItemIds))).json()['value']
+
+    def ParseWorkitems(self, repo: str, workitems: List[dict], pullRequestSubmitters: Mapping) -> List[dict]:
         recordList = []
+        activatedWorkitems = []
 
         for workitem in workitems:
             recordList.append(
                 {**self.reportableFieldDefaults, **{
                     'contributor': workitem['fields']['System.CreatedBy']['displayName'],
-                    'week': parser.parse(workitem['fields']['System.CreatedDate']).strftime("%V"),
+                    'activity_date': workitem['fields']['System.CreatedDate'],
                     'repo': repo,
-                    'user_stories_created': 1
+                    'user_stories_created': 1,
+                    'workItemId': workitem['id']
                 }})
 
-            if {'Microsoft.VSTS.Common.ActivatedDate', 'System.AssignedTo'} <= set(workitem['fields']) and workitem['fields']['System.State'] != 'New':
+            if AdoGetProjectWorkItemsClient.IsActivated(workitem):
                 activatedDate: str = workitem['fields']['Microsoft.VSTS.Common.ActivatedDate']
                 storyStatus = workitem['fields']['System.State']
-                pullRequestSubmissionTimeDeltaFromStoryActiveDate = self._dateDiffBetweenPrSubmissionAndStoryActivation(workitem, repo, pullRequestSubmitters)
+                activatedWorkitems.append(workitem)
 
                 recordList.append(
                     {**self.reportableFieldDefaults, **{
                         'contributor': workitem['fields']['System.AssignedTo']['displayName'],
-                        'week': parser.parse(activatedDate).strftime("%V"),
+                        'activity_date': activatedDate,
+                        'activated_date': activatedDate,
+                        'resolved_date': workitem['fields'].get('Microsoft.VSTS.Common.ResolvedDate', np.nan) if storyStatus in ['Closed', 'Resolved'] else np.nan,
                         'repo': repo,
                         'user_stories_assigned': 1,
                         'user_stories_completed': 1 if storyStatus in ['Closed', 'Resolved'] else 0,
                         'user_story_points_completed': workitem['fields']['Microsoft.VSTS.Scheduling.StoryPoints'] if storyStatus in ['Closed', 'Resolved'] and 'Microsoft.VSTS.Scheduling.StoryPoints' in workitem['fields'] else 0,
                         'user_story_points_assigned': workitem['fields']['Microsoft.VSTS.Scheduling.StoryPoints'] if 'Microsoft.VSTS.Scheduling.StoryPoints' in workitem['fields'] else 0,
-                        'user_story_completion_days': RepoInsightsManager.dateStrDiffInDays(workitem['fields']['Microsoft.VSTS.Common.ResolvedDate'], activatedDate) if storyStatus in ['Closed', 'Resolved'] else np.nan
+                        'workItemId': workitem['id']
                     }})
 
-                if pullRequestSubmissionTimeDeltaFromStoryActiveDate is not None:
-                    recordList.append(pullRequestSubmissionTimeDeltaFromStoryActiveDate)
-
-        return recordList
+        # the pull request links of the whole batch are resolved in a single pass
+        return recordList + self.InitialPullRequestRecords(repo, activatedWorkitems, PullRequestIndex.of(pullRequestSubmitters))
@@ -0,0 +1,93 @@
+import gzip
+import json
+import os
+from contextlib import contextmanager
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import TextIO
+
+import numpy as np
+
+EVENT_LOG_VERSION = 1
+
+
+def _jsonValue(value: Any) -> Any:
+    # the records built off pandas frames, such as the initial pull requests of the work items, carry numpy scalars
+    if isinstance(value, np.generic):
+        return value.item()
+
+    raise TypeError('The event value {!r} is not json serializable'.format(value))
+
+
+class EventLogWriter:
+    def __init__(self, stream: TextIO):
+        self._stream = stream
+        self.records = 0
+
+    def _writeLine(self, value: dict) -> None:
+        self._stream.write(json.dumps(value, default=_jsonValue, separators=(',', ':')))
+        self._stream.write('\n')
+
+    def writeHeader(self, metadata: Dict[str, Any]) -> None:
+        self._writeLine({'version': EVENT_LOG_VERSION, **metadata})
+
+    def append(self, record: dict) -> None:
+        self._writeLine(record)
+        self.records += 1
+
+
+# Gzipped newline delimited json log of the raw activity records of a collection, in the order they were collected.
+# The first line holds the log version and the settings of the run. Records are spilled as they are collected and
+# the log only replaces a previous one once the collection completes, so a failed crawl never leaves a partial log behind.
+class EventLog:
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextmanager
+    def writer(self, metadata: Dict[str, Any] = None) -> Iterator[EventLogWriter]:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporaryPath = self.path + '.tmp'
+
+        try:
+            with gzip.open(temporaryPath, 'wt', encoding='utf-8') as f:
+                writer = EventLogWriter(f)
+                writer.writeHeader(metadata or {})
+                yield writer
+        except BaseException:
+            os.remove(temporaryPath)
+            raise
+
+        os.replace(temporaryPath, self.path)
+
+    def _lines(self) -> Iterator[dict]:
+        if not os.path.isfile(self.path):
+            raise FileNotFoundError('No event log at {}'.format(self.path))
+
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _checkVersion(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        if metadata.get('version') != EVENT_LOG_VERSION:
+            raise ValueError('Unsupported event log version {} in {}'.format(metadata.get('version'), self.path))
+
+        return metadata
+
+    def _header(self, lines: Iterator[dict]) -> Dict[str, Any]:
+        # a bare next would leak StopIteration out of records, where it turns into a RuntimeError
+        header = next(lines, None)
+
+        if header is None:
+            raise ValueError('The event log {} has no header'.format(self.path))
+
+        return self._checkVersion(header)
+
+    def metadata(self) -> Dict[str, Any]:
+        return self._header(self._lines())
+
+    def records(self) -> Iterator[dict]:
+        lines = self._lines()
+        self._header(lines)
+
+        yield from lines
@@ -0,0 +1,103 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict
+from typing import Iterator
+from typing import Mapping
+from typing import Optional
+from typing import Set
+
+
+def normalizeIdentity(value: str) -> str:
+    return value.strip().casefold()
+
+
+# Resolves commit authors to their canonical contributor. Built once per run from the org profiles (keyed by
+# principal name and mail address) and the ProfileAliases setting, so resolving an email or a display name is a
+# single dictionary probe rather than a scan of the org directory. Reads like the plain email -> contributor
+# entitlements mapping it replaces, with case insensitive keys.
+class IdentityIndex(Mapping[str, str]):
+    def __init__(self, entitlements: Mapping[str, str] = None, aliases: Mapping[str, str] = None):
+        self._contributorsByEmail: Dict[str, str] = {}
+        self._contributorsByName: Dict[str, Set[str]] = {}
+
+        # aliases are applied last so they override the org profiles, matching the merged entitlements of old
+        for emails in [entitlements or {}, aliases or {}]:
+            for email, contributor in emails.items():
+                if email:
+                    self._contributorsByEmail[normalizeIdentity(email)] = contributor
+
+        for contributor in self._contributorsByEmail.values():
+            self._contributorsByName.setdefault(normalizeIdentity(contributor), set()).add(contributor)
+
+    @staticmethod
+    def of(entitlements: Mapping[str, str]) -> 'IdentityIndex':
+        return entitlements if isinstance(entitlements, IdentityIndex) else IdentityIndex(entitlements)
+
+    def __getitem__(self, email: str) -> str:
+        return self._contributorsByEmail[normalizeIdentity(email)]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._contributorsByEmail)
+
+    def __len__(self) -> int:
+        return len(self._contributorsByEmail)
+
+    def contributorByEmail(self, email: str) -> Optional[str]:
+        return self._contributorsByEmail.get(normalizeIdentity(email))
+
+    def contributorByName(self, displayName: str) -> Optional[str]:
+        candidates = self._contributorsByName.get(normalizeIdentity(displayName))
+
+        if not candidates:
+            return None
+
+        if len(candidates) == 1:
+            return next(iter(candidates))
+
+        # display names that only differ by case belong to different profiles, an exact match is the only safe pick
+        if displayName in candidates:
+            return displayName
+
+        logging.warning('Display name %s is ambiguous between the profiles %s.', displayName, sorted(candidates))
+
+        return None
+
+
+# Persists the org profiles resolved for a scope so cold starts within the ttl don't download the org directory
+# again. The ProfileAliases are applied on top of the loaded profiles every run, so alias changes take effect
+# right away.
+class IdentityIndexStore:
+    def __init__(self, directory: str, ttl: datetime.timedelta = datetime.timedelta(hours=24)):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, scope: str) -> str:
+        return os.path.join(self.directory, 'entitlements-{}.json'.format(hashlib.sha256(scope.encode('utf-8')).hexdigest()[:16]))
+
+    def load(self, scope: str) -> Optional[Dict[str, str]]:
+        path = self._path(scope)
+
+        if not os.path.isfile(path):
+            return None
+
+        with open(path, 'r', encoding='utf-8') as f:
+            payload = json.load(f)
+
+        if payload.get('scope') != scope or time.time() - payload['storedAt'] >= self.ttl.total_seconds():
+            return None
+
+        return payload['entitlements']
+
+    def save(self, scope: str, entitlements: Mapping[str, str]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(scope)
+        temporaryPath = path + '.tmp'
+
+        with open(temporaryPath, 'w', encoding='utf-8') as f:
+            json.dump({'scope': scope, 'storedAt': time.time(), 'entitlements': dict(entitlements)}, f)
+
+        os.replace(temporaryPath, path)
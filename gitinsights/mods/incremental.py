@@ -0,0 +1,184 @@
+import datetime
+import gzip
+import json
+import os
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+
+import numpy as np
+import pandas as pd
+
+from .sketches import SKETCH_SUFFIX
+from .sketches import QuantileMeasure
+from .sketches import QuantileSketch
+
+OWNER_COLUMN = 'owner'
+# The finest grain persisted between runs, reports can group by any subset of it
+INCREMENTAL_GRAIN = ['contributor', 'year', 'week', 'repo']
+MEAN_SUM_SUFFIX = '__sum'
+MEAN_COUNT_SUFFIX = '__count'
+
+
+# Every event is owned by the pull request or work item it was derived from. A changed owner is re-fetched in
+# full so its previously persisted partial aggregates are replaced rather than added to.
+def eventOwners(events: pd.DataFrame) -> pd.Series:
+    owners = pd.Series(np.nan, index=events.index, dtype=object)
+
+    if 'pullRequestId' in events:
+        hasPullRequest = events['pullRequestId'].notna()
+        owners[hasPullRequest] = 'pr:' + events.loc[hasPullRequest, 'repo'].astype(str) + ':' + events.loc[hasPullRequest, 'pullRequestId'].astype('int64').astype(str)
+
+    if 'workItemId' in events:
+        hasWorkitem = events['workItemId'].notna() & owners.isna()
+        owners[hasWorkitem] = 'workitem:' + events.loc[hasWorkitem, 'workItemId'].astype('int64').astype(str)
+
+    if owners.isna().any():
+        raise ValueError('Incremental collection requires every event to reference a pull request or work item')
+
+    return owners
+
+
+# Additive form of the measures: sums are kept as is, means as (sum, count) pairs and quantiles as a sketch of
+# their source field, so partials of disjoint events can be summed together before the measures are taken
+def measurePartials(events: pd.DataFrame, measures: Dict[str, str]) -> pd.DataFrame:
+    columns = {}
+
+    for measure, aggFunction in measures.items():
+        if isinstance(aggFunction, QuantileMeasure):
+            # the raw durations, sketched by sumPartials once they are grouped
+            columns[aggFunction.source + SKETCH_SUFFIX] = events[aggFunction.source]
+        elif aggFunction == 'mean':
+            columns[measure + MEAN_SUM_SUFFIX] = events[measure].fillna(0)
+            columns[measure + MEAN_COUNT_SUFFIX] = events[measure].notna().astype('int64')
+        elif aggFunction == 'sum':
+            columns[measure] = events[measure]
+        else:
+            raise ValueError('Aggregation function {} cannot be maintained incrementally'.format(aggFunction))
+
+    return pd.DataFrame(columns)
+
+
+def sumPartials(partials: pd.DataFrame, by: List[str] = None, level: List[str] = None, **groupbyKwargs) -> pd.DataFrame:
+    grouped = partials.groupby(by, level=level, **groupbyKwargs)
+    valueColumns = [column for column in partials.columns if column not in (by or [])]
+
+    if not any(column.endswith(SKETCH_SUFFIX) for column in valueColumns):
+        return grouped.sum()
+
+    # the sketches of a group are merged rather than summed
+    return grouped.agg({column: QuantileSketch.combine if column.endswith(SKETCH_SUFFIX) else 'sum' for column in valueColumns})
+
+
+def finalizeMeasures(grouped: pd.DataFrame, measures: Dict[str, str]) -> pd.DataFrame:
+    result = pd.DataFrame(index=grouped.index)
+
+    for measure, aggFunction in measures.items():
+        if isinstance(aggFunction, QuantileMeasure):
+            result[measure] = grouped[aggFunction.source + SKETCH_SUFFIX].map(lambda sketch, quantile=aggFunction.quantile: sketch.quantile(quantile)).astype('float64')
+        elif aggFunction == 'mean':
+            counts = grouped[measure + MEAN_COUNT_SUFFIX]
+            result[measure] = (grouped[measure + MEAN_SUM_SUFFIX] / counts).where(counts > 0)
+        else:
+            result[measure] = grouped[measure]
+
+    return result
+
+
+def partialAggregates(events: pd.DataFrame, grainColumns: List[str], measures: Dict[str, str]) -> pd.DataFrame:
+    if events.empty:
+        return pd.DataFrame()
+
+    partials = measurePartials(events, measures)
+    keys = pd.DataFrame({OWNER_COLUMN: eventOwners(events), **{c: events[c] for c in grainColumns}})
+
+    return sumPartials(pd.concat([keys, partials], axis=1), [OWNER_COLUMN] + grainColumns, observed=True).reset_index()
+
+
+def mergePartialAggregates(previous: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    if previous.empty:
+        return delta
+
+    if delta.empty:
+        return previous
+
+    replacedOwners: Set[str] = set(delta[OWNER_COLUMN])
+
+    return pd.concat([previous[~previous[OWNER_COLUMN].isin(replacedOwners)], delta], ignore_index=True)
+
+
+def finalizeAggregates(partials: pd.DataFrame, groupByColumns: List[str], measures: Dict[str, str]) -> pd.DataFrame:
+    if partials.empty:
+        return pd.DataFrame(columns=list(measures))
+
+    grouped = sumPartials(partials.drop(columns=[OWNER_COLUMN]), groupByColumns, observed=True)
+
+    return finalizeMeasures(grouped, measures)
+
+
+# Persists high-water marks, the per-owner weekly partial aggregates and lookup state between incremental runs
+class IncrementalStateStore:
+    def __init__(self, directory: str, overlap: datetime.timedelta = datetime.timedelta(hours=1)):
+        self.directory = directory
+        self.overlap = overlap
+        self._watermarks: Dict[str, Dict[str, str]] = self._readJson('watermarks.json', {})
+
+    def _path(self, fileName: str) -> str:
+        return os.path.join(self.directory, fileName)
+
+    def _readJson(self, fileName: str, default):
+        path = self._path(fileName)
+
+        if not os.path.isfile(path):
+            return default
+
+        with gzip.open(path, 'rt', encoding='utf-8') if fileName.endswith('.gz') else open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _writeJson(self, fileName: str, payload) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(fileName)
+        temporaryPath = path + '.tmp'
+
+        with gzip.open(temporaryPath, 'wt', encoding='utf-8') if fileName.endswith('.gz') else open(temporaryPath, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+
+        os.replace(temporaryPath, path)
+
+    def watermark(self, scope: str, source: str) -> Optional[datetime.datetime]:
+        value = self._watermarks.get(scope, {}).get(source)
+
+        return datetime.datetime.fromisoformat(value) - self.overlap if value else None
+
+    def setWatermark(self, scope: str, source: str, value: datetime.datetime) -> None:
+        self._watermarks.setdefault(scope, {})[source] = value.isoformat()
+
+    def saveWatermarks(self) -> None:
+        self._writeJson('watermarks.json', self._watermarks)
+
+    def loadLookup(self, name: str) -> dict:
+        return self._readJson('{}.json.gz'.format(name), {})
+
+    def saveLookup(self, name: str, lookup: dict) -> None:
+        self._writeJson('{}.json.gz'.format(name), lookup)
+
+    def loadAggregates(self) -> pd.DataFrame:
+        path = self._path('aggregates.json.gz')
+
+        if not os.path.isfile(path):
+            return pd.DataFrame()
+
+        # dtype inference is disabled so string keys such as week numbers round trip unchanged
+        partials = pd.read_json(path, orient='records', lines=True, compression='gzip', dtype=False, convert_dates=False)
+        sketchColumns = [column for column in partials.columns if column.endswith(SKETCH_SUFFIX)]
+
+        return partials.assign(**{column: partials[column].map(QuantileSketch.fromDict) for column in sketchColumns})
+
+    def saveAggregates(self, partials: pd.DataFrame) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        temporaryPath = self._path('aggregates.json.gz.tmp')
+        sketchColumns = [column for column in partials.columns if column.endswith(SKETCH_SUFFIX)]
+        partials = partials.assign(**{column: partials[column].map(QuantileSketch.toDict) for column in sketchColumns})
+        partials.to_json(temporaryPath, orient='records', lines=True, compression='gzip')
+        os.replace(temporaryPath, self._path('aggregates.json.gz'))
@@ -0,0 +1,335 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# Upper bounds of the request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+THROTTLED_STATUS = 429
+METRIC_PREFIX = 'gitinsights'
+EXPORT_FORMATS = ('json', 'prometheus')
+
+
+class _NoopStage:
+    def __enter__(self) -> '_NoopStage':
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def addRecords(self, count: int) -> None:
+        pass
+
+
+NOOP_STAGE = _NoopStage()
+
+
+# Instrumentation surface shared by the manager stages and the sync and async clients. The base class drops every
+# measurement, so by default a hook costs a single method call. MetricsInstrumentation records them.
+class Instrumentation:
+    # the clients only take measurements, and call the record hooks, when this is set
+    enabled = False
+
+    # pylint: disable=unused-argument
+    def stage(self, name: str) -> _NoopStage:
+        return NOOP_STAGE
+
+    # pylint: disable=too-many-arguments
+    def recordRequest(self, host: str, method: str, status: Optional[int], seconds: float, bytesSent: int, bytesReceived: int, retryStatuses: List[Optional[int]]) -> None:
+        pass
+
+    def recordDeserialization(self, client: str, seconds: float, records: int) -> None:
+        pass
+
+    def recordUnresolvedLinks(self, reason: str, count: int) -> None:
+        pass
+
+    def recordRateLimit(self, scope: str, concurrency: float, throttleReason: Optional[str], delaySeconds: float) -> None:
+        pass
+
+
+# Times a stage, the no-op stage of the base instrumentation is the interface it fills in
+class _Stage(_NoopStage):
+    def __init__(self, metrics: 'MetricsInstrumentation', name: str):
+        self.metrics = metrics
+        self.name = name
+        self.started = 0.0
+        self.records = 0
+
+    def __enter__(self) -> '_Stage':
+        self.started = time.perf_counter()
+
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.metrics._recordStage(self.name, time.perf_counter() - self.started, self.records)
+
+    def addRecords(self, count: int) -> None:
+        self.records += count
+
+
+class LatencyHistogram:
+    def __init__(self):
+        # the last bucket counts the observations past the largest bound
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulativeBuckets(self) -> List[Tuple[str, int]]:
+        total = 0
+        cumulative = []
+
+        for bound, count in zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.buckets):
+            total += count
+            cumulative.append((bound, total))
+
+        return cumulative
+
+    def quantile(self, q: float) -> Optional[float]:
+        # upper bound of the bucket holding the q-th observation, observations past the largest bound report it
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        total = 0
+
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            total += count
+
+            if total >= rank:
+                return bound
+
+        return LATENCY_BUCKETS[-1]
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        self.buckets = [count + otherCount for count, otherCount in zip(self.buckets, other.buckets)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class _RequestMetrics:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.statuses: Dict[str, int] = defaultdict(int)
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.retries = 0
+        self.throttled = 0
+
+    # pylint: disable=too-many-arguments
+    def record(self, status: Optional[int], seconds: float, bytesSent: int, bytesReceived: int, retryStatuses: List[Optional[int]]) -> None:
+        self.latency.observe(seconds)
+        # requests that never got a response, such as connection failures, are counted under 'error'
+        self.statuses[str(status) if status is not None else 'error'] += 1
+        self.bytesSent += bytesSent
+        self.bytesReceived += bytesReceived
+        self.retries += len(retryStatuses)
+        self.throttled += sum(1 for s in retryStatuses + [status] if s == THROTTLED_STATUS)
+
+    def merge(self, other: '_RequestMetrics') -> None:
+        self.latency.merge(other.latency)
+        self.bytesSent += other.bytesSent
+        self.bytesReceived += other.bytesReceived
+        self.retries += other.retries
+        self.throttled += other.throttled
+
+        for status, count in other.statuses.items():
+            self.statuses[status] += count
+
+
+class _RateLimitMetrics:
+    def __init__(self):
+        self.concurrency = 0.0
+        # None until the scope records its first window
+        self.minConcurrency: Optional[float] = None
+        self.throttleEvents: Dict[str, int] = defaultdict(int)
+        self.throttleDelaySeconds = 0.0
+
+    def record(self, concurrency: float, throttleReason: Optional[str], delaySeconds: float) -> None:
+        self.concurrency = concurrency
+        self.minConcurrency = concurrency if self.minConcurrency is None else min(self.minConcurrency, concurrency)
+
+        if throttleReason is not None:
+            self.throttleEvents[throttleReason] += 1
+            self.throttleDelaySeconds += delaySeconds
+
+    def merge(self, other: '_RateLimitMetrics') -> None:
+        # the processes sharing an org report the narrowest of their windows
+        windows = [window for window in (self.minConcurrency, other.minConcurrency) if window is not None]
+        self.concurrency = other.concurrency if self.minConcurrency is None else min(self.concurrency, other.concurrency)
+        self.minConcurrency = min(windows) if windows else None
+        self.throttleDelaySeconds += other.throttleDelaySeconds
+
+        for reason, count in other.throttleEvents.items():
+            self.throttleEvents[reason] += count
+
+
+class MetricsInstrumentation(Instrumentation):
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str], _RequestMetrics] = defaultdict(_RequestMetrics)
+        self._deserialization: Dict[str, Dict[str, float]] = defaultdict(lambda: {'seconds': 0.0, 'calls': 0, 'records': 0})
+        self._stages: Dict[str, Dict[str, float]] = defaultdict(lambda: {'seconds': 0.0, 'calls': 0, 'records': 0})
+        self._unresolvedLinks: Dict[str, int] = defaultdict(int)
+        self._rateLimits: Dict[str, _RateLimitMetrics] = defaultdict(_RateLimitMetrics)
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def __getstate__(self) -> dict:
+        # the lock and the defaultdict factories don't pickle, worker processes hand back plain copies of the measurements
+        with self._lock:
+            return {'requests': dict(self._requests), 'deserialization': {k: dict(v) for k, v in self._deserialization.items()}, 'stages': {k: dict(v) for k, v in self._stages.items()},
+                    'unresolvedLinks': dict(self._unresolvedLinks), 'rateLimits': dict(self._rateLimits)}
+
+    def __setstate__(self, state: dict) -> None:
+        MetricsInstrumentation.__init__(self)
+        self._mergeState(state)
+
+    def merge(self, other: 'MetricsInstrumentation') -> None:
+        self._mergeState(other.__getstate__())
+
+    def _mergeState(self, state: dict) -> None:
+        with self._lock:
+            for key, requests in state['requests'].items():
+                self._requests[key].merge(requests)
+
+            for merged, values in ((self._deserialization, state['deserialization']), (self._stages, state['stages'])):
+                for name, counters in values.items():
+                    for counter, value in counters.items():
+                        merged[name][counter] += value
+
+            for reason, count in state['unresolvedLinks'].items():
+                self._unresolvedLinks[reason] += count
+
+            for scope, rateLimit in state['rateLimits'].items():
+                self._rateLimits[scope].merge(rateLimit)
+
+    def _recordStage(self, name: str, seconds: float, records: int) -> None:
+        with self._lock:
+            stage = self._stages[name]
+            stage['seconds'] += seconds
+            stage['calls'] += 1
+            stage['records'] += records
+
+    # pylint: disable=too-many-arguments
+    def recordRequest(self, host: str, method: str, status: Optional[int], seconds: float, bytesSent: int, bytesReceived: int, retryStatuses: List[Optional[int]]) -> None:
+        with self._lock:
+            self._requests[(host, method)].record(status, seconds, bytesSent, bytesReceived, retryStatuses)
+
+    def recordDeserialization(self, client: str, seconds: float, records: int) -> None:
+        with self._lock:
+            deserialization = self._deserialization[client]
+            deserialization['seconds'] += seconds
+            deserialization['calls'] += 1
+            deserialization['records'] += records
+
+    def recordUnresolvedLinks(self, reason: str, count: int) -> None:
+        with self._lock:
+            self._unresolvedLinks[reason] += count
+
+    def recordRateLimit(self, scope: str, concurrency: float, throttleReason: Optional[str], delaySeconds: float) -> None:
+        with self._lock:
+            self._rateLimits[scope].record(concurrency, throttleReason, delaySeconds)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                'requests': [{
+                    'host': host,
+                    'method': method,
+                    'count': metrics.latency.count,
+                    'statuses': dict(metrics.statuses),
+                    'bytes_sent': metrics.bytesSent,
+                    'bytes_received': metrics.bytesReceived,
+                    'retries': metrics.retries,
+                    'throttled': metrics.throttled,
+                    'latency_seconds': {
+                        'sum': round(metrics.latency.sum, 6),
+                        'p50': metrics.latency.quantile(0.5),
+                        'p95': metrics.latency.quantile(0.95),
+                        'p99': metrics.latency.quantile(0.99),
+                        'buckets': dict(metrics.latency.cumulativeBuckets())
+                    }
+                } for (host, method), metrics in sorted(self._requests.items())],
+                'deserialization': {client: {**values, 'seconds': round(values['seconds'], 6)} for client, values in sorted(self._deserialization.items())},
+                'stages': {stage: {**values, 'seconds': round(values['seconds'], 6)} for stage, values in self._stages.items()},
+                'unresolved_links': dict(sorted(self._unresolvedLinks.items())),
+                'rate_limits': {scope: {
+                    'concurrency': round(metrics.concurrency, 3),
+                    'min_concurrency': round(metrics.minConcurrency if metrics.minConcurrency is not None else metrics.concurrency, 3),
+                    'throttle_events': dict(sorted(metrics.throttleEvents.items())),
+                    'throttle_delay_seconds': round(metrics.throttleDelaySeconds, 6)
+                } for scope, metrics in sorted(self._rateLimits.items())}
+            }
+
+    def toJson(self) -> str:
+        return json.dumps(self.summary(), indent=2)
+
+    def toPrometheusText(self) -> str:
+        summary = self.summary()
+        lines: List[str] = []
+
+        def metric(name: str, metricType: str, helpText: str, samples: List[Tuple[Dict[str, str], float]]) -> None:
+            lines.append("# HELP {}_{} {}".format(METRIC_PREFIX, name, helpText))
+            lines.append("# TYPE {}_{} {}".format(METRIC_PREFIX, name, metricType))
+
+            for labels, value in samples:
+                lines.append("{}_{}{} {}".format(METRIC_PREFIX, name, _prometheusLabels(labels), value))
+
+        requests = summary['requests']
+        lines.append("# HELP {}_request_duration_seconds Latency of the ADO requests, retries included".format(METRIC_PREFIX))
+        lines.append("# TYPE {}_request_duration_seconds histogram".format(METRIC_PREFIX))
+
+        for r in requests:
+            labels = {'host': r['host'], 'method': r['method']}
+
+            for bound, count in r['latency_seconds']['buckets'].items():
+                lines.append("{}_request_duration_seconds_bucket{} {}".format(METRIC_PREFIX, _prometheusLabels({**labels, 'le': bound}), count))
+
+            lines.append("{}_request_duration_seconds_sum{} {}".format(METRIC_PREFIX, _prometheusLabels(labels), r['latency_seconds']['sum']))
+            lines.append("{}_request_duration_seconds_count{} {}".format(METRIC_PREFIX, _prometheusLabels(labels), r['count']))
+
+        metric('requests_total', 'counter', 'ADO requests by response status', [({'host': r['host'], 'method': r['method'], 'status': status}, count) for r in requests for status, count in sorted(r['statuses'].items())])
+        metric('request_bytes_total', 'counter', 'Request body bytes sent to ADO', [({'host': r['host'], 'method': r['method']}, r['bytes_sent']) for r in requests])
+        metric('response_bytes_total', 'counter', 'Response body bytes received from ADO', [({'host': r['host'], 'method': r['method']}, r['bytes_received']) for r in requests])
+        metric('request_retries_total', 'counter', 'Retried ADO requests', [({'host': r['host'], 'method': r['method']}, r['retries']) for r in requests])
+        metric('request_throttled_total', 'counter', 'ADO responses throttled with 429 Too Many Requests', [({'host': r['host'], 'method': r['method']}, r['throttled']) for r in requests])
+        metric('deserialization_seconds_total', 'counter', 'Time spent turning ADO responses into records', [({'client': client}, values['seconds']) for client, values in summary['deserialization'].items()])
+        metric('deserialized_records_total', 'counter', 'Records produced by the ADO clients', [({'client': client}, values['records']) for client, values in summary['deserialization'].items()])
+        metric('stage_seconds_total', 'counter', 'Time spent in each collection stage', [({'stage': stage}, values['seconds']) for stage, values in summary['stages'].items()])
+        metric('stage_calls_total', 'counter', 'Calls of each collection stage', [({'stage': stage}, values['calls']) for stage, values in summary['stages'].items()])
+        metric('stage_records_total', 'counter', 'Records produced by each collection stage', [({'stage': stage}, values['records']) for stage, values in summary['stages'].items()])
+        metric('unresolved_links_total', 'counter', 'Work item links to pull requests that could not be resolved', [({'reason': reason}, count) for reason, count in summary['unresolved_links'].items()])
+        metric('rate_limit_concurrency', 'gauge', 'In-flight requests the adaptive rate limiter currently allows', [({'org': scope}, values['concurrency']) for scope, values in summary['rate_limits'].items()])
+        metric('throttle_events_total', 'counter', 'Throttled ADO responses seen by the adaptive rate limiter', [({'org': scope, 'reason': reason}, count) for scope, values in summary['rate_limits'].items() for reason, count in values['throttle_events'].items()])
+        metric('throttle_delay_seconds_total', 'counter', 'Delays requested by the ADO throttling headers', [({'org': scope}, values['throttle_delay_seconds']) for scope, values in summary['rate_limits'].items()])
+
+        return '\n'.join(lines) + '\n'
+
+    def export(self, exportFormat: str = 'json') -> str:
+        if exportFormat not in EXPORT_FORMATS:
+            raise ValueError("Unsupported metrics format {}, expected one of {}".format(exportFormat, list(EXPORT_FORMATS)))
+
+        return self.toJson() if exportFormat == 'json' else self.toPrometheusText()
+
+
+def _prometheusLabels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+
+    escaped = ('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels.items())
+
+    return '{' + ','.join(escaped) + '}'
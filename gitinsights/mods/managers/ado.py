@@ -1,30 +1,128 @@
 
+import datetime
+from contextlib import asynccontextmanager
+from typing import Any
+from typing import AsyncIterator
 from typing import Dict
 from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
 
+import aiohttp
 import numpy as np
+import pandas as pd
 
+from ...mods.async_client import AsyncApiClient
 from ...mods.clients.ado.comments import AdoPullRequestReviewCommentsClient
 from ...mods.clients.ado.commits import AdoPullRequestCommitsClient
+from ...mods.clients.ado.entitlements import ENTITLEMENTS_SCOPES
 from ...mods.clients.ado.entitlements import AdoGetOrgEntitlementsClient
+from ...mods.clients.ado.members import AdoProjectMembersClient
 from ...mods.clients.ado.pull_request import AdoPullRequestsClient
 from ...mods.clients.ado.workitems import AdoGetProjectWorkItemsClient
+from ...mods.event_log import EventLog
+from ...mods.identity import IdentityIndexStore
+from ...mods.incremental import IncrementalStateStore
+from ...mods.instrumentation import Instrumentation
+from ...mods.managers.repo_insights_base import ApiClient
 from ...mods.managers.repo_insights_base import RepoInsightsManager
+from ...mods.pull_request_index import PullRequestIndex
+from ...mods.response_cache import ResponseCache
+from ...mods.sketches import quantileMeasures
+from ...mods.streaming import DEFAULT_CHUNK_SIZE
+from ...mods.timestamps import CALENDAR_DAY
+from ...mods.timestamps import CALENDAR_MONTH
+from ...mods.timestamps import CALENDAR_QUARTER
+from ...mods.timestamps import FRACTIONAL_DAYS
+from ...mods.timestamps import ISO_WEEK
+from ...mods.timestamps import ISO_YEAR
+from ...mods.timestamps import TIMESTAMP
+from ...mods.timestamps import WHOLE_DAYS
+from ...mods.timestamps import parseIsoTimestamp
+from ...mods.transport import AdaptiveConcurrencyLimiter
+from ...mods.transport import HostConcurrencyLimiter
+from ...mods.transport import PooledTransport
 
 BASE_URI = 'dev.azure.com'
 DEFAULT_VERSION = '6.0'
+# Quantiles reported next to the mean of every duration field
+DURATION_QUANTILES = (0.5, 0.9, 0.99)
 
 
+# How a manager collects the activity of its target. The settings are shared as is by every target of a sharded
+# collection, so they must be picklable.
+class CollectionSettings(NamedTuple):
+    # Number of pull requests whose commits and comments are fetched concurrently
+    maxWorkers: int = 1
+    # In-flight requests per ADO host, and the pooled connections serving them
+    maxConcurrentRequestsPerHost: int = 8
+    keepAlive: bool = True
+    # Narrows the in-flight requests per org to the throttling feedback of ADO
+    adaptiveRateLimit: bool = False
+    maxConcurrentWorkitemBatches: int = 4
+    # Bounds the repo commit history fetched for change counts, or looks them up by the commit ids referenced by pull requests
+    commitsFromDate: Optional[datetime.datetime] = None
+    commitsToDate: Optional[datetime.datetime] = None
+    changeCountsByCommitId: bool = False
+    # Work item types and reporting window pushed into the WIQL query
+    workItemTypes: Optional[List[str]] = None
+    workitemsFromDate: Optional[datetime.datetime] = None
+    workitemsToDate: Optional[datetime.datetime] = None
+    # Reporting window of the pull request comments
+    commentsFromDate: Optional[datetime.datetime] = None
+    commentsToDate: Optional[datetime.datetime] = None
+    # Narrows the org profiles to the project or team members, and persists them across runs
+    entitlementsScope: str = 'org'
+    identityStore: Optional[IdentityIndexStore] = None
+    responseCache: Optional[ResponseCache] = None
+    incrementalStore: Optional[IncrementalStateStore] = None
+    eventLog: Optional[EventLog] = None
+    instrumentation: Optional[Instrumentation] = None
+
+
+# pylint: disable=too-many-instance-attributes
 class AzureDevopsClientManager(RepoInsightsManager):
-    def __init__(self, organization: str, project: str, repos: List[str], teamId: str, patToken: str, profileAliases: Dict[str, str] = None):
-        self.pullrequestClient = AdoPullRequestsClient(organization, BASE_URI, DEFAULT_VERSION, patToken, self._reportableFieldDefaults)
-        self.commitsByPullrequestClient = AdoPullRequestCommitsClient(organization, BASE_URI, DEFAULT_VERSION, patToken, self._reportableFieldDefaults)
-        self.pullRequestCommentsClient = AdoPullRequestReviewCommentsClient(organization, BASE_URI, DEFAULT_VERSION, patToken, self._reportableFieldDefaults)
-        self.entitlementsClient = AdoGetOrgEntitlementsClient(organization, 'vssps.dev.azure.com', '5.1-preview.1', patToken, self._reportableFieldDefaults)
-        self.workitemsClient = AdoGetProjectWorkItemsClient(organization, BASE_URI, DEFAULT_VERSION, patToken, self._reportableFieldDefaults)
+    def __init__(self, organization: str, project: str, repos: List[str], teamId: str, patToken: str, profileAliases: Dict[str, str] = None, settings: CollectionSettings = None,
+                 concurrencyLimiter: HostConcurrencyLimiter = None, orgEntitlements: Dict[str, str] = None):
+        settings = settings or CollectionSettings()
+
+        if settings.entitlementsScope not in ENTITLEMENTS_SCOPES:
+            raise ValueError('Unsupported entitlements scope {}, expected one of {}'.format(settings.entitlementsScope, ', '.join(ENTITLEMENTS_SCOPES)))
+
+        self.settings = settings
+        self.concurrencyLimiter = concurrencyLimiter or HostConcurrencyLimiter(settings.maxConcurrentRequestsPerHost)
+
+        if settings.adaptiveRateLimit:
+            # one window per org, shared by the clients of every ADO host
+            self.concurrencyLimiter = AdaptiveConcurrencyLimiter(self.concurrencyLimiter, organization, instrumentation=settings.instrumentation)
+
+        # sized to the per host cap so every in-flight request can hold on to a pooled connection
+        self.transport = PooledTransport(poolSize=settings.maxConcurrentRequestsPerHost, keepAlive=settings.keepAlive)
+        clientSettings: Dict[str, Any] = {'concurrencyLimiter': self.concurrencyLimiter, 'transport': self.transport, 'responseCache': settings.responseCache, 'instrumentation': settings.instrumentation}
+        self.pullrequestClient = AdoPullRequestsClient(organization, BASE_URI, DEFAULT_VERSION, patToken, self._recordDefaults, **clientSettings)
+        self.commitsByPullrequestClient = AdoPullRequestCommitsClient(organization, BASE_URI, DEFAULT_VERSION, patToken, self._recordDefaults, settings.commitsFromDate, settings.commitsToDate,
+                                                                      settings.changeCountsByCommitId, **clientSettings)
+        self.pullRequestCommentsClient = AdoPullRequestReviewCommentsClient(organization, BASE_URI, DEFAULT_VERSION, patToken, self._recordDefaults, settings.commentsFromDate, settings.commentsToDate,
+                                                                            **clientSettings)
+        self.entitlementsClient = AdoGetOrgEntitlementsClient(organization, 'vssps.dev.azure.com', '5.1-preview.1', patToken, self._recordDefaults, **clientSettings)
+        self.projectMembersClient = AdoProjectMembersClient(organization, BASE_URI, DEFAULT_VERSION, patToken, self._recordDefaults, **clientSettings)
+        self.workitemsClient = AdoGetProjectWorkItemsClient(organization, BASE_URI, DEFAULT_VERSION, patToken, self._recordDefaults, settings.maxConcurrentWorkitemBatches, settings.workItemTypes,
+                                                            settings.workitemsFromDate, settings.workitemsToDate, **clientSettings)
         self.repoPullRequestSubmitters: Dict[str, Dict[int, str]] = {}
+        # org profiles loaded once up front and shared by every project collected from the org
+        self.orgEntitlements: Optional[Dict[str, str]] = orgEntitlements
+        self.asyncSession: Optional[aiohttp.ClientSession] = None
+        self.pendingWatermarks: List[Tuple[str, str, datetime.datetime]] = []
+
+        if settings.incrementalStore is not None:
+            # unchanged pull requests are not re-listed so their submitters are carried over from the previous run
+            for repoId, submitters in settings.incrementalStore.loadLookup('pullRequestSubmitters').items():
+                self.repoPullRequestSubmitters[repoId] = {int(prId): contributor for prId, contributor in submitters.items()}
 
-        super().__init__(organization, project, repos, teamId, patToken, profileAliases)
+            self.commitsByPullrequestClient.loadCommitChangeCounts(settings.incrementalStore.loadLookup('commitChangeCounts'))
+
+        super().__init__(organization, project, repos, teamId, patToken, profileAliases, settings.maxWorkers, settings.incrementalStore, settings.instrumentation, settings.eventLog)
 
     @property
     def _reportableFields(self) -> Dict[str, dict]:
@@ -32,42 +130,75 @@ class AzureDevopsClientManager(RepoInsightsManager):
                 'contributor': {'default': np.nan, 'agg_function': None},
                 'prs_submitted': {'default': 0, 'agg_function': 'sum'},
                 'prs_merged': {'default': 0, 'agg_function': 'sum'},
-                'week': {'default': np.nan, 'agg_function': None},
+                'week': {'default': np.nan, 'agg_function': None, 'derived_from': (ISO_WEEK, 'activity_date')},
+                'year': {'default': np.nan, 'agg_function': None, 'derived_from': (ISO_YEAR, 'activity_date')},
+                'day': {'default': np.nan, 'agg_function': None, 'derived_from': (CALENDAR_DAY, 'activity_date')},
+                'month': {'default': np.nan, 'agg_function': None, 'derived_from': (CALENDAR_MONTH, 'activity_date')},
+                'quarter': {'default': np.nan, 'agg_function': None, 'derived_from': (CALENDAR_QUARTER, 'activity_date')},
                 'prs_reviewed': {'default': 0, 'agg_function': 'sum'},
                 'pr_comments': {'default': 0, 'agg_function': 'sum'},
-                'creation_datetime': {'default': np.nan, 'agg_function': None},
+                'creation_datetime': {'default': np.nan, 'agg_function': None, 'derived_from': (TIMESTAMP, 'creation_datetime')},
                 'pr_commits_pushed': {'default': 0, 'agg_function': 'sum'},
                 'commit_change_count_edits': {'default': 0, 'agg_function': 'sum'},
                 'commit_change_count_deletes': {'default': 0, 'agg_function': 'sum'},
                 'commit_change_count_additions': {'default': 0, 'agg_function': 'sum'},
-                'completion_date': {'default': np.nan, 'agg_function': None},
-                'pr_completion_days': {'default': np.nan, 'agg_function': 'mean'},
+                'completion_date': {'default': np.nan, 'agg_function': None, 'derived_from': (TIMESTAMP, 'completion_date')},
+                'pr_completion_days': {'default': np.nan, 'agg_function': 'mean', 'derived_from': (WHOLE_DAYS, 'creation_datetime', 'completion_date'), 'quantiles': DURATION_QUANTILES},
                 'repo': {'default': np.nan, 'agg_function': None},
                 'user_stories_assigned': {'default': 0, 'agg_function': 'sum'},
                 'user_stories_completed': {'default': 0, 'agg_function': 'sum'},
-                'user_story_points_assigned': {'default': 0, 'agg_function': 'sum'},
-                'user_story_points_completed': {'default': 0, 'agg_function': 'sum'},
-                'user_story_completion_days': {'default': np.nan, 'agg_function': 'mean'},
+                'user_story_points_assigned': {'default': 0, 'agg_function': 'sum', 'dtype': 'float64'},
+                'user_story_points_completed': {'default': 0, 'agg_function': 'sum', 'dtype': 'float64'},
+                'user_story_completion_days': {'default': np.nan, 'agg_function': 'mean', 'derived_from': (WHOLE_DAYS, 'activated_date', 'resolved_date'), 'quantiles': DURATION_QUANTILES},
                 'user_stories_created': {'default': 0, 'agg_function': 'sum'},
-                'user_story_initial_pr_submission_days': {'default': np.nan, 'agg_function': 'mean'}
+                'user_story_initial_pr_submission_days': {'default': np.nan, 'agg_function': 'mean', 'derived_from': (FRACTIONAL_DAYS, 'activated_date', 'pr_submission_date'),
+                                                          'quantiles': DURATION_QUANTILES}
             }
 
+    @property
+    def _recordDefaults(self) -> dict:
+        # the columnar record builder fills the reportable field defaults, so the clients only emit the fields they set
+        return {}
+
     @property
     def _reportableFieldDefaults(self) -> dict:
         return {k: v['default'] for k, v in self._reportableFields.items()}
 
     def AggregationMeasures(self) -> dict:
-        return {k: v['agg_function'] for k, v in self._reportableFields.items() if v['agg_function'] is not None}
-
-    def _getRepoPullRequests(self, repo: str) -> List[dict]:
-        pullRequests = self.pullrequestClient.getDeserializedDataset(repo=repo, project=self.project)
+        return {**{k: v['agg_function'] for k, v in self._reportableFields.items() if v['agg_function'] is not None}, **quantileMeasures(self._reportableFields)}
 
-        for pr in [filtered_pr for filtered_pr in pullRequests if filtered_pr['prs_submitted'] == 1]:
+    def _registerPullRequestSubmitters(self, pullRequests: List[dict]) -> None:
+        for pr in [filtered_pr for filtered_pr in pullRequests if filtered_pr.get('prs_submitted') == 1]:
             if pr['repoId'] not in self.repoPullRequestSubmitters:
                 self.repoPullRequestSubmitters[pr['repoId']] = {}
 
             self.repoPullRequestSubmitters[pr['repoId']][pr['pullRequestId']] = pr['contributor']
 
+    def _changedSince(self, scope: str, source: str) -> Optional[datetime.datetime]:
+        if self.incrementalStore is None:
+            return None
+
+        # the new high-water mark is the time the fetch started, committed once the run succeeds
+        self.pendingWatermarks.append((scope, source, datetime.datetime.now(datetime.timezone.utc)))
+
+        return self.incrementalStore.watermark(scope, source)
+
+    def _repoScope(self, repo: str) -> str:
+        return "{}/{}/{}".format(self.organization, self.project, repo)
+
+    def _saveIncrementalState(self, store: IncrementalStateStore) -> None:
+        for scope, source, watermark in self.pendingWatermarks:
+            store.setWatermark(scope, source, watermark)
+
+        store.saveLookup('pullRequestSubmitters', self.repoPullRequestSubmitters)
+        store.saveLookup('commitChangeCounts', self.commitsByPullrequestClient.commitChangeCounts)
+        store.saveWatermarks()
+        self.pendingWatermarks = []
+
+    def _getRepoPullRequests(self, repo: str) -> List[dict]:
+        pullRequests = self.pullrequestClient.getDeserializedDataset(repo=repo, project=self.project, changedSince=self._changedSince(self._repoScope(repo), 'pullrequests'))
+        self._registerPullRequestSubmitters(pullRequests)
+
         return pullRequests
 
     def _getPullRequestCommits(self, **kwargs) -> List[dict]:
@@ -76,14 +207,38 @@ class AzureDevopsClientManager(RepoInsightsManager):
         entitlements = kwargs['entitlements']
         pullRequestId = kwargs['pullRequest']['pullRequestId']
 
-        return self.commitsByPullrequestClient.getDeserializedDataset(repo=repo, project=self.project, entitlements=entitlements, pullRequestId=pullRequestId)
+        return self._stampPullRequest(self.commitsByPullrequestClient.getDeserializedDataset(repo=repo, project=self.project, entitlements=entitlements, pullRequestId=pullRequestId, immutable=self._isCompleted(kwargs['pullRequest'])), kwargs['pullRequest'])
 
     def _getPullRequestComments(self, **kwargs) -> List[dict]:
         RepoInsightsManager.checkRequiredKwargs({'repo', 'pullRequest'}, **kwargs)
         pullrequestId = kwargs['pullRequest']['pullRequestId']
         repo = kwargs['repo']
 
-        return self.pullRequestCommentsClient.getDeserializedDataset(project=self.project, repo=repo, pullRequestId=pullrequestId)
+        if self._threadsOutsideWindow(kwargs['pullRequest']):
+            return []
+
+        return self._stampPullRequest(self.pullRequestCommentsClient.getDeserializedDataset(project=self.project, repo=repo, pullRequestId=pullrequestId, immutable=self._isCompleted(kwargs['pullRequest'])), kwargs['pullRequest'])
+
+    def _threadsOutsideWindow(self, pullRequest: dict) -> bool:
+        # no comment of a pull request created after the window can be updated within it. Comments can still be added
+        # or edited once a pull request is completed, so the threads of those completed before the window are fetched
+        commentsClient = self.pullRequestCommentsClient
+
+        return commentsClient.toDate is not None and parseIsoTimestamp(pullRequest['creation_datetime']) > commentsClient.toDate
+
+    @staticmethod
+    def _isCompleted(pullRequest: dict) -> bool:
+        # commits and threads of a completed pull request no longer change so they're cached without revalidation
+        return pullRequest.get('prs_merged') == 1
+
+    @staticmethod
+    def _stampPullRequest(records: List[dict], pullRequest: dict) -> List[dict]:
+        # ties commit and comment events back to the pull request that owns them
+        for record in records:
+            record['pullRequestId'] = pullRequest['pullRequestId']
+            record['repoId'] = pullRequest['repoId']
+
+        return records
 
     def _getProjectWorkitems(self) -> List[dict]:
         if self.teamId is None or self.project is None:
@@ -92,9 +247,126 @@ class AzureDevopsClientManager(RepoInsightsManager):
         if len(self.repos) == 0:
             return []
 
-        return self.workitemsClient.getDeserializedDataset(teamId=self.teamId, project=self.project, repo=self.repos[0], pullRequestSubmitters=self.repoPullRequestSubmitters)
+        return self.workitemsClient.getDeserializedDataset(teamId=self.teamId, project=self.project, repo=self.repos[0], pullRequestSubmitters=PullRequestIndex(self.repoPullRequestSubmitters),
+                                                           changedSince=self._changedSince(self._workitemScope(), 'workitems'))
+
+    def _workitemScope(self) -> str:
+        return "{}/{}/{}".format(self.organization, self.project, self.teamId)
+
+    def _entitlementsScopeKey(self) -> str:
+        return {'org': self.organization, 'project': "{}/{}".format(self.organization, self.project), 'team': self._workitemScope()}[self.settings.entitlementsScope]
+
+    def _loadStoredEntitlements(self) -> Optional[Dict[str, str]]:
+        if self.orgEntitlements is not None:
+            return self.orgEntitlements
+
+        return self.settings.identityStore.load(self._entitlementsScopeKey()) if self.settings.identityStore is not None else None
+
+    def _storeEntitlements(self, entitlementsList: List[dict]) -> Dict[str, str]:
+        entitlements = entitlementsList[0] if len(entitlementsList) > 0 else {}
+
+        if self.settings.identityStore is not None:
+            self.settings.identityStore.save(self._entitlementsScopeKey(), entitlements)
+
+        return entitlements
 
     def _loadProjectEntitlements(self) -> Dict[str, str]:
-        entitlementsList = self.entitlementsClient.getDeserializedDataset()
+        storedEntitlements = self._loadStoredEntitlements()
+
+        if storedEntitlements is not None:
+            return storedEntitlements
+
+        scopeDescriptor = None
+        principalNames = None
+
+        # project members are filtered by the graph API, team members are the project members listed on the team
+        if self.settings.entitlementsScope != 'org':
+            scopeDescriptor = self.entitlementsClient.getScopeDescriptor(self.projectMembersClient.getProjectId(self.project))
+
+        if self.settings.entitlementsScope == 'team':
+            principalNames = {member['principalName'].lower() for member in self.projectMembersClient.iterDeserializedDataset(project=self.project, teamId=self.teamId)}
+
+        return self._storeEntitlements(self.entitlementsClient.getDeserializedDataset(scopeDescriptor=scopeDescriptor, principalNames=principalNames))
+
+    def _asyncClient(self, client: ApiClient) -> AsyncApiClient:
+        if self.asyncSession is None:
+            raise RuntimeError('The async session is only available within collectPullRequestActivityAsync')
+
+        return AsyncApiClient(client, self.asyncSession)
+
+    @asynccontextmanager
+    async def _openAsyncSession(self) -> AsyncIterator[aiohttp.ClientSession]:
+        # the connector caps in-flight requests per host the same way the sync HostConcurrencyLimiter does
+        connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.settings.maxConcurrentRequestsPerHost, force_close=not self.settings.keepAlive)
+
+        async with aiohttp.ClientSession(connector=connector) as session:
+            self.asyncSession = session
+
+            try:
+                yield session
+            finally:
+                self.asyncSession = None
+
+    async def collectPullRequestActivityAsync(self) -> pd.DataFrame:
+        async with self._openAsyncSession():
+            return await super().collectPullRequestActivityAsync()
+
+    async def aggregatePullRequestActivityStreamingAsync(self, groupByColumns: List[str], chunkSize: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+        async with self._openAsyncSession():
+            return await super().aggregatePullRequestActivityStreamingAsync(groupByColumns, chunkSize)
+
+    async def _getRepoPullRequestsAsync(self, repo: str) -> List[dict]:
+        pullRequests = await self.pullrequestClient.getDeserializedDatasetAsync(self._asyncClient(self.pullrequestClient), repo=repo, project=self.project,
+                                                                                changedSince=self._changedSince(self._repoScope(repo), 'pullrequests'))
+        self._registerPullRequestSubmitters(pullRequests)
+
+        return pullRequests
+
+    async def _getPullRequestCommitsAsync(self, **kwargs) -> List[dict]:
+        RepoInsightsManager.checkRequiredKwargs({'repo', 'entitlements', 'pullRequest'}, **kwargs)
+
+        records = await self.commitsByPullrequestClient.getDeserializedDatasetAsync(self._asyncClient(self.commitsByPullrequestClient), repo=kwargs['repo'], project=self.project,
+                                                                                    entitlements=kwargs['entitlements'], pullRequestId=kwargs['pullRequest']['pullRequestId'],
+                                                                                    immutable=self._isCompleted(kwargs['pullRequest']))
+
+        return self._stampPullRequest(records, kwargs['pullRequest'])
+
+    async def _getPullRequestCommentsAsync(self, **kwargs) -> List[dict]:
+        RepoInsightsManager.checkRequiredKwargs({'repo', 'pullRequest'}, **kwargs)
+
+        if self._threadsOutsideWindow(kwargs['pullRequest']):
+            return []
+
+        records = await self.pullRequestCommentsClient.getDeserializedDatasetAsync(self._asyncClient(self.pullRequestCommentsClient), project=self.project, repo=kwargs['repo'],
+                                                                                   pullRequestId=kwargs['pullRequest']['pullRequestId'], immutable=self._isCompleted(kwargs['pullRequest']))
+
+        return self._stampPullRequest(records, kwargs['pullRequest'])
+
+    async def _getProjectWorkitemsAsync(self) -> List[dict]:
+        if self.teamId is None or self.project is None:
+            raise ValueError('required arguments missing exception: teamId, project')
+
+        if len(self.repos) == 0:
+            return []
+
+        return await self.workitemsClient.getDeserializedDatasetAsync(self._asyncClient(self.workitemsClient), teamId=self.teamId, project=self.project, repo=self.repos[0],
+                                                                      pullRequestSubmitters=PullRequestIndex(self.repoPullRequestSubmitters), changedSince=self._changedSince(self._workitemScope(), 'workitems'))
+
+    async def _loadProjectEntitlementsAsync(self) -> Dict[str, str]:
+        storedEntitlements = self._loadStoredEntitlements()
+
+        if storedEntitlements is not None:
+            return storedEntitlements
+
+        scopeDescriptor = None
+        principalNames = None
+
+        if self.settings.entitlementsScope != 'org':
+            projectId = await self.projectMembersClient.getProjectIdAsync(self._asyncClient(self.projectMembersClient), self.project)
+            scopeDescriptor = await self.entitlementsClient.getScopeDescriptorAsync(self._asyncClient(self.entitlementsClient), projectId)
+
+        if self.settings.entitlementsScope == 'team':
+            members = self.projectMembersClient.iterDeserializedDatasetAsync(self._asyncClient(self.projectMembersClient), project=self.project, teamId=self.teamId)
+            principalNames = {member['principalName'].lower() async for member in members}
 
-        return entitlementsList[0] if len(entitlementsList) > 0 else {}
+        return self._storeEntitlements(await self.entitlementsClient.getDeserializedDatasetAsync(self._asyncClient(self.entitlementsClient), scopeDescriptor=scopeDescriptor, principalNames=principalNames))
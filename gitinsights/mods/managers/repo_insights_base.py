@@ -1,28 +1,74 @@
 import abc
+import asyncio
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import repeat
+from typing import Any
+from typing import Callable
+from typing import ContextManager
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Mapping
+from typing import Optional
 from typing import Set
+from typing import Union
 
 import pandas as pd
 import requests
 from dateutil import parser
-from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from urllib3.util.retry import Retry
 
+from ..event_log import EventLog
+from ..event_log import EventLogWriter
+from ..identity import IdentityIndex
+from ..incremental import INCREMENTAL_GRAIN
+from ..incremental import IncrementalStateStore
+from ..incremental import finalizeAggregates
+from ..incremental import mergePartialAggregates
+from ..incremental import partialAggregates
+from ..instrumentation import Instrumentation
+from ..records import ColumnarRecordBuilder
+from ..report_store import reportSchema
+from ..response_cache import ResponseCache
+from ..rollup import rollup
+from ..sketches import SKETCH_SUFFIX
+from ..sketches import QuantileMeasure
+from ..sketches import namedAggregations
+from ..streaming import DEFAULT_CHUNK_SIZE
+from ..streaming import StreamingAggregator
+from ..timestamps import deriveTimestampFields
+from ..transport import CONTINUATION_TOKEN_HEADER
+from ..transport import HostConcurrencyLimiter
+from ..transport import PooledHTTPAdapter
+from ..transport import PooledTransport
+
 
 # Base Class For Git Insights
 class RepoInsightsManager(abc.ABC):
-    def __init__(self, organization: str, project: str, repos: List[str], teamId: str, patToken: str, defaultEntitlements: Dict[str, str] = None):
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, organization: str, project: str, repos: List[str], teamId: str, patToken: str, defaultEntitlements: Dict[str, str] = None, maxWorkers: int = 1,
+                 incrementalStore: IncrementalStateStore = None, instrumentation: Instrumentation = None, eventLog: EventLog = None):
         if defaultEntitlements is None:
             defaultEntitlements = {}
 
+        # an incremental run only collects the changed events, replaying them would not rebuild the report
+        if eventLog is not None and incrementalStore is not None:
+            raise ValueError('Incremental runs only collect the changed events, which can not be spilled to an event log')
+
         self.organization: str = organization
         self.project: str = project
         self.repos: List[str] = repos
         self.teamId: str = teamId
         self.patToken = patToken
         self.defaultEntitlements = defaultEntitlements
+        self.maxWorkers = maxWorkers
+        self.incrementalStore: Optional[IncrementalStateStore] = incrementalStore
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
+        self.eventLog: Optional[EventLog] = eventLog
 
         super().__init__()
 
@@ -41,6 +87,10 @@ class RepoInsightsManager(abc.ABC):
         if not requiredKeys <= kwargs.keys():
             raise ValueError("missing required arguments exception: {}".format(requiredKeys))
 
+    # Profiles of the project members, loaded up front by a sharded driver to hand them to every project of the org
+    def loadEntitlements(self) -> Dict[str, str]:
+        return self._loadProjectEntitlements()
+
     @abc.abstractmethod
     def _loadProjectEntitlements(self) -> Dict[str, str]:
         pass
@@ -61,40 +111,249 @@ class RepoInsightsManager(abc.ABC):
     def _getProjectWorkitems(self) -> List[dict]:
         raise NotImplementedError("Please Implement method getProjectWorkitems")
 
+    @property
+    @abc.abstractmethod
+    def _reportableFields(self) -> Dict[str, dict]:
+        raise NotImplementedError("Please Implement property reportableFields")
+
     @abc.abstractmethod
     def AggregationMeasures(self) -> dict:
         raise NotImplementedError("Please Implement method aggregationMeasures")
 
+    async def _loadProjectEntitlementsAsync(self) -> Dict[str, str]:
+        raise NotImplementedError("Please Implement method loadProjectEntitlementsAsync")
+
+    async def _getRepoPullRequestsAsync(self, repo: str) -> List[dict]:
+        raise NotImplementedError("Please Implement method getRepoPullRequestsAsync")
+
+    async def _getPullRequestCommitsAsync(self, **kwargs) -> List[dict]:
+        raise NotImplementedError("Please Implement method getPullRequestCommitsAsync")
+
+    async def _getPullRequestCommentsAsync(self, **kwargs) -> List[dict]:
+        raise NotImplementedError("Please Implement method getPullRequestCommentsAsync")
+
+    async def _getProjectWorkitemsAsync(self) -> List[dict]:
+        raise NotImplementedError("Please Implement method getProjectWorkitemsAsync")
+
+    def _saveIncrementalState(self, store: IncrementalStateStore) -> None:
+        pass
+
+    def ReportSchema(self) -> Dict[str, str]:
+        return reportSchema(self._reportableFields)
+
     def aggregatePullRequestActivity(self, groupByColumns: List[str]) -> pd.DataFrame:
-        return self.collectPullRequestActivity().groupby(groupByColumns).agg(self.AggregationMeasures())
+        return self.aggregateEvents(self.collectPullRequestActivity(), groupByColumns)
 
-    def collectPullRequestActivity(self) -> pd.DataFrame:
-        recordList = []
+    def aggregateEvents(self, events: pd.DataFrame, groupByColumns: List[str]) -> pd.DataFrame:
+        # lets a caller keep the collected events around, such as to write them out next to the report
+        return self._stage('aggregate', self._aggregate, events, groupByColumns)
+
+    def rollupPullRequestActivity(self, grains: Dict[str, List[str]]) -> Dict[str, pd.DataFrame]:
+        return self.rollupEvents(self.collectPullRequestActivity(), grains)
+
+    def rollupEvents(self, events: pd.DataFrame, grains: Dict[str, List[str]]) -> Dict[str, pd.DataFrame]:
+        return self._stage('rollup', self._rollup, events, grains)
+
+    def _rollup(self, events: pd.DataFrame, grains: Dict[str, List[str]]) -> Dict[str, pd.DataFrame]:
+        if self.incrementalStore is not None:
+            raise ValueError('Rollups are computed from the full events, they are not supported by incremental collection')
+
+        # the org, project and team a manager collects are the same for every event
+        scopeColumns = {'organization': self.organization, 'project': self.project, 'team': self.teamId}
+        requestedColumns = {column for columns in grains.values() for column in columns}
+        events = events.assign(**{column: pd.Categorical([value] * len(events)) for column, value in scopeColumns.items() if column in requestedColumns and column not in events})
+
+        return rollup(events, grains, self.AggregationMeasures())
+
+    async def aggregatePullRequestActivityAsync(self, groupByColumns: List[str]) -> pd.DataFrame:
+        return self._stage('aggregate', self._aggregate, await self.collectPullRequestActivityAsync(), groupByColumns)
+
+    def _aggregate(self, events: pd.DataFrame, groupByColumns: List[str]) -> pd.DataFrame:
+        if self.incrementalStore is not None:
+            return self._aggregateIncrementally(self.incrementalStore, events, groupByColumns)
+
+        # only the key combinations present in the events, rather than every combination of the categories
+        return events.groupby(groupByColumns, observed=True).agg(**namedAggregations(self.AggregationMeasures()))
+
+    def _stage(self, name: str, collect: Callable[..., Any], *args, **kwargs) -> Any:
+        with self.instrumentation.stage(name) as stage:
+            result = collect(*args, **kwargs)
+            stage.addRecords(len(result))
+
+        return result
 
+    async def _stageAsync(self, name: str, collect: Callable[..., Any], *args, **kwargs) -> Any:
+        with self.instrumentation.stage(name) as stage:
+            result = await collect(*args, **kwargs)
+            stage.addRecords(len(result))
+
+        return result
+
+    def _aggregateIncrementally(self, store: IncrementalStateStore, deltaEvents: pd.DataFrame, groupByColumns: List[str]) -> pd.DataFrame:
+        if not set(groupByColumns) <= set(INCREMENTAL_GRAIN):
+            raise ValueError("Incremental aggregation only supports grouping by a subset of {}".format(INCREMENTAL_GRAIN))
+
+        measures = self.AggregationMeasures()
+        previousPartials = store.loadAggregates()
+
+        if not previousPartials.empty and not set(INCREMENTAL_GRAIN) <= set(previousPartials.columns):
+            raise ValueError("The persisted aggregates predate the {} grain, clear the incremental state to rebuild them".format(INCREMENTAL_GRAIN))
+
+        sketchColumns = {aggFunction.source + SKETCH_SUFFIX for aggFunction in measures.values() if isinstance(aggFunction, QuantileMeasure)}
+
+        if not previousPartials.empty and not sketchColumns <= set(previousPartials.columns):
+            raise ValueError("The persisted aggregates predate the quantile measures, clear the incremental state to rebuild them")
+
+        partials = mergePartialAggregates(previousPartials, partialAggregates(deltaEvents, INCREMENTAL_GRAIN, measures))
+        store.saveAggregates(partials)
+        # watermarks only move forward once the merged aggregates are safely persisted
+        self._saveIncrementalState(store)
+
+        return finalizeAggregates(partials, groupByColumns, measures)
+
+    def _validateCollectionSettings(self) -> None:
         if not self.repos:
             raise TypeError("Repo list is empty")
 
         if not self.patToken:
             raise TypeError("Unable to resolve the PAT token: {}".format(self.patToken))
 
-        entitlements = {**self._loadProjectEntitlements(), **self.defaultEntitlements}
+    def collectPullRequestActivity(self) -> pd.DataFrame:
+        return self._stage('collect', self._collectPullRequestActivity)
+
+    def _eventLogWriter(self) -> ContextManager[Optional[EventLogWriter]]:
+        if self.eventLog is None:
+            return nullcontext()
+
+        return self.eventLog.writer({'organization': self.organization, 'project': self.project, 'repos': self.repos, 'teamId': self.teamId,
+                                     'collectedAt': datetime.datetime.now(datetime.timezone.utc).isoformat()})
+
+    def _collectPullRequestActivity(self) -> pd.DataFrame:
+        self._validateCollectionSettings()
+
+        with self._eventLogWriter() as eventLogWriter:
+            recordList = ColumnarRecordBuilder(self._reportableFields, eventLogWriter)
+            self._collectRecords(recordList)
+
+        return self._stage('frame', self._toDataFrame, recordList)
+
+    def _collectRecords(self, recordList: Union[ColumnarRecordBuilder, StreamingAggregator]) -> None:
+        # resolves commit authors for every pull request of the run
+        entitlements = IdentityIndex(self._stage('entitlements', self._loadProjectEntitlements), self.defaultEntitlements)
+
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) if self.maxWorkers > 1 else nullcontext() as executor:
+            for repo in self.repos:
+                pullRequests = self._stage('pull_requests', self._getRepoPullRequests, repo)
+                recordList.extend(pullRequests)
+                submittedPullRequests = [filtered_pr for filtered_pr in pullRequests if filtered_pr.get('prs_submitted') == 1]
+
+                # executor.map yields results in submission order so the output matches the serial path
+                activityMapper = executor.map if executor is not None else map
+
+                for records in activityMapper(self._getPullRequestActivity, repeat(entitlements), submittedPullRequests, repeat(repo)):
+                    recordList.extend(records)
+
+        recordList.extend(self._stage('workitems', self._getProjectWorkitems))
+
+    def aggregatePullRequestActivityStreaming(self, groupByColumns: List[str], chunkSize: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+        return self._stage('aggregate', self._aggregateStreaming, groupByColumns, chunkSize)
+
+    def _streamingAggregator(self, groupByColumns: List[str], chunkSize: int, sink: Optional[EventLogWriter]) -> StreamingAggregator:
+        if self.incrementalStore is not None:
+            raise ValueError('Streaming aggregation is not supported by incremental collection')
+
+        self._validateCollectionSettings()
+
+        return StreamingAggregator(self._reportableFields, groupByColumns, self.AggregationMeasures(), self._toDataFrame, chunkSize, sink)
+
+    def _aggregateStreaming(self, groupByColumns: List[str], chunkSize: int) -> pd.DataFrame:
+        with self._eventLogWriter() as eventLogWriter:
+            aggregator = self._streamingAggregator(groupByColumns, chunkSize, eventLogWriter)
+            self._collectRecords(aggregator)
+
+        return aggregator.result(self._categoricalFields())
+
+    def replayPullRequestActivity(self) -> pd.DataFrame:
+        return self._stage('replay', self._replayPullRequestActivity)
+
+    def _replayPullRequestActivity(self) -> pd.DataFrame:
+        if self.eventLog is None:
+            raise ValueError('Replaying the pull request activity requires an event log')
+
+        # the logged records go through the same frame building as a collection, without any request
+        recordList = ColumnarRecordBuilder(self._reportableFields)
+        recordList.extend(self.eventLog.records())
+
+        return self._stage('frame', self._toDataFrame, recordList)
+
+    def aggregateReplayedActivity(self, groupByColumns: List[str]) -> pd.DataFrame:
+        return self.aggregateEvents(self.replayPullRequestActivity(), groupByColumns)
+
+    def _toDataFrame(self, recordList: ColumnarRecordBuilder) -> pd.DataFrame:
+        frame = deriveTimestampFields(recordList.toDataFrame(), self._reportableFields)
+        # the contributor and repo keys repeat across every event, as categoricals each value is stored once and
+        # the aggregation groups on their integer codes
+        categoricalFields = [field for field in self._categoricalFields() if field in frame]
+
+        return frame.astype(dict.fromkeys(categoricalFields, 'category'))
+
+    def _categoricalFields(self) -> List[str]:
+        return [field for field, dtype in self.ReportSchema().items() if dtype == 'category']
+
+    def _getPullRequestActivity(self, entitlements: IdentityIndex, pullRequest: dict, repo: str) -> List[dict]:
+        return self._stage('pr_commits', self._getPullRequestCommits, entitlements=entitlements, pullRequest=pullRequest, repo=repo) \
+            + self._stage('pr_comments', self._getPullRequestComments, pullRequest=pullRequest, repo=repo)
+
+    async def collectPullRequestActivityAsync(self) -> pd.DataFrame:
+        return await self._stageAsync('collect', self._collectPullRequestActivityAsync)
+
+    async def _collectPullRequestActivityAsync(self) -> pd.DataFrame:
+        self._validateCollectionSettings()
+
+        with self._eventLogWriter() as eventLogWriter:
+            recordList = ColumnarRecordBuilder(self._reportableFields, eventLogWriter)
+            await self._collectRecordsAsync(recordList)
+
+        return self._stage('frame', self._toDataFrame, recordList)
+
+    async def _collectRecordsAsync(self, recordList: Union[ColumnarRecordBuilder, StreamingAggregator]) -> None:
+        entitlements = IdentityIndex(await self._stageAsync('entitlements', self._loadProjectEntitlementsAsync), self.defaultEntitlements)
 
         for repo in self.repos:
-            pullRequests = self._getRepoPullRequests(repo)
+            pullRequests = await self._stageAsync('pull_requests', self._getRepoPullRequestsAsync, repo)
             recordList.extend(pullRequests)
+            submittedPullRequests = [filtered_pr for filtered_pr in pullRequests if filtered_pr.get('prs_submitted') == 1]
+
+            # gather returns results in argument order so the output matches the sync path
+            for records in await asyncio.gather(*(self._getPullRequestActivityAsync(entitlements, pr, repo) for pr in submittedPullRequests)):
+                recordList.extend(records)
+
+        recordList.extend(await self._stageAsync('workitems', self._getProjectWorkitemsAsync))
+
+    async def aggregatePullRequestActivityStreamingAsync(self, groupByColumns: List[str], chunkSize: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+        return await self._stageAsync('aggregate', self._aggregateStreamingAsync, groupByColumns, chunkSize)
+
+    async def _aggregateStreamingAsync(self, groupByColumns: List[str], chunkSize: int) -> pd.DataFrame:
+        with self._eventLogWriter() as eventLogWriter:
+            aggregator = self._streamingAggregator(groupByColumns, chunkSize, eventLogWriter)
+            await self._collectRecordsAsync(aggregator)
 
-            for pr in [filtered_pr for filtered_pr in pullRequests if filtered_pr['prs_submitted'] == 1]:
-                recordList.extend(self._getPullRequestCommits(entitlements=entitlements, pullRequest=pr, repo=repo))
-                recordList.extend(self._getPullRequestComments(pullRequest=pr, repo=repo))
+        return aggregator.result(self._categoricalFields())
 
-        recordList.extend(self._getProjectWorkitems())
+    async def _getPullRequestActivityAsync(self, entitlements: IdentityIndex, pullRequest: dict, repo: str) -> List[dict]:
+        commits, comments = await asyncio.gather(self._stageAsync('pr_commits', self._getPullRequestCommitsAsync, entitlements=entitlements, pullRequest=pullRequest, repo=repo),
+                                                 self._stageAsync('pr_comments', self._getPullRequestCommentsAsync, pullRequest=pullRequest, repo=repo))
 
-        return pd.DataFrame(recordList)
+        return commits + comments
 
 
 class ApiClient(abc.ABC):
     # pylint: disable=too-many-instance-attributes
-    def __init__(self, organization: str, baseUrl: str, version: str, patToken: str, reportableFieldDefaults: dict, retry_count: int = 3, retry_backoff_factor: float = 1, default_timeout: float = 5):
+    # json.loads options the pages of a client are decoded with
+    pageDecodeOptions: Dict[str, Any] = {}
+
+    def __init__(self, organization: str, baseUrl: str, version: str, patToken: str, reportableFieldDefaults: dict, retry_count: int = 3, retry_backoff_factor: float = 1, default_timeout: float = 5,
+                 concurrencyLimiter: HostConcurrencyLimiter = None, transport: PooledTransport = None, scheme: str = 'https', responseCache: ResponseCache = None, instrumentation: Instrumentation = None):
         self.organization: str = organization
         self.baseUrl = baseUrl.lstrip('https://')
         self.version = version
@@ -104,9 +363,14 @@ class ApiClient(abc.ABC):
         self.retry_count = retry_count
         self.retry_backoff_factor = retry_backoff_factor
         self.default_timeout = default_timeout
+        self.concurrencyLimiter: Optional[HostConcurrencyLimiter] = concurrencyLimiter
+        self.transport: PooledTransport = transport or PooledTransport()
+        self.scheme = scheme
+        self.responseCache: Optional[ResponseCache] = responseCache
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
 
     def uri(self, resourcePath: str, parameters: Dict[str, str]) -> str:
-        uri_str = "https://{}/{}?".format(self.baseUrl, resourcePath)
+        uri_str = "{}://{}/{}?".format(self.scheme, self.baseUrl, resourcePath)
         if 'api-version' not in parameters:
             parameters['api-version'] = self.version
 
@@ -125,19 +389,119 @@ class ApiClient(abc.ABC):
             backoff_factor=self.retry_backoff_factor,
             status_forcelist=self.retry_status_force_response_codes
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        adapter = PooledHTTPAdapter(max_retries=retry, pool_maxsize=self.transport.poolSize)
         session.mount('http://', adapter)
         session.mount('https://', adapter)
 
         return session
 
-    def sendGetRequest(self, resourcePath: str, parameters: Dict[str, str]) -> requests.Response:
-        return self.requests_retry_session()\
-            .get(self.uri(resourcePath, parameters), auth=HTTPBasicAuth('', self.patToken), timeout=self.default_timeout)
+    def session(self) -> requests.Session:
+        return self.transport.session(self.baseUrl, self.requests_retry_session)
+
+    def requestSlot(self) -> ContextManager:
+        return self.concurrencyLimiter.acquire(self.baseUrl) if self.concurrencyLimiter is not None else nullcontext()
+
+    def sendGetRequest(self, resourcePath: str, parameters: Dict[str, str], maxAge: datetime.timedelta = None) -> requests.Response:
+        url = self.uri(resourcePath, parameters)
+        cachedEntry = None
+
+        if self.responseCache is not None:
+            cachedResponse, cachedEntry = self.responseCache.lookup(url, maxAge)
+
+            if cachedResponse is not None:
+                return cachedResponse
+
+        with self.requestSlot():
+            started = time.perf_counter()
+            response = None
+
+            try:
+                response = self.session()\
+                    .get(url, headers=cachedEntry.conditionalHeaders() if cachedEntry else None, auth=HTTPBasicAuth('', self.patToken), timeout=self.default_timeout)
+            finally:
+                self.recordRequest('GET', started, response)
+
+            self.observeThrottling(response)
+
+        if self.responseCache is not None:
+            if response.status_code == 304 and cachedEntry is not None:
+                return self.responseCache.revalidated(url, cachedEntry, maxAge)
+
+            self.responseCache.store(url, response.status_code, response.headers, response.content, maxAge)
+
+        return response
 
     def sendPostRequest(self, resourcePath: str, postBody: Dict[str, str], parameters: Dict[str, str]) -> requests.Response:
-        return self.requests_retry_session()\
-            .post(self.uri(resourcePath, parameters), json=postBody, auth=HTTPBasicAuth('', self.patToken), timeout=self.default_timeout)
+        with self.requestSlot():
+            started = time.perf_counter()
+            response = None
+
+            try:
+                response = self.session()\
+                    .post(self.uri(resourcePath, parameters), json=postBody, auth=HTTPBasicAuth('', self.patToken), timeout=self.default_timeout)
+            finally:
+                self.recordRequest('POST', started, response)
+
+            self.observeThrottling(response)
+
+        return response
+
+    def recordRequest(self, method: str, started: float, response: Optional[requests.Response]) -> None:
+        if not self.instrumentation.enabled:
+            return
+
+        # urllib3 keeps the status of every retried attempt on the final response, requests that raised have none
+        retries = getattr(response.raw, 'retries', None) if response is not None else None
+        requestBody = response.request.body if response is not None and response.request is not None else None
+
+        self.instrumentation.recordRequest(self.baseUrl, method, response.status_code if response is not None else None, time.perf_counter() - started, len(requestBody or b''),
+                                           len(response.content) if response is not None else 0, [attempt.status for attempt in retries.history] if retries is not None else [])
+
+    def observeThrottling(self, response: requests.Response) -> None:
+        # fed back while the request still holds its slot, so the next request already sees the adjusted window
+        if self.concurrencyLimiter is None:
+            return
+
+        retries = getattr(response.raw, 'retries', None)
+        self.concurrencyLimiter.observe(self.baseUrl, response.status_code, response.headers, [attempt.status for attempt in retries.history] if retries is not None else [])
+
+    def deserialize(self, deserializer: Callable[..., Any], *args) -> Any:
+        if not self.instrumentation.enabled:
+            return deserializer(*args)
+
+        started = time.perf_counter()
+        records = deserializer(*args)
+        self.instrumentation.recordDeserialization(type(self).__name__, time.perf_counter() - started, len(records))
+
+        return records
+
+    @staticmethod
+    def nextPageParameters(parameters: Dict[str, str], page: List[dict], response: Any, skipParameter: str = '$skip', topParameter: str = '$top') -> Optional[Dict[str, str]]:
+        headers = getattr(response, 'headers', None)
+        continuationToken = headers.get(CONTINUATION_TOKEN_HEADER) if isinstance(headers, Mapping) else None
+        nextParameters = dict(parameters)
+
+        # endpoints that hand out a continuation token page by it, the others page by $skip until a short page comes back
+        if continuationToken:
+            nextParameters['continuationToken'] = continuationToken
+        elif topParameter in parameters and len(page) > 0 and len(page) == int(parameters[topParameter]):
+            nextParameters[skipParameter] = str(int(parameters.get(skipParameter, '0')) + len(page))
+        else:
+            return None
+
+        return nextParameters
+
+    def iterPages(self, getPage: Callable[[Dict[str, str]], requests.Response], parameters: Dict[str, str], skipParameter: str = '$skip', topParameter: str = '$top') -> Iterator[List[dict]]:
+        nextParameters: Optional[Dict[str, str]] = dict(parameters)
+
+        while nextParameters is not None:
+            pageParameters = nextParameters
+            response = getPage(dict(pageParameters))
+            page = response.json(**self.pageDecodeOptions)['value']
+
+            yield page
+
+            nextParameters = ApiClient.nextPageParameters(pageParameters, page, response, skipParameter, topParameter)
 
     @abc.abstractmethod
     def getDeserializedDataset(self, **kwargs) -> List[dict]:
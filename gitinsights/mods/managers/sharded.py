@@ -0,0 +1,166 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import pandas as pd
+
+from ...mods.instrumentation import MetricsInstrumentation
+from ...mods.managers.ado import AzureDevopsClientManager
+from ...mods.managers.ado import CollectionSettings
+from ...mods.managers.repo_insights_base import RepoInsightsManager
+from ...mods.rollup import rollup
+from ...mods.sketches import namedAggregations
+from ...mods.transport import SharedConcurrencyLimiter
+
+
+# One org, project, repos and backlog team collected by a single manager
+class CollectionTarget(NamedTuple):
+    organization: str
+    project: str
+    repos: List[str]
+    teamId: str
+
+
+# Request semaphores of every org, shared by all the worker processes of a driver
+_orgSemaphores: Dict[str, Any] = {}
+
+
+def _initializeWorker(orgSemaphores: Dict[str, Any]) -> None:
+    _orgSemaphores.clear()
+    _orgSemaphores.update(orgSemaphores)
+
+
+def _manager(managerFactory: Callable[..., RepoInsightsManager], target: CollectionTarget, patToken: str, profileAliases: Optional[Dict[str, str]], settings: CollectionSettings,
+             **kwargs) -> RepoInsightsManager:
+    orgSemaphore = _orgSemaphores.get(target.organization)
+    concurrencyLimiter = SharedConcurrencyLimiter(orgSemaphore, settings.maxConcurrentRequestsPerHost) if orgSemaphore is not None else None
+
+    return managerFactory(target.organization, target.project, target.repos, target.teamId, patToken, profileAliases, settings=settings, concurrencyLimiter=concurrencyLimiter, **kwargs)
+
+
+def _workerSettings(settings: CollectionSettings, instrumented: bool) -> Tuple[CollectionSettings, Optional[MetricsInstrumentation]]:
+    # the metrics of a worker are recorded apart and handed back along with its result, to be merged by the driver
+    instrumentation = MetricsInstrumentation() if instrumented else None
+
+    return settings._replace(instrumentation=instrumentation), instrumentation
+
+
+def _loadOrgEntitlements(managerFactory: Callable[..., RepoInsightsManager], target: CollectionTarget, patToken: str, profileAliases: Optional[Dict[str, str]], settings: CollectionSettings,
+                         instrumented: bool) -> Tuple[Dict[str, str], Optional[MetricsInstrumentation]]:
+    settings, instrumentation = _workerSettings(settings, instrumented)
+
+    return _manager(managerFactory, target, patToken, profileAliases, settings).loadEntitlements(), instrumentation
+
+
+def _collectTarget(managerFactory: Callable[..., RepoInsightsManager], target: CollectionTarget, patToken: str, profileAliases: Optional[Dict[str, str]], settings: CollectionSettings,
+                   orgEntitlements: Optional[Dict[str, str]], instrumented: bool) -> Tuple[pd.DataFrame, Optional[MetricsInstrumentation]]:
+    settings, instrumentation = _workerSettings(settings, instrumented)
+    events = _manager(managerFactory, target, patToken, profileAliases, settings, orgEntitlements=orgEntitlements).collectPullRequestActivity()
+
+    return events.assign(organization=target.organization, project=target.project, team=target.teamId), instrumentation
+
+
+# Collects many projects, possibly across orgs, in a pool of worker processes and merges their events into one
+# report. The org profiles are downloaded once per org and handed to every project of the org, and the requests
+# in flight against an org are capped across all the workers so the projects of one org don't add up to a
+# throttled PAT. The profile aliases and collection settings are passed through to every manager. The metrics
+# recorded by the workers are merged into the MetricsInstrumentation of the settings.
+# pylint: disable=too-many-instance-attributes
+class ShardedCollectionDriver:
+    def __init__(self, targets: List[CollectionTarget], patTokens: Union[str, Dict[str, str]], maxProcesses: int = None, maxConcurrentRequestsPerOrg: int = 8,
+                 managerFactory: Callable[..., RepoInsightsManager] = AzureDevopsClientManager, settings: CollectionSettings = None, profileAliases: Dict[str, str] = None):
+        settings = settings or CollectionSettings()
+
+        if not targets:
+            raise TypeError("Target list is empty")
+
+        if maxConcurrentRequestsPerOrg < 1:
+            raise ValueError('maxConcurrentRequestsPerOrg must be at least 1')
+
+        # the partial aggregates and watermarks of an incremental store belong to a single target
+        if settings.incrementalStore is not None:
+            raise ValueError('Incremental collection is not supported across sharded targets')
+
+        # as would the records of every target spilled to the one event log
+        if settings.eventLog is not None:
+            raise ValueError('Event logs are not supported across sharded targets')
+
+        self.targets: List[CollectionTarget] = [CollectionTarget(*target) for target in targets]
+        self.organizations: List[str] = list(dict.fromkeys(target.organization for target in self.targets))
+        self.patTokens: Dict[str, str] = patTokens if isinstance(patTokens, dict) else {organization: patTokens for organization in self.organizations}
+        self.maxProcesses = maxProcesses or min(len(self.targets), multiprocessing.cpu_count())
+        self.maxConcurrentRequestsPerOrg = maxConcurrentRequestsPerOrg
+        self.managerFactory = managerFactory
+        self.instrumentation: Optional[MetricsInstrumentation] = settings.instrumentation if isinstance(settings.instrumentation, MetricsInstrumentation) else None
+        # the workers record their metrics apart, rather than into unpickled copies of the driver's
+        self.settings = settings._replace(instrumentation=None)
+        self.profileAliases = profileAliases
+
+        missingTokens = [organization for organization in self.organizations if not self.patTokens.get(organization)]
+
+        if missingTokens:
+            raise TypeError("Unable to resolve the PAT token of the orgs: {}".format(', '.join(missingTokens)))
+
+    def _executor(self) -> ProcessPoolExecutor:
+        orgSemaphores = {organization: multiprocessing.BoundedSemaphore(self.maxConcurrentRequestsPerOrg) for organization in self.organizations}
+
+        return ProcessPoolExecutor(max_workers=self.maxProcesses, initializer=_initializeWorker, initargs=(orgSemaphores,))
+
+    def _sharesOrgEntitlements(self) -> bool:
+        # project and team scoped profiles differ per target
+        return self.settings.entitlementsScope == 'org'
+
+    def _mergeMetrics(self, results: List[tuple]) -> list:
+        for _, metrics in results:
+            if metrics is not None and self.instrumentation is not None:
+                self.instrumentation.merge(metrics)
+
+        return [result for result, _ in results]
+
+    def collectPullRequestActivity(self) -> pd.DataFrame:
+        instrumented = self.instrumentation is not None
+
+        with self._executor() as executor:
+            orgEntitlements: Dict[str, Optional[Dict[str, str]]] = dict.fromkeys(self.organizations)
+
+            if self._sharesOrgEntitlements():
+                firstTargets = [next(target for target in self.targets if target.organization == organization) for organization in self.organizations]
+                entitlements = executor.map(_loadOrgEntitlements, repeat(self.managerFactory), firstTargets, [self.patTokens[target.organization] for target in firstTargets], repeat(self.profileAliases),
+                                            repeat(self.settings), repeat(instrumented))
+                orgEntitlements = dict(zip(self.organizations, self._mergeMetrics(list(entitlements))))
+
+            # executor.map yields the frames in target order so the merged report is stable across runs
+            frames = self._mergeMetrics(list(executor.map(_collectTarget, repeat(self.managerFactory), self.targets, [self.patTokens[target.organization] for target in self.targets],
+                                                          repeat(self.profileAliases), repeat(self.settings), [orgEntitlements[target.organization] for target in self.targets], repeat(instrumented))))
+
+        # pd.concat falls back to plain values for categoricals whose categories differ between the targets
+        categoricalColumns = {column for frame in frames for column in frame.select_dtypes('category').columns}
+
+        return pd.concat(frames, ignore_index=True).astype(dict.fromkeys(sorted(categoricalColumns) + ['organization', 'project', 'team'], 'category'))
+
+    def _referenceManager(self) -> RepoInsightsManager:
+        # the reportable fields are the same for every target
+        return self.managerFactory(*self.targets[0], self.patTokens[self.targets[0].organization], self.profileAliases, settings=self.settings)
+
+    def ReportSchema(self) -> Dict[str, str]:
+        return {**self._referenceManager().ReportSchema(), 'organization': 'category', 'project': 'category', 'team': 'category'}
+
+    def aggregatePullRequestActivity(self, groupByColumns: List[str]) -> pd.DataFrame:
+        return self.aggregateEvents(self.collectPullRequestActivity(), groupByColumns)
+
+    def aggregateEvents(self, events: pd.DataFrame, groupByColumns: List[str]) -> pd.DataFrame:
+        return events.groupby(groupByColumns, observed=True).agg(**namedAggregations(self._referenceManager().AggregationMeasures()))
+
+    def rollupPullRequestActivity(self, grains: Dict[str, List[str]]) -> Dict[str, pd.DataFrame]:
+        return self.rollupEvents(self.collectPullRequestActivity(), grains)
+
+    def rollupEvents(self, events: pd.DataFrame, grains: Dict[str, List[str]]) -> Dict[str, pd.DataFrame]:
+        return rollup(events, grains, self._referenceManager().AggregationMeasures())
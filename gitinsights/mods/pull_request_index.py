@@ -0,0 +1,80 @@
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Mapping
+from typing import Tuple
+
+import pandas as pd
+
+from .timestamps import parseTimestamps
+
+# vstfs:///Git/PullRequestId/[ProjectId]%2F[RepoId]%2F[PullRequestId]
+PULL_REQUEST_LINK_DELIMITER = '%2f'
+# Reasons a work item link to a pull request can't be resolved
+MALFORMED_LINK = 'malformed_url'
+UNKNOWN_REPO = 'unknown_repo'
+UNKNOWN_PULL_REQUEST = 'unknown_pull_request'
+
+
+def isPullRequestLink(relation: dict) -> bool:
+    return relation['rel'] == 'ArtifactLink' and 'url' in relation and relation['attributes'].get('name') == 'Pull Request' and 'resourceCreatedDate' in relation['attributes']
+
+
+# Resolves the pull requests linked from work items to their submitters. Built once per run from the submitters of
+# the collected pull requests (carried over between incremental runs), so resolving a link is a single probe keyed
+# by (repo id, pull request id).
+class PullRequestIndex(Mapping[Tuple[str, int], str]):
+    def __init__(self, pullRequestSubmitters: Mapping[str, Mapping[int, str]] = None):
+        self._submitters: Dict[Tuple[str, int], str] = {}
+        self._repoIds = set()
+
+        for repoId, submitters in (pullRequestSubmitters or {}).items():
+            self._repoIds.add(repoId.lower())
+
+            for pullRequestId, contributor in submitters.items():
+                self._submitters[(repoId.lower(), int(pullRequestId))] = contributor
+
+    @staticmethod
+    def of(pullRequestSubmitters: Mapping) -> 'PullRequestIndex':
+        return pullRequestSubmitters if isinstance(pullRequestSubmitters, PullRequestIndex) else PullRequestIndex(pullRequestSubmitters)
+
+    def __getitem__(self, key: Tuple[str, int]) -> str:
+        return self._submitters[(key[0].lower(), key[1])]
+
+    def __iter__(self) -> Iterator[Tuple[str, int]]:
+        return iter(self._submitters)
+
+    def __len__(self) -> int:
+        return len(self._submitters)
+
+    def hasRepo(self, repoId: str) -> bool:
+        return repoId.lower() in self._repoIds
+
+    def initialPullRequests(self, workitems: List[dict]) -> Tuple[pd.DataFrame, Dict[str, int]]:
+        # Every pull request link of the given activated work items is parsed in one pass, the earliest link created
+        # after the activation of its work item is the initial pull request. Links that don't resolve are counted
+        # by reason rather than raised, cross repo links aren't collected.
+        links = pd.DataFrame([(workitem['id'], workitem['fields']['Microsoft.VSTS.Common.ActivatedDate'], relation['url'], relation['attributes']['resourceCreatedDate'])
+                              for workitem in workitems for relation in workitem.get('relations', []) if isPullRequestLink(relation)],
+                             columns=['workItemId', 'activated_date', 'url', 'pr_submission_date'])
+        unresolved = {MALFORMED_LINK: 0, UNKNOWN_REPO: 0, UNKNOWN_PULL_REQUEST: 0}
+
+        if links.empty:
+            return links.assign(contributor=pd.Series(dtype=object)), unresolved
+
+        submittedDates = parseTimestamps(links['pr_submission_date'])
+        links = links[submittedDates >= parseTimestamps(links['activated_date'])]
+        links = links.loc[submittedDates[links.index].groupby(links['workItemId'], sort=False).idxmin()]
+
+        segments = links['url'].str.lower().str.split(PULL_REQUEST_LINK_DELIMITER)
+        pullRequestIds = pd.to_numeric(segments.str[2], errors='coerce')
+        wellFormed = (segments.str.len() == 3) & pullRequestIds.notna()
+        contributors = pd.Series([self._submitters.get((repoId, int(pullRequestId))) if isWellFormed else None
+                                  for repoId, pullRequestId, isWellFormed in zip(segments.str[1], pullRequestIds.fillna(-1), wellFormed)], index=links.index, dtype=object)
+        knownRepo = pd.Series([isWellFormed and self.hasRepo(repoId) for repoId, isWellFormed in zip(segments.str[1].fillna(''), wellFormed)], index=links.index, dtype=bool)
+
+        unresolved[MALFORMED_LINK] = int((~wellFormed).sum())
+        unresolved[UNKNOWN_REPO] = int((wellFormed & ~knownRepo).sum())
+        unresolved[UNKNOWN_PULL_REQUEST] = int((knownRepo & contributors.isna()).sum())
+
+        return links.assign(contributor=contributors)[contributors.notna()], unresolved
@@ -0,0 +1,93 @@
+from array import array
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+# Widening order of a column buffer: whole numbers, then floating point, then arbitrary python objects
+INT_TYPECODE = 'q'
+FLOAT_TYPECODE = 'd'
+
+
+class _ColumnBuffer:
+    __slots__ = ('rows', 'values')
+
+    def __init__(self):
+        # the row each value belongs to, rows that never set the column get its default when materialized
+        self.rows = array(INT_TYPECODE)
+        self.values: Union[array, list] = array(INT_TYPECODE)
+
+    def append(self, row: int, value: Any) -> None:
+        try:
+            self.values.append(value)
+        except (TypeError, OverflowError):
+            self._widen(value)
+            self.values.append(value)
+
+        self.rows.append(row)
+
+    def _widen(self, value: Any) -> None:
+        if isinstance(self.values, array) and self.values.typecode == INT_TYPECODE and isinstance(value, (float, np.floating)):
+            self.values = array(FLOAT_TYPECODE, self.values)
+        else:
+            self.values = list(self.values)
+
+    def materialize(self, rowCount: int, default: Any) -> np.ndarray:
+        if isinstance(self.values, array):
+            values = np.frombuffer(self.values, dtype=np.int64 if self.values.typecode == INT_TYPECODE else np.float64)
+        else:
+            values = np.empty(len(self.values), dtype=object)
+            values[:] = self.values
+
+        # every row set the column so the buffer is handed to pandas without a copy
+        if len(self.rows) == rowCount:
+            return values
+
+        column = np.full(rowCount, default, dtype=object if values.dtype == object else np.result_type(values.dtype, np.asarray(default).dtype))
+        column[np.frombuffer(self.rows, dtype=np.int64)] = values
+
+        return column
+
+
+# Column oriented accumulator for the activity events. Records only carry the fields they set, the reportable
+# field defaults are filled in once per column when the frame is materialized. A sink, such as an event log
+# writer, is handed every record as it is appended.
+class ColumnarRecordBuilder:
+    def __init__(self, reportableFields: Dict[str, dict], sink: Any = None):
+        self.sink = sink
+        self.defaults: Dict[str, Any] = {field: settings['default'] for field, settings in reportableFields.items()}
+        self._columns: Dict[str, _ColumnBuffer] = {field: _ColumnBuffer() for field in self.defaults}
+        self._rowCount = 0
+
+    def __len__(self) -> int:
+        return self._rowCount
+
+    def append(self, record: dict) -> None:
+        row = self._rowCount
+
+        if self.sink is not None:
+            self.sink.append(record)
+
+        for field, value in record.items():
+            if field not in self._columns:
+                self._columns[field] = _ColumnBuffer()
+
+            self._columns[field].append(row, value)
+
+        self._rowCount += 1
+
+    def extend(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.append(record)
+
+    def toDataFrame(self) -> pd.DataFrame:
+        if self._rowCount == 0:
+            return pd.DataFrame()
+
+        columns = {field: buffer.materialize(self._rowCount, self.defaults.get(field, np.nan)) for field, buffer in self._columns.items()}
+
+        # object columns get the same dtype inference (strings, timestamps) a frame built from records would
+        return pd.DataFrame(columns, copy=False).infer_objects()
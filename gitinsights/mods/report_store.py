@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+from typing import Dict
+from typing import List
+from typing import Sequence
+from urllib.parse import quote
+
+import pandas as pd
+
+from .sketches import quantileMeasures
+from .timestamps import CALENDAR_DAY
+from .timestamps import CALENDAR_MONTH
+from .timestamps import CALENDAR_QUARTER
+from .timestamps import ISO_WEEK
+from .timestamps import ISO_YEAR
+from .timestamps import TIMESTAMP
+
+# Hive style partition directories, year=2021/week=202105/repo=repo1
+PARTITION_COLUMNS = ('year', 'week', 'repo')
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+MANIFEST_FILE = '_manifest.json'
+PART_FILE = 'part-0.parquet'
+
+
+# Compact dtypes of the reportable fields: counters are int32, the grouping keys are categoricals, the ISO year
+# a nullable int16 and the year-week, day, month and quarter keys nullable int32s. A field can pin its dtype with a 'dtype' setting, such as the fractional story points.
+def reportSchema(reportableFields: Dict[str, dict]) -> Dict[str, str]:
+    schema = {}
+
+    for field, settings in reportableFields.items():
+        derivation = settings.get('derived_from', (None,))[0]
+
+        if 'dtype' in settings:
+            schema[field] = settings['dtype']
+        elif settings['agg_function'] == 'sum':
+            schema[field] = 'int32'
+        elif settings['agg_function'] == 'mean':
+            schema[field] = 'float64'
+        elif derivation == ISO_YEAR:
+            schema[field] = 'Int16'
+        elif derivation in (ISO_WEEK, CALENDAR_DAY, CALENDAR_MONTH, CALENDAR_QUARTER):
+            schema[field] = 'Int32'
+        elif derivation is None:
+            schema[field] = 'category'
+        elif derivation != TIMESTAMP:
+            raise ValueError('No report dtype for the derivation {} of {}'.format(derivation, field))
+
+    for measure in quantileMeasures(reportableFields):
+        schema[measure] = 'float64'
+
+    return schema
+
+
+def applySchema(frame: pd.DataFrame, schema: Dict[str, str]) -> pd.DataFrame:
+    columns = {}
+
+    for column, dtype in schema.items():
+        if column in frame:
+            # counters default to 0, the missing counts of a sparse frame are no different
+            values = frame[column].fillna(0) if dtype.startswith('int') else frame[column]
+            columns[column] = values.astype(dtype)
+
+    return frame.assign(**columns)
+
+
+def _partitionValue(value) -> str:
+    return NULL_PARTITION if pd.isna(value) else quote(str(value), safe='')
+
+
+def _partitionHash(partition: pd.DataFrame) -> str:
+    digest = hashlib.sha256(json.dumps([[str(c), str(d)] for c, d in partition.dtypes.items()]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(partition, index=False).values.tobytes())
+
+    return digest.hexdigest()
+
+
+# Persists report frames as Parquet datasets partitioned by year, week and repo under a local directory. Every
+# dataset keeps a manifest of its partitions and their content hashes, so a rerun only rewrites the partitions
+# whose rows changed and drops those that are gone. The partition values are encoded in the directory names
+# rather than in the files, like Hive.
+class ParquetReportStore:
+    def __init__(self, directory: str, schema: Dict[str, str] = None, partitionColumns: Sequence[str] = PARTITION_COLUMNS):
+        self.directory = directory
+        self.schema: Dict[str, str] = schema or {}
+        self.partitionColumns: List[str] = list(partitionColumns)
+
+    def _datasetPath(self, dataset: str, *paths: str) -> str:
+        return os.path.join(self.directory, dataset, *paths)
+
+    def _readManifest(self, dataset: str) -> dict:
+        path = self._datasetPath(dataset, MANIFEST_FILE)
+
+        if not os.path.isfile(path):
+            return {'partitions': {}}
+
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _writeManifest(self, dataset: str, manifest: dict) -> None:
+        path = self._datasetPath(dataset, MANIFEST_FILE)
+        temporaryPath = path + '.tmp'
+
+        with open(temporaryPath, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.replace(temporaryPath, path)
+
+    def write(self, dataset: str, frame: pd.DataFrame) -> Dict[str, int]:
+        # aggregated frames carry the grouping columns in their index
+        frame = applySchema(frame.reset_index() if any(frame.index.names) else frame, self.schema)
+        missingColumns = [column for column in self.partitionColumns if column not in frame]
+
+        if missingColumns:
+            raise ValueError('The {} frame is missing the partition columns {}'.format(dataset, missingColumns))
+
+        previous = self._readManifest(dataset)['partitions']
+        partitions = {}
+        stats = {'written': 0, 'unchanged': 0, 'removed': 0}
+        os.makedirs(self._datasetPath(dataset), exist_ok=True)
+
+        for values, partition in frame.groupby(self.partitionColumns, sort=True, dropna=False, observed=True):
+            relativePath = '/'.join('{}={}'.format(column, _partitionValue(value)) for column, value in zip(self.partitionColumns, values))
+            partition = partition.drop(columns=self.partitionColumns).reset_index(drop=True)
+            contentHash = _partitionHash(partition)
+            partitions[relativePath] = {'hash': contentHash, 'rows': len(partition), 'values': [None if pd.isna(v) else str(v) for v in values]}
+
+            if previous.get(relativePath, {}).get('hash') == contentHash and os.path.isfile(self._datasetPath(dataset, relativePath, PART_FILE)):
+                stats['unchanged'] += 1
+                continue
+
+            partitionPath = self._datasetPath(dataset, relativePath)
+            os.makedirs(partitionPath, exist_ok=True)
+            temporaryPath = os.path.join(partitionPath, PART_FILE + '.tmp')
+            partition.to_parquet(temporaryPath, index=False)
+            os.replace(temporaryPath, os.path.join(partitionPath, PART_FILE))
+            stats['written'] += 1
+
+        for relativePath in set(previous) - set(partitions):
+            partFile = self._datasetPath(dataset, relativePath, PART_FILE)
+
+            if os.path.isfile(partFile):
+                os.remove(partFile)
+                # prunes the emptied partition directories, stopping at the first one still holding data
+                os.removedirs(os.path.dirname(partFile))
+
+            stats['removed'] += 1
+
+        self._writeManifest(dataset, {'partitions': partitions, 'dtypes': {str(c): str(d) for c, d in frame.dtypes.items()}})
+
+        return stats
+
+    def read(self, dataset: str) -> pd.DataFrame:
+        manifest = self._readManifest(dataset)
+        frames = [pd.read_parquet(self._datasetPath(dataset, relativePath, PART_FILE)).assign(**dict(zip(self.partitionColumns, partition['values'])))
+                  for relativePath, partition in sorted(manifest['partitions'].items())]
+
+        if not frames:
+            return pd.DataFrame()
+
+        # the categories of the partition files differ, so the dtypes are restored once the files are concatenated
+        dtypes = manifest['dtypes']
+
+        return pd.concat(frames, ignore_index=True)[list(dtypes)].astype(dtypes)
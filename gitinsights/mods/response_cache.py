@@ -0,0 +1,192 @@
+import abc
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from .transport import CONTINUATION_TOKEN_HEADER
+from .transport import JsonResponse
+
+# Resources that can never change again, such as the commits and threads of a completed pull request
+IMMUTABLE = datetime.timedelta.max
+VALIDATOR_HEADERS = {'ETag': 'If-None-Match', 'Last-Modified': 'If-Modified-Since'}
+# validators plus the continuation token a cached page needs to lead on to the next one, keyed by lower case name
+PERSISTED_HEADERS = {header.lower(): header for header in list(VALIDATOR_HEADERS) + [CONTINUATION_TOKEN_HEADER]}
+
+
+class CacheEntry:
+    def __init__(self, status_code: int, headers: Dict[str, str], body: bytes, storedAt: float, immutable: bool = False):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.storedAt = storedAt
+        self.immutable = immutable
+
+    def isFresh(self, maxAge: datetime.timedelta) -> bool:
+        if self.immutable:
+            return True
+
+        # an entry stored while the resource could still change has to be revalidated before it is trusted forever
+        if maxAge == IMMUTABLE:
+            return False
+
+        return time.time() - self.storedAt < maxAge.total_seconds()
+
+    def conditionalHeaders(self) -> Dict[str, str]:
+        return {conditionalHeader: self.headers[validator] for validator, conditionalHeader in VALIDATOR_HEADERS.items() if validator in self.headers}
+
+    def response(self) -> JsonResponse:
+        return JsonResponse(self.status_code, self.headers, None, self.body)
+
+
+# Pluggable storage for GET responses. Subclasses only provide persistence, the freshness, validator and
+# statistics handling shared by the sync and async clients lives here. The ttl bounds how long a mutable
+# entry is retained, callers opt into reusing an entry without revalidation by passing a maxAge.
+class ResponseCache(abc.ABC):
+    def __init__(self, ttl: datetime.timedelta = datetime.timedelta(days=7)):
+        self.ttl = ttl
+        self._statsLock = threading.Lock()
+        self._stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stored': 0, 'evicted': 0, 'bytes_saved': 0}
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    @abc.abstractmethod
+    def read(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError("Please Implement method read")
+
+    @abc.abstractmethod
+    def write(self, key: str, entry: CacheEntry) -> None:
+        raise NotImplementedError("Please Implement method write")
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._statsLock:
+            self._stats[stat] += amount
+
+    def stats(self) -> Dict[str, int]:
+        with self._statsLock:
+            return dict(self._stats)
+
+    def lookup(self, url: str, maxAge: Optional[datetime.timedelta] = None) -> Tuple[Optional[JsonResponse], Optional[CacheEntry]]:
+        entry = self.read(ResponseCache.key(url))
+
+        if entry is None:
+            self._count('misses')
+            return None, None
+
+        # callers that don't declare a max age always revalidate
+        if entry.isFresh(datetime.timedelta(0) if maxAge is None else maxAge):
+            self._count('hits')
+            self._count('bytes_saved', len(entry.body))
+            return entry.response(), entry
+
+        # stale entries are only useful when they can be revalidated with a conditional request
+        if not entry.conditionalHeaders():
+            self._count('misses')
+            return None, None
+
+        return None, entry
+
+    def revalidated(self, url: str, entry: CacheEntry, maxAge: Optional[datetime.timedelta] = None) -> JsonResponse:
+        self._count('revalidated')
+        self._count('bytes_saved', len(entry.body))
+        self.write(ResponseCache.key(url), CacheEntry(entry.status_code, entry.headers, entry.body, time.time(), entry.immutable or maxAge == IMMUTABLE))
+
+        return entry.response()
+
+    def store(self, url: str, status_code: int, headers: Dict[str, str], body: bytes, maxAge: Optional[datetime.timedelta] = None) -> None:
+        maxAge = datetime.timedelta(0) if maxAge is None else maxAge
+        persistedHeaders = {PERSISTED_HEADERS[k.lower()]: v for k, v in headers.items() if k.lower() in PERSISTED_HEADERS}
+
+        # a response that can neither be reused as is nor revalidated isn't worth the disk write
+        if status_code != 200 or (maxAge <= datetime.timedelta(0) and not any(validator in persistedHeaders for validator in VALIDATOR_HEADERS)):
+            return
+
+        self.write(ResponseCache.key(url), CacheEntry(status_code, persistedHeaders, body, time.time(), maxAge == IMMUTABLE))
+        self._count('stored')
+
+
+# A directory of gzip compressed JSON documents, evicted by TTL and least recent use once over maxSizeBytes
+class DirectoryResponseCache(ResponseCache):
+    def __init__(self, directory: str, ttl: datetime.timedelta = datetime.timedelta(days=7), maxSizeBytes: int = 512 * 1024 * 1024):
+        super().__init__(ttl)
+        self.directory = directory
+        self.maxSizeBytes = maxSizeBytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._sizeBytes = sum(e.stat().st_size for e in os.scandir(directory) if e.name.endswith('.json.gz'))
+
+    def __getstate__(self) -> dict:
+        # the locks don't pickle, the worker processes of a sharded collection each open the directory anew
+        return {'directory': self.directory, 'ttl': self.ttl, 'maxSizeBytes': self.maxSizeBytes}
+
+    def __setstate__(self, state: dict) -> None:
+        DirectoryResponseCache.__init__(self, state['directory'], state['ttl'], state['maxSizeBytes'])
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, '{}.json.gz'.format(key))
+
+    def read(self, key: str) -> Optional[CacheEntry]:
+        path = self._path(key)
+
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                document = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        entry = CacheEntry(document['status_code'], document['headers'], document['body'].encode('utf-8'), document['storedAt'], document['immutable'])
+
+        if not entry.immutable and time.time() - entry.storedAt > self.ttl.total_seconds():
+            self._remove(path)
+            self._count('evicted')
+            return None
+
+        # the access time drives least recently used eviction
+        os.utime(path)
+
+        return entry
+
+    def write(self, key: str, entry: CacheEntry) -> None:
+        path = self._path(key)
+        # processes sharing the directory write the same entries, so the temporary file is unique per process and thread
+        temporaryPath = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        document = {'status_code': entry.status_code, 'headers': entry.headers, 'body': entry.body.decode('utf-8'), 'storedAt': entry.storedAt, 'immutable': entry.immutable}
+
+        with gzip.open(temporaryPath, 'wt', encoding='utf-8') as f:
+            json.dump(document, f)
+
+        with self._lock:
+            previousSize = os.path.getsize(path) if os.path.isfile(path) else 0
+            os.replace(temporaryPath, path)
+            self._sizeBytes += os.path.getsize(path) - previousSize
+
+        if self._sizeBytes > self.maxSizeBytes:
+            self.evict()
+
+    def _remove(self, path: str) -> None:
+        with self._lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._sizeBytes -= size
+            except OSError:
+                pass
+
+    def evict(self) -> None:
+        entries = sorted((e for e in os.scandir(self.directory) if e.name.endswith('.json.gz')), key=lambda e: e.stat().st_mtime)
+
+        # trim to 90% of the budget so that every write past the limit doesn't rescan the directory
+        for entry in entries:
+            if self._sizeBytes <= self.maxSizeBytes * 0.9:
+                break
+
+            self._remove(entry.path)
+            self._count('evicted')
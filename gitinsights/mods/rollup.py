@@ -0,0 +1,57 @@
+from typing import Dict
+from typing import List
+
+import pandas as pd
+
+from .incremental import finalizeMeasures
+from .incremental import measurePartials
+from .incremental import sumPartials
+
+CUBE_GRAIN_COLUMN = 'grain'
+
+
+def _groupPartials(partials: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    # null keys are kept until the end, a coarser grain still counts the events whose finer keys are missing
+    return sumPartials(partials, level=columns, observed=True, dropna=False)
+
+
+# Aggregates the events at several grains in one pass. The events are reduced once to additive partials at the
+# union of every grain, then each grain is summed from the smallest partials already computed that are at least
+# as fine, so a month or an org total never goes back to the raw events. Means are carried as (sum, count) pairs
+# and only divided out per grain, which keeps them exact where averaging the finer means would not be.
+def rollup(events: pd.DataFrame, grains: Dict[str, List[str]], measures: Dict[str, str]) -> Dict[str, pd.DataFrame]:
+    if not grains:
+        raise ValueError('At least one rollup grain is required')
+
+    if not all(grains.values()):
+        raise ValueError('Every rollup grain must group by at least one column')
+
+    grainColumns = list(dict.fromkeys(column for columns in grains.values() for column in columns))
+    missingColumns = [column for column in grainColumns if column not in events]
+
+    if missingColumns:
+        raise ValueError('The events are missing the rollup columns {}'.format(missingColumns))
+
+    base = sumPartials(pd.concat([events[grainColumns], measurePartials(events, measures)], axis=1), grainColumns, observed=True, dropna=False)
+    computed = [(frozenset(grainColumns), base)]
+    results = {}
+
+    # finest grains first, so the coarser ones can be derived from them
+    for name, columns in sorted(grains.items(), key=lambda grain: len(set(grain[1])), reverse=True):
+        source = min((partials for grainSet, partials in computed if set(columns) <= grainSet), key=len)
+        partials = _groupPartials(source, columns)
+        computed.append((frozenset(columns), partials))
+
+        hasKeys = partials.index.to_frame().notna().all(axis=1).values
+        results[name] = finalizeMeasures(partials[hasKeys], measures)
+
+    return {name: results[name] for name in grains}
+
+
+# Stacks the rollups into one tidy frame, with the grain name in the first column and nulls in the columns a grain
+# does not group by
+def rollupCube(rollups: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    frames = [frame.reset_index().assign(**{CUBE_GRAIN_COLUMN: name}) for name, frame in rollups.items()]
+    cube = pd.concat(frames, ignore_index=True)
+
+    return cube[[CUBE_GRAIN_COLUMN] + [column for column in cube.columns if column != CUBE_GRAIN_COLUMN]]
@@ -0,0 +1,159 @@
+import math
+from typing import Any
+from typing import Dict
+from typing import NamedTuple
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# durations closer to zero than this, about a tenth of a second in days, are counted as zero
+MIN_MAGNITUDE = 1e-6
+# Partial aggregate column holding the sketch of a measure's source field
+SKETCH_SUFFIX = '__sketch'
+
+
+# Mergeable quantile sketch over log sized buckets, in the manner of DDSketch. A value v falls in the bucket
+# ceil(log_gamma(|v|)) and every quantile is answered with the midpoint of its bucket, which is within the relative
+# accuracy of the exact value. Merging two sketches adds their bucket counts, so the sketch of a report group is the
+# same whether it is built from the raw durations or merged from the sketches of its repos, shards or runs.
+class QuantileSketch:
+    def __init__(self, relativeAccuracy: float = DEFAULT_RELATIVE_ACCURACY, zeroCount: int = 0, positive: Dict[int, int] = None, negative: Dict[int, int] = None):
+        if not 0 < relativeAccuracy < 1:
+            raise ValueError('relativeAccuracy must be between 0 and 1')
+
+        self.relativeAccuracy = relativeAccuracy
+        self.gamma = (1 + relativeAccuracy) / (1 - relativeAccuracy)
+        self.zeroCount = zeroCount
+        self.positive: Dict[int, int] = positive if positive is not None else {}
+        self.negative: Dict[int, int] = negative if negative is not None else {}
+
+    @property
+    def count(self) -> int:
+        return self.zeroCount + sum(self.positive.values()) + sum(self.negative.values())
+
+    def __repr__(self) -> str:
+        return 'QuantileSketch(count={})'.format(self.count)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, QuantileSketch) and self.toDict() == other.toDict()
+
+    def _bucketValue(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def addValues(self, values: np.ndarray) -> 'QuantileSketch':
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.zeroCount += int((np.abs(values) < MIN_MAGNITUDE).sum())
+
+        for store, magnitudes in ((self.positive, values[values >= MIN_MAGNITUDE]), (self.negative, -values[values <= -MIN_MAGNITUDE])):
+            indices, counts = np.unique(np.ceil(np.log(magnitudes) / math.log(self.gamma)).astype(np.int64), return_counts=True)
+
+            for index, count in zip(indices.tolist(), counts.tolist()):
+                store[index] = store.get(index, 0) + count
+
+        return self
+
+    def addCounts(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        if other.relativeAccuracy != self.relativeAccuracy:
+            raise ValueError('Sketches of different relative accuracies can not be merged')
+
+        self.zeroCount += other.zeroCount
+
+        for store, otherStore in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in otherStore.items():
+                store[index] = store.get(index, 0) + count
+
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        return QuantileSketch(self.relativeAccuracy, self.zeroCount, dict(self.positive), dict(self.negative)).addCounts(other)
+
+    __add__ = merge
+
+    def quantile(self, quantile: float) -> float:
+        if not 0 <= quantile <= 1:
+            raise ValueError('Quantile {} is not between 0 and 1'.format(quantile))
+
+        count = self.count
+
+        if count == 0:
+            return np.nan
+
+        # the rank of the lower of the two values around the quantile, like numpy's 'lower' method
+        rank = math.floor(quantile * (count - 1))
+        seen = 0
+
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+
+            if seen > rank:
+                return -self._bucketValue(index)
+
+        seen += self.zeroCount
+
+        if seen > rank:
+            return 0.0
+
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+
+            if seen > rank:
+                return self._bucketValue(index)
+
+        raise AssertionError('The quantile rank {} exceeds the sketch count {}'.format(rank, count))
+
+    def toDict(self) -> dict:
+        # json object keys are strings, the bucket indices are restored by fromDict
+        return {'relativeAccuracy': self.relativeAccuracy, 'zeroCount': self.zeroCount,
+                'positive': {str(index): count for index, count in sorted(self.positive.items())},
+                'negative': {str(index): count for index, count in sorted(self.negative.items())}}
+
+    @classmethod
+    def fromDict(cls, payload: dict) -> 'QuantileSketch':
+        return cls(payload['relativeAccuracy'], payload['zeroCount'], {int(index): count for index, count in payload['positive'].items()},
+                   {int(index): count for index, count in payload['negative'].items()})
+
+    @classmethod
+    def combine(cls, values: pd.Series) -> 'QuantileSketch':
+        # a partials column holds the raw durations until it is first grouped, and sketches from then on
+        if values.dtype != object:
+            return cls().addValues(values.to_numpy(dtype=np.float64, na_value=np.nan))
+
+        sketch = cls()
+
+        # merged in place, the sketches of the partials are left untouched
+        for value in values:
+            if isinstance(value, QuantileSketch):
+                sketch.addCounts(value)
+            elif isinstance(value, dict):
+                sketch.addCounts(cls.fromDict(value))
+            else:
+                sketch.addValues(np.asarray([value]))
+
+        return sketch
+
+
+# A quantile of a duration field, reported next to its mean. The batch aggregation sketches the durations of every
+# group, so it answers with the same bucket as the merged partials.
+class QuantileMeasure(NamedTuple):
+    source: str
+    quantile: float
+
+    def aggregate(self, values: pd.Series) -> float:
+        return QuantileSketch.combine(values).quantile(self.quantile)
+
+
+def quantileMeasureName(field: str, quantile: float) -> str:
+    # pr_completion_days_p90
+    return '{}_p{:g}'.format(field, quantile * 100)
+
+
+def quantileMeasures(reportableFields: Dict[str, dict]) -> Dict[str, QuantileMeasure]:
+    return {quantileMeasureName(field, quantile): QuantileMeasure(field, quantile) for field, settings in reportableFields.items() for quantile in settings.get('quantiles', ())}
+
+
+def namedAggregations(measures: Dict[str, Any]) -> Dict[str, Tuple[str, Any]]:
+    # quantile measures aggregate their source field under their own name
+    return {measure: (aggFunction.source, aggFunction.aggregate) if isinstance(aggFunction, QuantileMeasure) else (measure, aggFunction) for measure, aggFunction in measures.items()}
@@ -0,0 +1,82 @@
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+
+import pandas as pd
+
+from .incremental import finalizeMeasures
+from .incremental import measurePartials
+from .incremental import sumPartials
+from .records import ColumnarRecordBuilder
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+# Folds the activity records into running per group partial aggregates as they are collected, in place of the
+# record builder. Records are buffered a chunk at a time, turned into a frame by the same derivations as the batch
+# path, and reduced to their additive partials (sums, and the sum and count of every mean) per group. The chunk is
+# then dropped, so memory is bounded by the chunk size and the number of groups rather than the number of events.
+class StreamingAggregator:
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, reportableFields: Dict[str, dict], groupByColumns: List[str], measures: Dict[str, str], toDataFrame: Callable[[ColumnarRecordBuilder], pd.DataFrame],
+                 chunkSize: int = DEFAULT_CHUNK_SIZE, sink=None):
+        if chunkSize < 1:
+            raise ValueError('chunkSize must be at least 1')
+
+        self.reportableFields = reportableFields
+        self.groupByColumns = groupByColumns
+        self.measures = measures
+        self.toDataFrame = toDataFrame
+        self.chunkSize = chunkSize
+        self.sink = sink
+        self._chunk = ColumnarRecordBuilder(reportableFields, sink)
+        self._partials = pd.DataFrame()
+        self._recordCount = 0
+
+    def __len__(self) -> int:
+        return self._recordCount
+
+    @property
+    def groups(self) -> int:
+        return len(self._partials)
+
+    def append(self, record: dict) -> None:
+        self._chunk.append(record)
+        self._recordCount += 1
+
+        if len(self._chunk) >= self.chunkSize:
+            self._fold()
+
+    def extend(self, records: Iterable[dict]) -> None:
+        for record in records:
+            self.append(record)
+
+    def _fold(self) -> None:
+        if len(self._chunk) == 0:
+            return
+
+        events = self.toDataFrame(self._chunk)
+        self._chunk = ColumnarRecordBuilder(self.reportableFields, self.sink)
+        # plain key values, the categories of every chunk differ
+        keys = {column: events[column].astype(object) if isinstance(events[column].dtype, pd.CategoricalDtype) else events[column] for column in self.groupByColumns}
+        partials = sumPartials(pd.concat([pd.DataFrame(keys), measurePartials(events, self.measures)], axis=1), self.groupByColumns)
+
+        self._partials = partials if self._partials.empty else sumPartials(pd.concat([self._partials, partials]), level=self.groupByColumns)
+
+    def result(self, categoricalColumns: Iterable[str] = ()) -> pd.DataFrame:
+        self._fold()
+
+        if self._partials.empty:
+            return pd.DataFrame(columns=list(self.measures))
+
+        aggregates = finalizeMeasures(self._partials, self.measures)
+        categoricalColumns = [column for column in categoricalColumns if column in self.groupByColumns]
+
+        if not categoricalColumns:
+            return aggregates
+
+        # the same categorical keys as the batch path, whose sorted categories keep the group order
+        keys = aggregates.index.to_frame(index=False).astype(dict.fromkeys(categoricalColumns, 'category'))
+
+        return aggregates.set_axis(pd.MultiIndex.from_frame(keys) if len(self.groupByColumns) > 1 else pd.Index(keys.iloc[:, 0]), axis=0)
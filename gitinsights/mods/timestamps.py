@@ -0,0 +1,111 @@
+import datetime
+import re
+from typing import Dict
+
+import pandas as pd
+from dateutil import parser
+
+# Derivations declared on a reportable field through its 'derived_from' setting
+TIMESTAMP = 'timestamp'
+ISO_WEEK = 'iso_week'
+ISO_YEAR = 'iso_year'
+CALENDAR_DAY = 'calendar_day'
+CALENDAR_MONTH = 'calendar_month'
+CALENDAR_QUARTER = 'calendar_quarter'
+WHOLE_DAYS = 'whole_days'
+FRACTIONAL_DAYS = 'fractional_days'
+
+# datetime.fromisoformat only accepts up to microsecond precision, ADO hands out 100ns ticks
+_EXCESS_FRACTION = re.compile(r'(\.\d{6})\d+')
+_PANDAS_PARSES_ISO8601 = int(pd.__version__.split('.')[0]) >= 2
+
+
+def parseIsoTimestamp(value: str) -> datetime.datetime:
+    try:
+        return datetime.datetime.fromisoformat(_EXCESS_FRACTION.sub(r'\1', value.replace('Z', '+00:00')))
+    except ValueError:
+        return parser.parse(value)
+
+
+def utcDate(value: datetime.datetime) -> datetime.datetime:
+    # naive dates are taken as utc
+    return value.replace(tzinfo=datetime.timezone.utc) if value.tzinfo is None else value.astimezone(datetime.timezone.utc)
+
+
+def parseTimestamps(values: pd.Series) -> pd.Series:
+    # the ISO8601 format lets fractional second precision vary from one value to the next
+    if _PANDAS_PARSES_ISO8601:
+        return pd.to_datetime(values, utc=True, format='ISO8601')
+
+    return pd.to_datetime(values, utc=True)
+
+
+def isoWeeks(timestamps: pd.Series) -> pd.Series:
+    # keyed by the ISO year as well, 202053 for the last week of 2020, so weeks of different years never collide
+    calendar = timestamps.dt.isocalendar()
+
+    return (calendar.year.astype('Int32') * 100 + calendar.week.astype('Int32')).rename(timestamps.name)
+
+
+def isoYears(timestamps: pd.Series) -> pd.Series:
+    # the ISO year the week belongs to, which differs from the calendar year around new year
+    return timestamps.dt.isocalendar().year.astype('Int64')
+
+
+def calendarDays(timestamps: pd.Series) -> pd.Series:
+    # 20210105 for the 5th of January 2021, in UTC like the rest of the derivations
+    return (timestamps.dt.year * 10000 + timestamps.dt.month * 100 + timestamps.dt.day).astype('Int32')
+
+
+def calendarMonths(timestamps: pd.Series) -> pd.Series:
+    return (timestamps.dt.year * 100 + timestamps.dt.month).astype('Int32')
+
+
+def calendarQuarters(timestamps: pd.Series) -> pd.Series:
+    # 20211 for the first quarter of 2021
+    return (timestamps.dt.year * 10 + timestamps.dt.quarter).astype('Int32')
+
+
+def wholeDaysBetween(start: pd.Series, end: pd.Series) -> pd.Series:
+    return (end - start).dt.days.astype('float64')
+
+
+def fractionalDaysBetween(start: pd.Series, end: pd.Series) -> pd.Series:
+    # whole minutes expressed in days
+    return ((end - start).dt.total_seconds() // 60) / 60 / 24
+
+
+# Events carry their dates as the raw ISO 8601 strings returned by ADO. Every date column is parsed once in bulk and
+# the weeks and day deltas are derived from the parsed columns, the raw source columns are dropped afterwards.
+def deriveTimestampFields(frame: pd.DataFrame, reportableFields: Dict[str, dict]) -> pd.DataFrame:
+    if frame.empty:
+        return frame
+
+    derivations = {field: settings['derived_from'] for field, settings in reportableFields.items() if 'derived_from' in settings}
+    sourceColumns = {column for derivation in derivations.values() for column in derivation[1:]}
+    parsed = {column: parseTimestamps(frame[column]) if column in frame else pd.Series(pd.NaT, index=frame.index, dtype='datetime64[ns, UTC]') for column in sourceColumns}
+    derived = {}
+
+    for field, (derivation, *columns) in derivations.items():
+        if derivation == TIMESTAMP:
+            derived[field] = parsed[columns[0]]
+        elif derivation == ISO_WEEK:
+            derived[field] = isoWeeks(parsed[columns[0]])
+        elif derivation == ISO_YEAR:
+            derived[field] = isoYears(parsed[columns[0]])
+        elif derivation == CALENDAR_DAY:
+            derived[field] = calendarDays(parsed[columns[0]])
+        elif derivation == CALENDAR_MONTH:
+            derived[field] = calendarMonths(parsed[columns[0]])
+        elif derivation == CALENDAR_QUARTER:
+            derived[field] = calendarQuarters(parsed[columns[0]])
+        elif derivation == WHOLE_DAYS:
+            derived[field] = wholeDaysBetween(parsed[columns[0]], parsed[columns[1]])
+        elif derivation == FRACTIONAL_DAYS:
+            derived[field] = fractionalDaysBetween(parsed[columns[0]], parsed[columns[1]])
+        else:
+            raise ValueError('Unknown timestamp derivation {}'.format(derivation))
+
+    frame = frame.assign(**derived)
+
+    return frame.drop(columns=[column for column in sourceColumns if column in frame and column not in reportableFields])
@@ -0,0 +1,393 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from typing import Any
+from typing import AsyncIterator
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.connectionpool import HTTPSConnectionPool
+
+from .instrumentation import THROTTLED_STATUS
+from .instrumentation import Instrumentation
+
+# ADO hands out the position of the next page of list results in this response header
+CONTINUATION_TOKEN_HEADER = 'x-ms-continuationtoken'
+# Throttling headers of the ADO rate limits, the delays are in seconds and the remaining budget in TSTUs
+RETRY_AFTER_HEADER = 'Retry-After'
+RATE_LIMIT_DELAY_HEADER = 'X-RateLimit-Delay'
+RATE_LIMIT_REMAINING_HEADER = 'X-RateLimit-Remaining'
+RATE_LIMIT_LIMIT_HEADER = 'X-RateLimit-Limit'
+# Reasons the adaptive limiter backs off
+THROTTLE_RETRY_AFTER = 'retry_after'
+THROTTLE_RATE_LIMIT_DELAY = 'rate_limit_delay'
+THROTTLE_RATE_LIMIT_REMAINING = 'rate_limit_remaining'
+# How often an async request polls a cross process semaphore held by other workers
+SHARED_SEMAPHORE_POLL_SECONDS = 0.01
+
+
+# Mirrors the slice of requests.Response that the client deserializers rely on
+class JsonResponse:
+    # pylint: disable=too-few-public-methods
+    def __init__(self, status_code: int, headers: Dict[str, str], payload: Any, body: bytes = None):
+        self.status_code = status_code
+        self.headers = headers
+        self._payload = payload
+        # a raw body is decoded on demand, so callers can pass json.loads options such as an object_hook like they can to requests
+        self._body = body
+
+    def json(self, **kwargs) -> Any:
+        if self._body is None:
+            return self._payload
+
+        return json.loads(self._body, **kwargs) if self._body else None
+
+
+# Caps the number of in-flight requests against a single host across every client sharing the limiter
+class HostConcurrencyLimiter:
+    def __init__(self, maxConcurrentRequests: int = 8):
+        if maxConcurrentRequests < 1:
+            raise ValueError('maxConcurrentRequests must be a positive integer')
+
+        self.maxConcurrentRequests = maxConcurrentRequests
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _hostSemaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.maxConcurrentRequests)
+
+            return self._semaphores[host]
+
+    @contextmanager
+    def acquire(self, host: str) -> Iterator[None]:
+        semaphore = self._hostSemaphore(host)
+
+        with semaphore:
+            yield
+
+    # pylint: disable=unused-argument
+    @asynccontextmanager
+    async def acquireAsync(self, host: str) -> AsyncIterator[None]:
+        # the aiohttp connector of an async session already caps its in-flight requests per host
+        yield
+
+    # pylint: disable=unused-argument
+    def observe(self, host: str, status: Optional[int], headers: Mapping[str, str], retryStatuses: List[Optional[int]]) -> None:
+        # a fixed cap ignores the throttling feedback of the responses
+        pass
+
+    def pauseSeconds(self) -> float:
+        return 0.0
+
+
+# Additionally caps the in-flight requests of every process sharing the semaphore, such as the workers collecting
+# the projects of one org, on top of the per host cap of this process
+class SharedConcurrencyLimiter(HostConcurrencyLimiter):
+    def __init__(self, sharedSemaphore: Any, maxConcurrentRequests: int = 8):
+        super().__init__(maxConcurrentRequests)
+        self.sharedSemaphore = sharedSemaphore
+
+    @contextmanager
+    def acquire(self, host: str) -> Iterator[None]:
+        with self.sharedSemaphore:
+            with super().acquire(host):
+                yield
+
+    @asynccontextmanager
+    async def acquireAsync(self, host: str) -> AsyncIterator[None]:
+        # a blocking acquire would stall the event loop, so the semaphore of the other processes is polled
+        while not self.sharedSemaphore.acquire(False):
+            await asyncio.sleep(SHARED_SEMAPHORE_POLL_SECONDS)
+
+        try:
+            async with super().acquireAsync(host):
+                yield
+        finally:
+            self.sharedSemaphore.release()
+
+
+def headerSeconds(headers: Mapping[str, str], name: str) -> float:
+    value = headers.get(name)
+
+    if value is None:
+        return 0.0
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        logging.warning('Ignoring a non numeric %s header: %s', name, value)
+
+        return 0.0
+
+
+def _wakeAsyncWaiter(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+# Adjusts the number of in-flight requests against an org to the throttling feedback of ADO, additive increase
+# multiplicative decrease style. Every response that completes without throttling widens the window by one request
+# per window worth of responses, up to the cap of the wrapped limiter. A throttled response (a 429, a Retry-After,
+# an X-RateLimit-Delay or an X-RateLimit-Remaining budget running low) halves it at most once per cooldown, and a
+# Retry-After holds every request back until it elapses. Shared by all the clients of a manager, sync and async
+# alike, and wraps the per host (or cross process) limiter that bounds the window. The window itself is kept per
+# process, only the bound of a cross process limiter is shared between the workers of a sharded collection.
+class AdaptiveConcurrencyLimiter(HostConcurrencyLimiter):
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    def __init__(self, limiter: HostConcurrencyLimiter, name: str = '', minConcurrentRequests: int = 1, decreaseFactor: float = 0.5, decreaseCooldown: float = 1.0,
+                 lowRemainingFraction: float = 0.1, instrumentation: Instrumentation = None, clock: Callable[[], float] = time.monotonic):
+        if not 1 <= minConcurrentRequests <= limiter.maxConcurrentRequests:
+            raise ValueError('minConcurrentRequests must be between 1 and {}'.format(limiter.maxConcurrentRequests))
+
+        if not 0 < decreaseFactor < 1:
+            raise ValueError('decreaseFactor must be between 0 and 1')
+
+        super().__init__(limiter.maxConcurrentRequests)
+        self.limiter = limiter
+        self.name = name
+        self.minConcurrentRequests = minConcurrentRequests
+        self.decreaseFactor = decreaseFactor
+        self.decreaseCooldown = decreaseCooldown
+        self.lowRemainingFraction = lowRemainingFraction
+        self.instrumentation: Instrumentation = instrumentation or Instrumentation()
+        self.clock = clock
+        self.concurrency = float(limiter.maxConcurrentRequests)
+        self.throttleEvents: Dict[str, int] = {THROTTLE_RETRY_AFTER: 0, THROTTLE_RATE_LIMIT_DELAY: 0, THROTTLE_RATE_LIMIT_REMAINING: 0}
+        self._inFlight = 0
+        self._pausedUntil = 0.0
+        self._holdUntil = 0.0
+        self._condition = threading.Condition()
+        # futures of the async requests waiting for the window, along with the event loops awaiting them
+        self._asyncWaiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _pauseOrSlot(self) -> Optional[float]:
+        # called with the condition held, takes a slot of the window and returns None if one is free
+        pause = self._pausedUntil - self.clock()
+
+        if pause > 0:
+            return pause
+
+        if self._inFlight < int(self.concurrency):
+            self._inFlight += 1
+
+            return None
+
+        return 0.0
+
+    def _notifyWaiters(self, notifyAll: bool = False) -> None:
+        # called with the condition held, the async waiters are woken on their own loops and check the window again
+        if notifyAll:
+            self._condition.notify_all()
+        else:
+            self._condition.notify()
+
+        for loop, waiter in self._asyncWaiters:
+            loop.call_soon_threadsafe(_wakeAsyncWaiter, waiter)
+
+    def _release(self) -> None:
+        with self._condition:
+            self._inFlight -= 1
+            self._notifyWaiters()
+
+    @contextmanager
+    def acquire(self, host: str) -> Iterator[None]:
+        with self._condition:
+            while True:
+                pause = self._pauseOrSlot()
+
+                if pause is None:
+                    break
+
+                self._condition.wait(pause or None)
+
+        try:
+            with self.limiter.acquire(host):
+                yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def acquireAsync(self, host: str) -> AsyncIterator[None]:
+        loop = asyncio.get_event_loop()
+
+        while True:
+            with self._condition:
+                pause = self._pauseOrSlot()
+
+                if pause is None:
+                    break
+
+                waiter = loop.create_future()
+                self._asyncWaiters.append((loop, waiter))
+
+            try:
+                await asyncio.wait_for(waiter, pause or None)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    self._asyncWaiters.remove((loop, waiter))
+
+        try:
+            async with self.limiter.acquireAsync(host):
+                yield
+        finally:
+            self._release()
+
+    def _throttleReason(self, status: Optional[int], headers: Mapping[str, str], retryStatuses: List[Optional[int]], rateLimitDelay: float) -> Optional[str]:
+        if status == THROTTLED_STATUS or THROTTLED_STATUS in retryStatuses or RETRY_AFTER_HEADER in headers:
+            return THROTTLE_RETRY_AFTER
+
+        if rateLimitDelay > 0:
+            return THROTTLE_RATE_LIMIT_DELAY
+
+        remaining = headers.get(RATE_LIMIT_REMAINING_HEADER)
+        limit = headers.get(RATE_LIMIT_LIMIT_HEADER)
+
+        try:
+            if remaining is not None and limit is not None and float(remaining) < self.lowRemainingFraction * float(limit):
+                return THROTTLE_RATE_LIMIT_REMAINING
+        except ValueError:
+            logging.warning('Ignoring non numeric rate limit headers: %s of %s', remaining, limit)
+
+        return None
+
+    def observe(self, host: str, status: Optional[int], headers: Mapping[str, str], retryStatuses: List[Optional[int]]) -> None:
+        retryAfter = headerSeconds(headers, RETRY_AFTER_HEADER)
+        rateLimitDelay = headerSeconds(headers, RATE_LIMIT_DELAY_HEADER)
+        reason = self._throttleReason(status, headers, retryStatuses, rateLimitDelay)
+
+        with self._condition:
+            now = self.clock()
+
+            if reason is not None:
+                self.throttleEvents[reason] += 1
+                # the responses of a throttled burst arrive together, they only count as a single decrease
+                if now >= self._holdUntil:
+                    self.concurrency = max(float(self.minConcurrentRequests), self.concurrency * self.decreaseFactor)
+                    self._holdUntil = now + self.decreaseCooldown
+
+                # the X-RateLimit-Delay has already been served by ADO, a Retry-After is up to the client
+                if RETRY_AFTER_HEADER in headers:
+                    self._pausedUntil = max(self._pausedUntil, now + retryAfter)
+            elif status is not None and status < 500:
+                self.concurrency = min(float(self.maxConcurrentRequests), self.concurrency + 1 / self.concurrency)
+                self._notifyWaiters(notifyAll=True)
+
+            concurrency = self.concurrency
+
+        self.instrumentation.recordRateLimit(self.name, concurrency, reason, (retryAfter or rateLimitDelay) if reason is not None else 0.0)
+
+    def pauseSeconds(self) -> float:
+        with self._condition:
+            return max(self._pausedUntil - self.clock(), 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {'concurrency': self.concurrency, 'in_flight': self._inFlight, 'paused_seconds': max(self._pausedUntil - self.clock(), 0.0), 'throttle_events': dict(self.throttleEvents)}
+
+
+# urllib3 reuses connection objects across server side disconnects so count the socket connects themselves
+class _ConnectCountingPoolMixin:
+    # pylint: disable=too-few-public-methods
+    connectionsOpened = 0
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        connect = conn.connect
+
+        def countingConnect():
+            self.connectionsOpened += 1
+            connect()
+
+        conn.connect = countingConnect
+
+        return conn
+
+
+class _CountingHTTPConnectionPool(_ConnectCountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_ConnectCountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _CountingHTTPConnectionPool, 'https': _CountingHTTPSConnectionPool}
+
+
+# One long-lived, connection pooled session per host shared by every client bound to the transport
+class PooledTransport:
+    def __init__(self, poolSize: int = 10, keepAlive: bool = True):
+        if poolSize < 1:
+            raise ValueError('poolSize must be a positive integer')
+
+        self.poolSize = poolSize
+        self.keepAlive = keepAlive
+        self._sessions: Dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session(self, host: str, sessionFactory: Callable[[], requests.Session]) -> requests.Session:
+        with self._lock:
+            if host not in self._sessions:
+                session = sessionFactory()
+
+                if not self.keepAlive:
+                    session.headers['Connection'] = 'close'
+
+                self._sessions[host] = session
+
+            return self._sessions[host]
+
+    def connectionStats(self) -> Dict[str, Dict[str, int]]:
+        stats: Dict[str, Dict[str, int]] = {}
+
+        with self._lock:
+            sessions = dict(self._sessions)
+
+        for host, session in sessions.items():
+            opened = 0
+            requestCount = 0
+
+            # http:// and https:// share a single adapter so dedupe before walking the urllib3 pools
+            for adapter in {id(a): a for a in session.adapters.values()}.values():
+                pools = adapter.poolmanager.pools
+
+                for poolKey in list(pools.keys()):
+                    pool = pools.get(poolKey)
+
+                    if pool is not None:
+                        opened += getattr(pool, 'connectionsOpened', pool.num_connections)
+                        requestCount += pool.num_requests
+
+            stats[host] = {
+                'requests': requestCount,
+                'connections_opened': opened,
+                'connections_reused': requestCount - opened
+            }
+
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+
+            self._sessions.clear()
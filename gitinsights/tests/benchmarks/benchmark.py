@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import gc
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from multiprocessing.connection import Connection
+from typing import List
+
+from gitinsights.mods.instrumentation import MetricsInstrumentation
+from gitinsights.mods.managers.ado import AzureDevopsClientManager
+from gitinsights.mods.managers.ado import CollectionSettings
+from gitinsights.tests.benchmarks.synthetic_ado import SyntheticAdoDataset
+from gitinsights.tests.fake_ado_server import FakeAdoServer
+from gitinsights.tests.fake_ado_server import redirectManager
+
+DEFAULT_GROUP_BY_COLUMNS = ['contributor', 'week', 'repo']
+
+
+def _serve(dataset: SyntheticAdoDataset, connection: Connection) -> None:
+    with FakeAdoServer() as server:
+        dataset.addRoutes(server)
+        connection.send(server.host)
+
+        # answers request count queries until asked to stop
+        while connection.recv() != 'stop':
+            connection.send(server.requestCount())
+
+
+# The stub server runs in its own process so serializing the synthetic payloads doesn't compete with the collection
+# for the GIL, and the peak RSS measured by the benchmark is the collection's alone.
+class StubServerProcess:
+    def __init__(self, dataset: SyntheticAdoDataset):
+        self.dataset = dataset
+        self.host = ''
+        self._connection, childConnection = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(dataset, childConnection), daemon=True)
+
+    def __enter__(self) -> 'StubServerProcess':
+        self._process.start()
+        self.host = self._connection.recv()
+
+        return self
+
+    def requestCount(self) -> int:
+        self._connection.send('count')
+
+        return self._connection.recv()
+
+    def __exit__(self, *args) -> None:
+        self._connection.send('stop')
+        self._process.join(5)
+
+
+def peakRssMegabytes() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def runBenchmark(dataset: SyntheticAdoDataset, asyncMode: bool = False, maxWorkers: int = 1, maxConcurrentRequestsPerHost: int = 8, changeCountsByCommitId: bool = False,
+                 groupByColumns: List[str] = None) -> dict:
+    instrumentation = MetricsInstrumentation()
+
+    with StubServerProcess(dataset) as server:
+        manager = AzureDevopsClientManager('fabrikam', dataset.project, dataset.repos, 'synthetic-team', 'token',
+                                           settings=CollectionSettings(maxWorkers=maxWorkers, maxConcurrentRequestsPerHost=maxConcurrentRequestsPerHost,
+                                                                       changeCountsByCommitId=changeCountsByCommitId, instrumentation=instrumentation))
+        redirectManager(manager, server.host)
+        gc.collect()
+
+        started = time.perf_counter()
+        aggregated = asyncio.run(manager.aggregatePullRequestActivityAsync(groupByColumns or DEFAULT_GROUP_BY_COLUMNS)) if asyncMode \
+            else manager.aggregatePullRequestActivity(groupByColumns or DEFAULT_GROUP_BY_COLUMNS)
+        wallSeconds = time.perf_counter() - started
+        metrics = instrumentation.summary()
+
+        return {
+            'dataset': dataset.settings(),
+            'settings': {'mode': 'async' if asyncMode else 'sync', 'maxWorkers': maxWorkers, 'maxConcurrentRequestsPerHost': maxConcurrentRequestsPerHost, 'changeCountsByCommitId': changeCountsByCommitId},
+            'wall_seconds': round(wallSeconds, 4),
+            'requests': server.requestCount(),
+            'peak_rss_mb': peakRssMegabytes(),
+            'bytes_received': sum(r['bytes_received'] for r in metrics['requests']),
+            'events': metrics['stages']['collect']['records'],
+            'aggregated_rows': len(aggregated),
+            # stages overlap once requests run concurrently, so their cumulative seconds can add up to more than the wall time
+            'stages': metrics['stages'],
+            'deserialization': metrics['deserialization']
+        }
+
+
+def findRegressions(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+
+    if result['wall_seconds'] > baseline['wall_seconds'] * (1 + tolerance):
+        regressions.append("wall time {}s exceeds the {}s baseline by more than {:.0%}".format(result['wall_seconds'], baseline['wall_seconds'], tolerance))
+
+    if result['requests'] > baseline['requests']:
+        regressions.append("{} requests sent, up from {}".format(result['requests'], baseline['requests']))
+
+    if result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append("peak RSS {}MB exceeds the {}MB baseline by more than {:.0%}".format(result['peak_rss_mb'], baseline['peak_rss_mb'], tolerance))
+
+    return regressions
+
+
+def formatResult(result: dict) -> str:
+    lines = ["{mode} collection: {wall_seconds}s wall, {requests} requests, {bytes_received} bytes received, {peak_rss_mb}MB peak RSS, {events} events".format(mode=result['settings']['mode'], **result)]
+
+    for stage, timing in result['stages'].items():
+        lines.append("  {:<14}{:>10.4f}s{:>8} calls{:>10} records".format(stage, timing['seconds'], timing['calls'], timing['records']))
+
+    return '\n'.join(lines)
+
+
+def parseArguments(arguments: List[str]) -> argparse.Namespace:
+    argumentParser = argparse.ArgumentParser(description='Benchmarks AzureDevopsClientManager.aggregatePullRequestActivity against a synthetic ADO dataset served from a local stub server.')
+    argumentParser.add_argument('--repos', type=int, default=4)
+    argumentParser.add_argument('--pull-requests', type=int, default=250, help='pull requests per repo')
+    argumentParser.add_argument('--reviewers', type=int, default=2, help='reviewers per pull request')
+    argumentParser.add_argument('--threads', type=int, default=6, help='comment threads per pull request')
+    argumentParser.add_argument('--comments', type=int, default=3, help='comments per thread')
+    argumentParser.add_argument('--commits', type=int, default=5, help='commits per pull request')
+    argumentParser.add_argument('--workitems', type=int, default=1000)
+    argumentParser.add_argument('--relations', type=int, default=2, help='pull request links per work item')
+    argumentParser.add_argument('--contributors', type=int, default=50)
+    argumentParser.add_argument('--seed', type=int, default=0)
+    argumentParser.add_argument('--mode', choices=['sync', 'async'], default='sync')
+    argumentParser.add_argument('--max-workers', type=int, default=1)
+    argumentParser.add_argument('--max-concurrent-requests', type=int, default=8, help='in-flight requests per host')
+    argumentParser.add_argument('--change-counts-by-commit-id', action='store_true')
+    argumentParser.add_argument('--repeat', type=int, default=1, help='runs of the benchmark, the fastest one is reported')
+    argumentParser.add_argument('--output', help='writes the result as json')
+    argumentParser.add_argument('--baseline', help='a previous --output result, regressions past the tolerance fail the run')
+    argumentParser.add_argument('--tolerance', type=float, default=0.2)
+
+    return argumentParser.parse_args(arguments)
+
+
+def main(arguments: List[str] = None) -> int:
+    options = parseArguments(sys.argv[1:] if arguments is None else arguments)
+    dataset = SyntheticAdoDataset(options.repos, options.pull_requests, options.reviewers, options.threads, options.comments, options.commits, options.workitems, options.relations, options.contributors, options.seed)
+    results = []
+
+    for _ in range(max(options.repeat, 1)):
+        results.append(runBenchmark(dataset, options.mode == 'async', options.max_workers, options.max_concurrent_requests, options.change_counts_by_commit_id))
+        print(formatResult(results[-1]))
+
+    result = min(results, key=lambda r: r['wall_seconds'])
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = findRegressions(result, json.load(f), options.tolerance)
+
+        for regression in regressions:
+            print("REGRESSION: {}".format(regression))
+
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
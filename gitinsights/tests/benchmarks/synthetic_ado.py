@@ -0,0 +1,322 @@
+import datetime
+import random
+import re
+import uuid
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from gitinsights.mods.timestamps import parseIsoTimestamp
+from gitinsights.tests.fake_ado_server import FakeAdoServer
+
+SYNTHETIC_NAMESPACE = uuid.UUID('6f1c8f3e-2b9d-4c55-9a43-0d1e7c2b5a10')
+SYNTHETIC_EPOCH = datetime.datetime(2021, 1, 4, tzinfo=datetime.timezone.utc)
+SYNTHETIC_SPAN = datetime.timedelta(days=365)
+
+# Vote mix of the synthetic reviewers, only approvals are reported
+REVIEWER_VOTES = [10, 5, 0, -5, -10]
+PULL_REQUEST_STATUSES = (['completed', 'active', 'abandoned'], [70, 20, 10])
+WORKITEM_STATES = (['New', 'Active', 'Resolved', 'Closed'], [15, 25, 10, 50])
+ENTITLEMENTS_PAGE_SIZE = 500
+
+_REPO_PATH = re.compile(r'/repositories/(?P<repo>[^/]+)/')
+_PULL_REQUEST_PATH = re.compile(r'/repositories/(?P<repo>[^/]+)/pullrequests/(?P<pullRequestId>\d+)/')
+_WIQL_DATE_CONDITION = re.compile(r"\[System\.(?P<field>CreatedDate|ChangedDate)\] (?P<operator>>=|>|<) '(?P<date>[^']+)'")
+_WIQL_OPERATORS = {'>=': lambda value, bound: value >= bound, '>': lambda value, bound: value > bound, '<': lambda value, bound: value < bound}
+
+
+def isoTimestamp(value: datetime.datetime) -> str:
+    # ADO hands out 100ns ticks, seven fractional digits
+    return "{}.{:07d}Z".format(value.strftime('%Y-%m-%dT%H:%M:%S'), value.microsecond * 10)
+
+
+# Deterministic, realistically shaped ADO payloads generated at any scale. Every payload is derived on demand from a
+# random generator seeded by the entity it describes, so the dataset costs no memory and the same settings always
+# produce the same responses.
+class SyntheticAdoDataset:
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, repos: int = 4, pullRequestsPerRepo: int = 250, reviewersPerPullRequest: int = 2, threadsPerPullRequest: int = 6, commentsPerThread: int = 3, commitsPerPullRequest: int = 5,
+                 workitems: int = 1000, relationsPerWorkitem: int = 2, contributors: int = 50, seed: int = 0, project: str = 'synthetic-project'):
+        self.repos = ['repo{}'.format(i + 1) for i in range(repos)]
+        self.pullRequestsPerRepo = pullRequestsPerRepo
+        self.reviewersPerPullRequest = reviewersPerPullRequest
+        self.threadsPerPullRequest = threadsPerPullRequest
+        self.commentsPerThread = commentsPerThread
+        self.commitsPerPullRequest = commitsPerPullRequest
+        self.workitems = workitems
+        self.relationsPerWorkitem = relationsPerWorkitem
+        self.contributors = contributors
+        self.seed = seed
+        self.project = project
+        self.projectId = str(uuid.uuid5(SYNTHETIC_NAMESPACE, project))
+
+    def settings(self) -> Dict[str, int]:
+        return {
+            'repos': len(self.repos),
+            'pullRequestsPerRepo': self.pullRequestsPerRepo,
+            'reviewersPerPullRequest': self.reviewersPerPullRequest,
+            'threadsPerPullRequest': self.threadsPerPullRequest,
+            'commentsPerThread': self.commentsPerThread,
+            'commitsPerPullRequest': self.commitsPerPullRequest,
+            'workitems': self.workitems,
+            'relationsPerWorkitem': self.relationsPerWorkitem,
+            'contributors': self.contributors,
+            'seed': self.seed
+        }
+
+    def _random(self, *key) -> random.Random:
+        return random.Random('{}:{}'.format(self.seed, '/'.join(str(k) for k in key)))
+
+    def _timestamp(self, rng: random.Random, after: datetime.datetime = SYNTHETIC_EPOCH, within: datetime.timedelta = SYNTHETIC_SPAN) -> datetime.datetime:
+        return after + datetime.timedelta(microseconds=rng.randrange(int(within.total_seconds() * 1000000)))
+
+    def repoId(self, repo: str) -> str:
+        return str(uuid.uuid5(SYNTHETIC_NAMESPACE, "{}/{}".format(self.project, repo)))
+
+    def contributorName(self, index: int) -> str:
+        return "Contributor {:04d}".format(index)
+
+    def contributorEmail(self, index: int) -> str:
+        return "contributor{:04d}@fabrikam.com".format(index)
+
+    def identity(self, index: int) -> dict:
+        identityId = str(uuid.uuid5(SYNTHETIC_NAMESPACE, self.contributorEmail(index)))
+
+        return {
+            'id': identityId,
+            'displayName': self.contributorName(index),
+            'uniqueName': self.contributorEmail(index),
+            'url': "https://dev.azure.com/fabrikam/_apis/Identities/{}".format(identityId),
+            'imageUrl': "https://dev.azure.com/fabrikam/_api/_common/identityImage?id={}".format(identityId)
+        }
+
+    def profile(self, index: int) -> dict:
+        return {
+            'subjectKind': 'user',
+            'domain': 'fabrikam.com',
+            'principalName': self.contributorEmail(index),
+            'mailAddress': self.contributorEmail(index),
+            'origin': 'aad',
+            'originId': str(uuid.uuid5(SYNTHETIC_NAMESPACE, self.contributorEmail(index))),
+            'displayName': self.contributorName(index),
+            'descriptor': "aad.{}".format(index)
+        }
+
+    def pullRequest(self, repo: str, pullRequestId: int) -> dict:
+        rng = self._random('pullrequest', repo, pullRequestId)
+        status = rng.choices(*PULL_REQUEST_STATUSES)[0]
+        creationDate = self._timestamp(rng)
+        pullRequest = {
+            'repository': {'id': self.repoId(repo), 'name': repo, 'project': {'id': self.projectId, 'name': self.project, 'state': 'unchanged'}},
+            'pullRequestId': pullRequestId,
+            'codeReviewId': pullRequestId,
+            'status': status,
+            'createdBy': self.identity(rng.randrange(self.contributors)),
+            'creationDate': isoTimestamp(creationDate),
+            'title': "Synthetic change {}".format(pullRequestId),
+            'sourceRefName': "refs/heads/feature/{}".format(pullRequestId),
+            'targetRefName': 'refs/heads/main',
+            'mergeStatus': 'succeeded',
+            'reviewers': [{**self.identity(reviewer), 'vote': rng.choice(REVIEWER_VOTES), 'reviewerUrl': ''} for reviewer in rng.sample(range(self.contributors), min(self.reviewersPerPullRequest, self.contributors))]
+        }
+
+        if status != 'active':
+            pullRequest['closedDate'] = isoTimestamp(self._timestamp(rng, creationDate, datetime.timedelta(days=14)))
+
+        return pullRequest
+
+    def pullRequestCreationDate(self, repo: str, pullRequestId: int) -> datetime.datetime:
+        rng = self._random('pullrequest', repo, pullRequestId)
+        rng.choices(*PULL_REQUEST_STATUSES)
+
+        return self._timestamp(rng)
+
+    def commitId(self, repo: str, pullRequestId: int, index: int) -> str:
+        return "{:08x}{:016x}{:016x}".format(self.repos.index(repo), pullRequestId, index)
+
+    def parseCommitId(self, commitId: str) -> Tuple[str, int, int]:
+        return self.repos[int(commitId[:8], 16)], int(commitId[8:24], 16), int(commitId[24:], 16)
+
+    def commit(self, repo: str, pullRequestId: int, index: int, withChangeCounts: bool = False) -> dict:
+        commitId = self.commitId(repo, pullRequestId, index)
+        rng = self._random('commit', commitId)
+        author = rng.randrange(self.contributors)
+        pushedDate = isoTimestamp(self._timestamp(rng, self.pullRequestCreationDate(repo, pullRequestId), datetime.timedelta(days=7)))
+        commit = {
+            'commitId': commitId,
+            'author': {'name': self.contributorName(author), 'email': self.contributorEmail(author), 'date': pushedDate},
+            'committer': {'name': self.contributorName(author), 'email': self.contributorEmail(author), 'date': pushedDate},
+            'comment': "Synthetic commit {} of pull request {}".format(index, pullRequestId),
+            'commentTruncated': False,
+            'url': "https://dev.azure.com/fabrikam/{}/_apis/git/repositories/{}/commits/{}".format(self.projectId, self.repoId(repo), commitId)
+        }
+
+        if withChangeCounts:
+            commit['changeCounts'] = {'Add': rng.randrange(10), 'Edit': rng.randrange(25), 'Delete': rng.randrange(5)}
+
+        return commit
+
+    def thread(self, repo: str, pullRequestId: int, threadId: int) -> dict:
+        rng = self._random('thread', repo, pullRequestId, threadId)
+        publishedDate = self._timestamp(rng, self.pullRequestCreationDate(repo, pullRequestId), datetime.timedelta(days=7))
+        comments = []
+
+        for commentId in range(1, 2 if threadId == 0 else self.commentsPerThread + 1):
+            updatedDate = isoTimestamp(self._timestamp(rng, publishedDate, datetime.timedelta(days=2)))
+            comments.append({
+                'id': commentId,
+                'parentCommentId': commentId - 1,
+                'author': self.identity(rng.randrange(self.contributors)),
+                'content': "Synthetic comment {}".format(commentId),
+                'publishedDate': isoTimestamp(publishedDate),
+                'lastUpdatedDate': updatedDate,
+                # the first thread of every pull request carries the merge attempt system message
+                'commentType': 'system' if threadId == 0 else 'text',
+                'usersLiked': []
+            })
+
+        return {'id': threadId + 1, 'publishedDate': isoTimestamp(publishedDate), 'lastUpdatedDate': comments[-1]['lastUpdatedDate'], 'comments': comments, 'status': 'active', 'isDeleted': False}
+
+    def workitem(self, workItemId: int) -> dict:
+        rng = self._random('workitem', workItemId)
+        state = rng.choices(*WORKITEM_STATES)[0]
+        createdDate = self._timestamp(rng)
+        fields = {
+            'System.WorkItemType': 'User Story',
+            'System.State': state,
+            'System.CreatedDate': isoTimestamp(createdDate),
+            'System.CreatedBy': self.identity(rng.randrange(self.contributors)),
+            'System.ChangedDate': isoTimestamp(self._timestamp(rng, createdDate, datetime.timedelta(days=30))),
+            'System.Title': "Synthetic user story {}".format(workItemId),
+            'Microsoft.VSTS.Scheduling.StoryPoints': float(rng.choice([1, 2, 3, 5, 8]))
+        }
+        relations = [{'rel': 'System.LinkTypes.Hierarchy-Reverse', 'url': "https://dev.azure.com/fabrikam/_apis/wit/workItems/{}".format(workItemId + 100000), 'attributes': {'isLocked': False, 'name': 'Parent'}}]
+
+        if state != 'New' and self.repos and self.pullRequestsPerRepo:
+            links = []
+
+            for _ in range(self.relationsPerWorkitem):
+                repo = rng.choice(self.repos)
+                pullRequestId = rng.randrange(self.pullRequestsPerRepo) + 1
+                links.append((self.pullRequestCreationDate(repo, pullRequestId), repo, pullRequestId))
+
+            # activated a little before the earliest linked pull request
+            activatedDate = min([link[0] for link in links] or [createdDate]) - datetime.timedelta(hours=rng.randrange(1, 240))
+            fields['Microsoft.VSTS.Common.ActivatedDate'] = isoTimestamp(activatedDate)
+            fields['System.AssignedTo'] = self.identity(rng.randrange(self.contributors))
+
+            if state in ['Resolved', 'Closed']:
+                fields['Microsoft.VSTS.Common.ResolvedDate'] = isoTimestamp(self._timestamp(rng, activatedDate, datetime.timedelta(days=30)))
+
+            for createdLinkDate, repo, pullRequestId in links:
+                relations.append({
+                    'rel': 'ArtifactLink',
+                    'url': "vstfs:///Git/PullRequestId/{}%2F{}%2F{}".format(self.projectId, self.repoId(repo), pullRequestId),
+                    'attributes': {'authorizedDate': isoTimestamp(createdLinkDate), 'id': pullRequestId, 'resourceCreatedDate': isoTimestamp(createdLinkDate), 'name': 'Pull Request'}
+                })
+
+        return {'id': workItemId, 'rev': rng.randrange(1, 40), 'fields': fields, 'relations': relations, 'url': "https://dev.azure.com/fabrikam/_apis/wit/workItems/{}".format(workItemId)}
+
+    def _repo(self, path: str) -> Optional[str]:
+        match = _REPO_PATH.search(path)
+
+        return match.group('repo') if match is not None and match.group('repo') in self.repos else None
+
+    @staticmethod
+    def _pullRequestKey(path: str) -> Optional[Tuple[str, int]]:
+        match = _PULL_REQUEST_PATH.search(path)
+
+        return (match.group('repo'), int(match.group('pullRequestId'))) if match is not None else None
+
+    # the route handlers all take the request path and query, whether or not they use them
+    # pylint: disable=unused-argument
+    def entitlementsPage(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, dict, Dict[str, str]]:
+        start = int(query.get('continuationToken', ['0'])[0])
+        end = min(start + ENTITLEMENTS_PAGE_SIZE, self.contributors)
+        headers = {'x-ms-continuationtoken': str(end)} if end < self.contributors else {}
+
+        return 200, {'value': [self.profile(i) for i in range(start, end)], 'count': end - start}, headers
+
+    def pullRequestsPage(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, dict, Dict[str, str]]:
+        repo = self._repo(path)
+
+        if repo is None:
+            return 404, {'message': 'unknown repository'}, {}
+
+        skip = int(query.get('$skip', ['0'])[0])
+        top = int(query.get('$top', ['100'])[0])
+        page = [self.pullRequest(repo, pullRequestId) for pullRequestId in range(skip + 1, min(skip + top, self.pullRequestsPerRepo) + 1)]
+
+        return 200, {'value': page, 'count': len(page)}, {}
+
+    def pullRequestCommitsPage(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, dict, Dict[str, str]]:
+        key = self._pullRequestKey(path)
+
+        if key is None:
+            return 404, {'message': 'unknown pull request'}, {}
+
+        page = [self.commit(*key, i) for i in range(self.commitsPerPullRequest)]
+
+        return 200, {'value': page, 'count': len(page)}, {}
+
+    def pullRequestThreadsPage(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, dict, Dict[str, str]]:
+        key = self._pullRequestKey(path)
+
+        if key is None:
+            return 404, {'message': 'unknown pull request'}, {}
+
+        page = [self.thread(*key, i) for i in range(self.threadsPerPullRequest)]
+
+        return 200, {'value': page, 'count': len(page)}, {}
+
+    def repoCommitsPage(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, dict, Dict[str, str]]:
+        repo = self._repo(path)
+
+        if repo is None:
+            return 404, {'message': 'unknown repository'}, {}
+
+        # the repo history holds every pull request commit, newest pull request first
+        total = self.pullRequestsPerRepo * self.commitsPerPullRequest
+        skip = int(query.get('searchCriteria.$skip', ['0'])[0])
+        top = int(query.get('searchCriteria.$top', ['100'])[0])
+        page = [self.commit(repo, self.pullRequestsPerRepo - k // self.commitsPerPullRequest, k % self.commitsPerPullRequest, withChangeCounts=True) for k in range(skip, min(skip + top, total))]
+
+        return 200, {'value': page, 'count': len(page)}, {}
+
+    def commitsBatch(self, path: str, query: Dict[str, List[str]], body: dict) -> Tuple[int, dict, Dict[str, str]]:
+        page = [self.commit(*self.parseCommitId(commitId), withChangeCounts=True) for commitId in body['ids']]
+
+        return 200, {'value': page, 'count': len(page)}, {}
+
+    def wiql(self, path: str, query: Dict[str, List[str]], body: dict) -> Tuple[int, dict, Dict[str, str]]:
+        # honors the created and changed date conditions of the query along with its $top, every work item is a user story
+        conditions = [(m.group('field'), _WIQL_OPERATORS[m.group('operator')], parseIsoTimestamp(m.group('date'))) for m in _WIQL_DATE_CONDITION.finditer(body['query'])]
+        workItemIds = [workItemId for workItemId in range(1, self.workitems + 1)
+                       if all(operator(parseIsoTimestamp(self.workitem(workItemId)['fields']['System.' + field]), bound) for field, operator, bound in conditions)]
+        workItems = [{'id': workItemId, 'url': "https://dev.azure.com/fabrikam/_apis/wit/workItems/{}".format(workItemId)} for workItemId in workItemIds[:int(query.get('$top', [str(len(workItemIds))])[0])]]
+
+        return 200, {'queryType': 'flat', 'asOf': isoTimestamp(SYNTHETIC_EPOCH + SYNTHETIC_SPAN), 'workItems': workItems}, {}
+
+    def workitemDetails(self, path: str, query: Dict[str, List[str]]) -> Tuple[int, dict, Dict[str, str]]:
+        page = [self.workitem(int(workItemId)) for workItemId in query['ids'][0].split(',')]
+
+        # like ADO, a fields list trims the documents to those fields and can't be combined with $expand
+        if 'fields' in query:
+            if '$expand' in query:
+                return 400, {'message': 'The expand parameter can not be used with the fields parameter.'}, {}
+
+            fields = query['fields'][0].split(',')
+            page = [{'id': workitem['id'], 'rev': workitem['rev'], 'fields': {f: workitem['fields'][f] for f in fields if f in workitem['fields']}, 'url': workitem['url']} for workitem in page]
+
+        return 200, {'value': page, 'count': len(page)}, {}
+
+    def addRoutes(self, server: FakeAdoServer) -> None:
+        server.addRoute('GET', r'/_apis/graph/users$', self.entitlementsPage)
+        server.addRoute('GET', r'/pullrequests/\d+/commits$', self.pullRequestCommitsPage)
+        server.addRoute('GET', r'/pullrequests/\d+/threads$', self.pullRequestThreadsPage)
+        server.addRoute('GET', r'/pullrequests$', self.pullRequestsPage)
+        server.addRoute('GET', r'/repositories/[^/]+/commits$', self.repoCommitsPage)
+        server.addRoute('POST', r'/repositories/[^/]+/commitsbatch$', self.commitsBatch, withBody=True)
+        server.addRoute('POST', r'/_apis/wit/wiql$', self.wiql, withBody=True)
+        server.addRoute('GET', r'/_apis/wit/workitems$', self.workitemDetails)
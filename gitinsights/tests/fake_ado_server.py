@@ -0,0 +1,160 @@
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+from gitinsights.mods.managers.repo_insights_base import ApiClient
+from gitinsights.mods.managers.repo_insights_base import RepoInsightsManager
+
+FIXTURE_DIRECTORY = os.path.join(os.path.dirname(__file__), 'unit', 'managers', 'ado', 'data')
+
+# ADO routes served from the unit test fixtures, matched in order against the request path
+ADO_FIXTURE_ROUTES = [
+    ('GET', r'/_apis/graph/users$', 'entitlements.json'),
+    ('GET', r'/pullrequests/\d+/commits$', 'prCommits.json'),
+    ('GET', r'/pullrequests/\d+/threads$', 'prThreads.json'),
+    ('GET', r'/pullrequests$', 'prStatsByProject.json'),
+    ('GET', r'/repositories/[^/]+/commits$', 'repoCommits.json'),
+    ('POST', r'/repositories/[^/]+/commitsbatch$', 'repoCommits.json'),
+    ('POST', r'/_apis/wit/wiql$', 'workitemList.json'),
+    ('GET', r'/_apis/wit/workitems$', 'workitemDetails.json'),
+]
+
+# A route handler receives the request path and query parameters (plus the json request body for routes added
+# with withBody=True) and returns (status, json body, headers)
+RouteHandler = Callable[..., Tuple[int, dict, Dict[str, str]]]
+
+
+def redirectManager(manager: RepoInsightsManager, host: str) -> None:
+    # point every ADO client owned by the manager at a fake server
+    for client in vars(manager).values():
+        if isinstance(client, ApiClient):
+            client.baseUrl = host
+            client.scheme = 'http'
+
+
+class _Server(ThreadingHTTPServer):
+    # deep enough for the connection bursts of highly concurrent clients
+    request_queue_size = 128
+
+
+class FakeAdoServer:
+    def __init__(self):
+        self.routes: List[Tuple[str, str, RouteHandler, Optional[str], bool]] = []
+        self.requestLog: List[Tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        if self._server is None:
+            raise RuntimeError('The fake ADO server is not started')
+
+        return "127.0.0.1:{}".format(self._server.server_address[1])
+
+    def addJsonRoute(self, method: str, pathPattern: str, body: dict, etag: Optional[str] = None) -> None:
+        self.addRoute(method, pathPattern, lambda path, query: (200, body, {}), etag)
+
+    def addRoute(self, method: str, pathPattern: str, handler: RouteHandler, etag: Optional[str] = None, withBody: bool = False) -> None:
+        # routes with an etag answer a matching If-None-Match with 304 Not Modified
+        self.routes.append((method, pathPattern, handler, etag, withBody))
+
+    def addAdoFixtureRoutes(self) -> None:
+        for method, pathPattern, fixture in ADO_FIXTURE_ROUTES:
+            with open(os.path.join(FIXTURE_DIRECTORY, fixture)) as f:
+                self.addJsonRoute(method, pathPattern, json.load(f))
+
+    def redirect(self, manager: RepoInsightsManager) -> None:
+        redirectManager(manager, self.host)
+
+    def requestCount(self) -> int:
+        with self._lock:
+            return len(self.requestLog)
+
+    def dispatch(self, method: str, rawPath: str, requestHeaders: Dict[str, str], requestBody: Optional[dict] = None) -> Tuple[int, Optional[dict], Dict[str, str]]:
+        url = urlsplit(rawPath)
+
+        with self._lock:
+            self.requestLog.append((method, rawPath))
+
+        for routeMethod, pathPattern, handler, etag, withBody in self.routes:
+            if routeMethod == method and re.search(pathPattern, url.path):
+                arguments = (url.path, parse_qs(url.query), requestBody) if withBody else (url.path, parse_qs(url.query))
+
+                if etag is None:
+                    return handler(*arguments)
+
+                if requestHeaders.get('If-None-Match') == etag:
+                    return 304, None, {'ETag': etag}
+
+                status, body, headers = handler(*arguments)
+
+                return status, body, {**headers, 'ETag': etag}
+
+        return 404, {'message': 'no route for {}'.format(url.path)}, {}
+
+    def _handlerClass(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            # pylint: disable=invalid-name
+            def _respond(self, method: str):
+                contentLength = int(self.headers.get('Content-Length', 0))
+                requestBody = json.loads(self.rfile.read(contentLength)) if contentLength else None
+
+                status, body, headers = server.dispatch(method, self.path, dict(self.headers), requestBody)
+                payload = json.dumps(body).encode('utf-8') if status != 304 else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+
+                for name, value in headers.items():
+                    self.send_header(name, value)
+
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                self._respond('POST')
+
+            # pylint: disable=redefined-builtin
+            def log_message(self, format, *args):
+                pass
+
+        return _Handler
+
+    def start(self) -> 'FakeAdoServer':
+        self._server = _Server(('127.0.0.1', 0), self._handlerClass())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> 'FakeAdoServer':
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
@@ -0,0 +1,53 @@
+from typing import Optional
+from typing import Tuple
+from unittest import TestCase
+
+import pandas as pd
+
+from gitinsights.mods.managers.ado import AzureDevopsClientManager
+from gitinsights.mods.managers.ado import CollectionSettings
+from gitinsights.tests.benchmarks.synthetic_ado import SyntheticAdoDataset
+from gitinsights.tests.fake_ado_server import FakeAdoServer
+from gitinsights.tests.fake_ado_server import redirectManager
+
+SYNTHETIC_ORGANIZATION = 'fabrikam'
+SYNTHETIC_TEAM = 'synthetic-team'
+
+
+def syntheticManager(dataset: SyntheticAdoDataset, host: str, **kwargs) -> AzureDevopsClientManager:
+    manager = AzureDevopsClientManager(SYNTHETIC_ORGANIZATION, dataset.project, dataset.repos, SYNTHETIC_TEAM, 'token', settings=CollectionSettings(**kwargs))
+    redirectManager(manager, host)
+
+    return manager
+
+
+def collectSyntheticActivity(dataset: SyntheticAdoDataset, **kwargs) -> Tuple[AzureDevopsClientManager, pd.DataFrame]:
+    # collects the dataset once off a short lived server, for the test cases sharing its events across their tests
+    with FakeAdoServer() as server:
+        dataset.addRoutes(server)
+        manager = syntheticManager(dataset, server.host, **kwargs)
+
+        return manager, manager.collectPullRequestActivity()
+
+
+# Starts a fake ADO server for every test, serving the synthetic dataset sized by datasetSettings. Test cases
+# leaving datasetSettings unset serve the routes, or datasets, of their own tests.
+class SyntheticAdoTestCase(TestCase):
+    datasetSettings: Optional[dict] = None
+
+    def setUp(self):
+        self.server = FakeAdoServer().start()
+        self.addCleanup(self.server.stop)
+        self.dataset: Optional[SyntheticAdoDataset] = self.serveDataset(**self.datasetSettings) if self.datasetSettings is not None else None
+
+    def serveDataset(self, **settings) -> SyntheticAdoDataset:
+        dataset = SyntheticAdoDataset(**settings)
+        dataset.addRoutes(self.server)
+
+        return dataset
+
+    def manager(self, **kwargs) -> AzureDevopsClientManager:
+        if self.dataset is None:
+            raise TypeError('The test case serves no synthetic dataset')
+
+        return syntheticManager(self.dataset, self.server.host, **kwargs)
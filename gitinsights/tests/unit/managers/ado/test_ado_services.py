@@ -1,20 +1,26 @@
+import datetime
 import json
 import math
 import os
+import tempfile
 from typing import List
 from typing import Set
 from unittest import TestCase
 from unittest.mock import Mock
 from unittest.mock import patch
 
+import pandas as pd
 from requests.models import Response
 
+from gitinsights.mods.incremental import IncrementalStateStore
 from gitinsights.mods.managers.ado import AdoGetOrgEntitlementsClient
 from gitinsights.mods.managers.ado import AdoGetProjectWorkItemsClient
 from gitinsights.mods.managers.ado import AdoPullRequestCommitsClient
 from gitinsights.mods.managers.ado import AdoPullRequestReviewCommentsClient
 from gitinsights.mods.managers.ado import AdoPullRequestsClient
 from gitinsights.mods.managers.ado import AzureDevopsClientManager
+from gitinsights.mods.managers.ado import CollectionSettings
+from gitinsights.mods.timestamps import deriveTimestampFields
 
 
 def loadMockFile(filePath: str):
@@ -116,6 +122,42 @@ class Test_ADOPrStatService(TestCase):
         self.assertEqual(aggregateColumn(response, 'commit_change_count_additions'), 5)
         self.assertEqual(aggregateColumn(response, 'commit_change_count_edits'), 0)
 
+    @patch('gitinsights.mods.managers.repo_insights_base.requests.Session.get')
+    @patch('gitinsights.mods.managers.repo_insights_base.requests.Session.post')
+    def test_repo_pr_commits_by_commit_id(self, mock_post, mock_get):
+        mock_get.side_effect = [JsonToResponse(self.mockedEntitlementReponse), JsonToResponse(self.mockedPrCommitsResponse)]
+        mock_post.return_value.json.return_value = self.mockedRepoCommitsResponse
+        # pylint: disable=protected-access
+        entitlements = AdoGetOrgEntitlementsClient("myorg", "dev.azure.com", "6.0", "", self.clientManager._reportableFieldDefaults).getDeserializedDataset()[0]
+        client = AdoPullRequestCommitsClient("myorg", "dev.azure.com", "6.0", "", self.clientManager._reportableFieldDefaults, changeCountsByCommitId=True)
+        response = client.getDeserializedDataset(repo="repo1", project=self.clientManager.project, pullRequestId="112", entitlements=entitlements)
+
+        self.assertEqual(len(response), 8)
+        self.assertEqual(aggregateColumn(response, 'commit_change_count_deletes'), 3)
+        self.assertEqual(aggregateColumn(response, 'commit_change_count_additions'), 5)
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertTrue(mock_post.call_args[0][0].endswith('/repositories/repo1/commitsbatch?$top=8&api-version=6.0'))
+        self.assertEqual(len(mock_post.call_args[1]['json']['ids']), 8)
+
+        # change counts already looked up aren't requested again
+        mock_get.side_effect = [JsonToResponse(self.mockedPrCommitsResponse)]
+        client.getDeserializedDataset(repo="repo1", project=self.clientManager.project, pullRequestId="112", entitlements=entitlements)
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('gitinsights.mods.managers.repo_insights_base.requests.Session.get')
+    def test_repo_commits_reporting_window(self, mock_get):
+        mock_get.return_value.json.return_value = {'value': [], 'count': 0}
+        # pylint: disable=protected-access
+        client = AdoPullRequestCommitsClient("myorg", "dev.azure.com", "6.0", "", self.clientManager._reportableFieldDefaults,
+                                             fromDate=datetime.datetime(2020, 10, 1), toDate=datetime.datetime(2020, 12, 31))
+
+        self.assertEqual(client.getAllCommitsByRepo("repo1", self.clientManager.project), {})
+        self.assertIn('searchCriteria.fromDate=2020-10-01T00:00:00Z&searchCriteria.toDate=2020-12-31T00:00:00Z', mock_get.call_args[0][0])
+
+        # aware dates of other offsets are converted to utc rather than stamped as such
+        client.getAllCommitsByRepo("repo1", self.clientManager.project, fromDate=datetime.datetime(2020, 10, 1, 2, tzinfo=datetime.timezone(datetime.timedelta(hours=2))))
+        self.assertIn('searchCriteria.fromDate=2020-10-01T00:00:00Z&', mock_get.call_args[0][0])
+
     @patch('gitinsights.mods.managers.repo_insights_base.requests.Session.get')
     @patch('gitinsights.mods.managers.repo_insights_base.requests.Session.post')
     def test_project_workitems(self, mock_post, mock_get):
@@ -148,11 +190,15 @@ class Test_ADOPrStatService(TestCase):
             client.getDeserializedDataset(project=self.clientManager.project)
 
         self.assertEqual(len(response), 3)
+        # pylint: disable=protected-access
+        frame = deriveTimestampFields(pd.DataFrame(response), self.clientManager._reportableFields)
+        submissions = frame[frame['user_story_initial_pr_submission_days'].notna()]
 
-        for record in response:
-            if 'user_story_initial_pr_submission_days' in record and not math.isnan(record['user_story_initial_pr_submission_days']):
-                self.assertEqual(math.floor(record['user_story_initial_pr_submission_days']), 13)
-                self.assertEqual(record['contributor'], "Normal Paulk")
+        self.assertEqual(len(submissions), 1)
+
+        for _, record in submissions.iterrows():
+            self.assertEqual(math.floor(record['user_story_initial_pr_submission_days']), 13)
+            self.assertEqual(record['contributor'], "Normal Paulk")
 
     @patch('gitinsights.mods.clients.ado.entitlements.AdoGetOrgEntitlementsClient.GetResponse')
     @patch('gitinsights.mods.clients.ado.pull_request.AdoPullRequestsClient.GetResponse')
@@ -192,21 +238,21 @@ class Test_ADOPrStatService(TestCase):
         agg = self.clientManager.aggregatePullRequestActivity(['week'])
 
         self.assertEqual(len(agg), 1)
-        self.assertEqual(agg.loc['44', 'prs_submitted'], 4)
-        self.assertEqual(agg.loc['44', 'prs_merged'], 1)
-        self.assertEqual(agg.loc['44', 'pr_completion_days'], 2)
-        self.assertEqual(agg.loc['44', 'pr_comments'], 12)
-        self.assertEqual(agg.loc['44', 'prs_reviewed'], 1)
-        self.assertEqual(agg.loc['44', 'pr_commits_pushed'], 32)
-        self.assertEqual(agg.loc['44', 'commit_change_count_additions'], 20)
-        self.assertEqual(agg.loc['44', 'commit_change_count_edits'], 0)
-        self.assertEqual(agg.loc['44', 'commit_change_count_deletes'], 12)
-        self.assertEqual(agg.loc['44', 'user_stories_assigned'], 2)
-        self.assertEqual(agg.loc['44', 'user_stories_completed'], 1)
-        self.assertEqual(agg.loc['44', 'user_story_points_assigned'], 12)
-        self.assertEqual(int(agg.loc['44', 'user_story_initial_pr_submission_days']), 2)
-        self.assertEqual(agg.loc['44', 'user_story_completion_days'], 1)
-        self.assertEqual(agg.loc['44', 'user_stories_created'], 3)
+        self.assertEqual(agg.loc[201644, 'prs_submitted'], 4)
+        self.assertEqual(agg.loc[201644, 'prs_merged'], 1)
+        self.assertEqual(agg.loc[201644, 'pr_completion_days'], 2)
+        self.assertEqual(agg.loc[201644, 'pr_comments'], 12)
+        self.assertEqual(agg.loc[201644, 'prs_reviewed'], 1)
+        self.assertEqual(agg.loc[201644, 'pr_commits_pushed'], 32)
+        self.assertEqual(agg.loc[201644, 'commit_change_count_additions'], 20)
+        self.assertEqual(agg.loc[201644, 'commit_change_count_edits'], 0)
+        self.assertEqual(agg.loc[201644, 'commit_change_count_deletes'], 12)
+        self.assertEqual(agg.loc[201644, 'user_stories_assigned'], 2)
+        self.assertEqual(agg.loc[201644, 'user_stories_completed'], 1)
+        self.assertEqual(agg.loc[201644, 'user_story_points_assigned'], 12)
+        self.assertEqual(int(agg.loc[201644, 'user_story_initial_pr_submission_days']), 2)
+        self.assertEqual(agg.loc[201644, 'user_story_completion_days'], 1)
+        self.assertEqual(agg.loc[201644, 'user_stories_created'], 3)
 
     @patch('gitinsights.mods.clients.ado.entitlements.AdoGetOrgEntitlementsClient.GetResponse')
     @patch('gitinsights.mods.clients.ado.pull_request.AdoPullRequestsClient.GetResponse')
@@ -228,18 +274,140 @@ class Test_ADOPrStatService(TestCase):
         agg = self.clientManager.aggregatePullRequestActivity(['week'])
 
         self.assertEqual(len(agg), 1)
-        self.assertEqual(agg.loc['44', 'prs_submitted'], 8)
-        self.assertEqual(agg.loc['44', 'prs_merged'], 2)
-        self.assertEqual(agg.loc['44', 'pr_completion_days'], 2)
-        self.assertEqual(agg.loc['44', 'pr_comments'], 24)
-        self.assertEqual(agg.loc['44', 'prs_reviewed'], 2)
-        self.assertEqual(agg.loc['44', 'pr_commits_pushed'], 64)
-        self.assertEqual(agg.loc['44', 'commit_change_count_additions'], 40)
-        self.assertEqual(agg.loc['44', 'commit_change_count_edits'], 0)
-        self.assertEqual(agg.loc['44', 'commit_change_count_deletes'], 24)
-        self.assertEqual(agg.loc['44', 'user_stories_assigned'], 2)
-        self.assertEqual(agg.loc['44', 'user_stories_completed'], 1)
-        self.assertEqual(agg.loc['44', 'user_story_points_assigned'], 12)
-        self.assertEqual(int(agg.loc['44', 'user_story_initial_pr_submission_days']), 2)
-        self.assertEqual(agg.loc['44', 'user_story_completion_days'], 1)
-        self.assertEqual(agg.loc['44', 'user_stories_created'], 3)
+        self.assertEqual(agg.loc[201644, 'prs_submitted'], 8)
+        self.assertEqual(agg.loc[201644, 'prs_merged'], 2)
+        self.assertEqual(agg.loc[201644, 'pr_completion_days'], 2)
+        self.assertEqual(agg.loc[201644, 'pr_comments'], 24)
+        self.assertEqual(agg.loc[201644, 'prs_reviewed'], 2)
+        self.assertEqual(agg.loc[201644, 'pr_commits_pushed'], 64)
+        self.assertEqual(agg.loc[201644, 'commit_change_count_additions'], 40)
+        self.assertEqual(agg.loc[201644, 'commit_change_count_edits'], 0)
+        self.assertEqual(agg.loc[201644, 'commit_change_count_deletes'], 24)
+        self.assertEqual(agg.loc[201644, 'user_stories_assigned'], 2)
+        self.assertEqual(agg.loc[201644, 'user_stories_completed'], 1)
+        self.assertEqual(agg.loc[201644, 'user_story_points_assigned'], 12)
+        self.assertEqual(int(agg.loc[201644, 'user_story_initial_pr_submission_days']), 2)
+        self.assertEqual(agg.loc[201644, 'user_story_completion_days'], 1)
+        self.assertEqual(agg.loc[201644, 'user_stories_created'], 3)
+
+    @patch('gitinsights.mods.clients.ado.entitlements.AdoGetOrgEntitlementsClient.GetResponse')
+    @patch('gitinsights.mods.clients.ado.pull_request.AdoPullRequestsClient.GetResponse')
+    @patch('gitinsights.mods.clients.ado.commits.AdoPullRequestCommitsClient.GetCommitsByRepoResponse')
+    @patch('gitinsights.mods.clients.ado.commits.AdoPullRequestCommitsClient.GetCommitsByPrResponse')
+    @patch('gitinsights.mods.clients.ado.comments.AdoPullRequestReviewCommentsClient.GetResponse')
+    @patch('gitinsights.mods.clients.ado.workitems.AdoGetProjectWorkItemsClient.PostResponse')
+    @patch('gitinsights.mods.clients.ado.workitems.AdoGetProjectWorkItemsClient.GetResponse')
+    def test_concurrent_collection_matches_serial(self, workitemsGetMock, workitemsPostMock, commentsMock, commitsByPrMock, commitsByRepoMock, prMock, entitlementsMock):
+        workitemsGetMock.return_value.json.return_value = self.mockedWorkitemDetailsResponse
+        workitemsPostMock.return_value.json.return_value = self.mockedWorkitemListResponse
+        commentsMock.return_value.json.return_value = self.mockedPrThreadsResponse
+        commitsByPrMock.return_value.json.return_value = self.mockedPrCommitsResponse
+        commitsByRepoMock.return_value.json.return_value = self.mockedRepoCommitsResponse
+        prMock.return_value.json.return_value = self.mockedRepoPrResponse
+        entitlementsMock.return_value.json.return_value = self.mockedEntitlementReponse
+
+        serialManager = AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1")
+        concurrentManager = AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1", settings=CollectionSettings(maxWorkers=4, maxConcurrentRequestsPerHost=2))
+
+        serialFrame = serialManager.collectPullRequestActivity()
+        commitsByRepoMock.reset_mock()
+
+        pd.testing.assert_frame_equal(serialFrame, concurrentManager.collectPullRequestActivity())
+        # the repo commit history is paged once per repo even when PR workers race for it
+        self.assertEqual(commitsByRepoMock.call_count, 2)
+
+    @patch('gitinsights.mods.clients.ado.entitlements.AdoGetOrgEntitlementsClient.GetResponse')
+    @patch('gitinsights.mods.clients.ado.pull_request.AdoPullRequestsClient.GetResponse')
+    @patch('gitinsights.mods.clients.ado.commits.AdoPullRequestCommitsClient.GetCommitsByRepoResponse')
+    @patch('gitinsights.mods.clients.ado.commits.AdoPullRequestCommitsClient.GetCommitsByPrResponse')
+    @patch('gitinsights.mods.clients.ado.comments.AdoPullRequestReviewCommentsClient.GetResponse')
+    @patch('gitinsights.mods.clients.ado.workitems.AdoGetProjectWorkItemsClient.PostResponse')
+    @patch('gitinsights.mods.clients.ado.workitems.AdoGetProjectWorkItemsClient.GetResponse')
+    def test_incremental_aggregate_activity(self, workitemsGetMock, workitemsPostMock, commentsMock, commitsByPrMock, commitsByRepoMock, prMock, entitlementsMock):
+        workitemsGetMock.return_value.json.return_value = self.mockedWorkitemDetailsResponse
+        workitemsPostMock.return_value.json.return_value = self.mockedWorkitemListResponse
+        commentsMock.return_value.json.return_value = self.mockedPrThreadsResponse
+        commitsByPrMock.return_value.json.return_value = self.mockedPrCommitsResponse
+        commitsByRepoMock.return_value.json.return_value = self.mockedRepoCommitsResponse
+        prMock.return_value.json.return_value = self.mockedRepoPrResponse
+        entitlementsMock.return_value.json.return_value = self.mockedEntitlementReponse
+        groupByColumns = ['contributor', 'week', 'repo']
+
+        expected = AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1").aggregatePullRequestActivity(groupByColumns)
+
+        with tempfile.TemporaryDirectory() as stateDirectory:
+            for _ in range(2):
+                commitsByPrMock.reset_mock()
+                commitsByRepoMock.reset_mock()
+                workitemsPostMock.reset_mock()
+                manager = AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1", settings=CollectionSettings(incrementalStore=IncrementalStateStore(stateDirectory)))
+                agg = manager.aggregatePullRequestActivity(groupByColumns)
+
+                # the persisted partials are merged back as plain keys rather than categoricals
+                pd.testing.assert_frame_equal(agg, expected, check_dtype=False, check_index_type=False, check_categorical=False)
+
+            # only the three active pull requests per repo are re-fetched once the watermarks exist
+            self.assertEqual(commitsByPrMock.call_count, 6)
+            # the repo histories persisted by the first run aren't paged through again
+            commitsByRepoMock.assert_not_called()
+            self.assertIn('[System.ChangedDate] >', workitemsPostMock.call_args[0][1]['query'])
+
+            with self.assertRaises(ValueError):
+                manager.aggregatePullRequestActivity(['pullRequestId'])
+
+            # aggregates persisted before the ISO year joined the grain can't be merged
+            store = IncrementalStateStore(stateDirectory)
+            store.saveAggregates(store.loadAggregates().drop(columns=['year']))
+
+            with self.assertRaises(ValueError):
+                AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1", settings=CollectionSettings(incrementalStore=store)).aggregatePullRequestActivity(groupByColumns)
+
+            # as can't those persisted before the duration sketches
+            store.saveAggregates(store.loadAggregates().assign(year=2016).drop(columns=['pr_completion_days__sketch']))
+
+            with self.assertRaises(ValueError):
+                AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1", settings=CollectionSettings(incrementalStore=store)).aggregatePullRequestActivity(groupByColumns)
+
+    @patch('gitinsights.mods.clients.ado.entitlements.AdoGetOrgEntitlementsClient.GetResponse')
+    @patch('gitinsights.mods.clients.ado.pull_request.AdoPullRequestsClient.GetResponse')
+    @patch('gitinsights.mods.clients.ado.commits.AdoPullRequestCommitsClient.PostCommitsBatchResponse')
+    @patch('gitinsights.mods.clients.ado.commits.AdoPullRequestCommitsClient.GetCommitsByRepoResponse')
+    @patch('gitinsights.mods.clients.ado.commits.AdoPullRequestCommitsClient.GetCommitsByPrResponse')
+    @patch('gitinsights.mods.clients.ado.comments.AdoPullRequestReviewCommentsClient.GetResponse')
+    @patch('gitinsights.mods.clients.ado.workitems.AdoGetProjectWorkItemsClient.PostResponse')
+    @patch('gitinsights.mods.clients.ado.workitems.AdoGetProjectWorkItemsClient.GetResponse')
+    def test_incremental_commits_predating_watermark(self, workitemsGetMock, workitemsPostMock, commentsMock, commitsByPrMock, commitsByRepoMock, commitsBatchMock, prMock, entitlementsMock):
+        # pylint: disable=too-many-locals
+        workitemsGetMock.return_value.json.return_value = self.mockedWorkitemDetailsResponse
+        workitemsPostMock.return_value.json.return_value = self.mockedWorkitemListResponse
+        commentsMock.return_value.json.return_value = self.mockedPrThreadsResponse
+        commitsByPrMock.return_value.json.return_value = self.mockedPrCommitsResponse
+        # the repo history search only returns the commits dated within the searched window
+        commitsByRepoMock.side_effect = lambda resourcePath, parameters: JsonToResponse({'value': [], 'count': 0} if 'searchCriteria.fromDate' in parameters else self.mockedRepoCommitsResponse)
+        prMock.return_value.json.return_value = self.mockedRepoPrResponse
+        entitlementsMock.return_value.json.return_value = self.mockedEntitlementReponse
+        groupByColumns = ['contributor', 'week', 'repo']
+        lateCommit = self.mockedRepoCommitsResponse['value'][0]
+        commitsBatchMock.return_value.json.return_value = {'value': [lateCommit], 'count': 1}
+
+        expected = AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1").aggregatePullRequestActivity(groupByColumns)
+
+        with tempfile.TemporaryDirectory() as stateDirectory:
+            store = IncrementalStateStore(stateDirectory)
+            AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1", settings=CollectionSettings(incrementalStore=store)).aggregatePullRequestActivity(groupByColumns)
+
+            # a commit authored before the watermark but only merged into an active pull request since then
+            commitChangeCounts = store.loadLookup('commitChangeCounts')
+
+            for repoCommitChangeCounts in commitChangeCounts.values():
+                del repoCommitChangeCounts[lateCommit['commitId']]
+
+            store.saveLookup('commitChangeCounts', commitChangeCounts)
+            commitsByRepoMock.reset_mock()
+            store = IncrementalStateStore(stateDirectory)
+            agg = AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1", settings=CollectionSettings(incrementalStore=store)).aggregatePullRequestActivity(groupByColumns)
+
+            pd.testing.assert_frame_equal(agg, expected, check_dtype=False, check_index_type=False, check_categorical=False)
+            commitsByRepoMock.assert_not_called()
+            self.assertEqual(commitsBatchMock.call_args[0][1], {'ids': [lateCommit['commitId']]})
+            self.assertIn(lateCommit['commitId'], store.loadLookup('commitChangeCounts')['repo1'])
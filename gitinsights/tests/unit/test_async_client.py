@@ -0,0 +1,87 @@
+import asyncio
+import time
+from unittest import TestCase
+
+import aiohttp
+import pandas as pd
+from requests.exceptions import RetryError
+
+from gitinsights.mods.async_client import AsyncApiClient
+from gitinsights.mods.clients.ado.pull_request import AdoPullRequestsClient
+from gitinsights.mods.managers.ado import AzureDevopsClientManager
+from gitinsights.mods.managers.ado import CollectionSettings
+from gitinsights.mods.transport import JsonResponse
+from gitinsights.tests.fake_ado_server import FakeAdoServer
+
+
+class Test_AsyncApiClient(TestCase):
+    def setUp(self):
+        self.server = FakeAdoServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def sendGetRequest(self, client: AdoPullRequestsClient) -> JsonResponse:
+        async def send():
+            async with aiohttp.ClientSession() as session:
+                return await AsyncApiClient(client, session).sendGetRequest(client.ResourcePath('project', 'repo1'), client.UriParameters())
+
+        return asyncio.run(send())
+
+    def test_async_collection_matches_sync(self):
+        self.server.addAdoFixtureRoutes()
+        syncManager = AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1")
+        asyncManager = AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1", settings=CollectionSettings(maxConcurrentRequestsPerHost=4))
+        self.server.redirect(syncManager)
+        self.server.redirect(asyncManager)
+
+        syncFrame = syncManager.collectPullRequestActivity()
+        syncRequestCount = self.server.requestCount()
+        asyncFrame = asyncio.run(asyncManager.collectPullRequestActivityAsync())
+
+        pd.testing.assert_frame_equal(syncFrame, asyncFrame)
+        self.assertEqual(self.server.requestCount(), syncRequestCount * 2)
+        pd.testing.assert_frame_equal(syncManager.aggregatePullRequestActivity(['week']), asyncio.run(asyncManager.aggregatePullRequestActivityAsync(['week'])))
+
+    def test_change_counts_by_commit_id_match_repo_history(self):
+        self.server.addAdoFixtureRoutes()
+        repoHistoryManager = AzureDevopsClientManager("myorg", "my-super-project", ["repo1"], "team-buffalo", "token-1")
+        commitIdManager = AzureDevopsClientManager("myorg", "my-super-project", ["repo1"], "team-buffalo", "token-1", settings=CollectionSettings(changeCountsByCommitId=True))
+        self.server.redirect(repoHistoryManager)
+        self.server.redirect(commitIdManager)
+
+        pd.testing.assert_frame_equal(repoHistoryManager.collectPullRequestActivity(), asyncio.run(commitIdManager.collectPullRequestActivityAsync()))
+        self.assertTrue(any(path.split('?')[0].endswith('/commitsbatch') for _, path in self.server.requestLog))
+
+    def test_honors_retry_after_on_throttling(self):
+        responses = [(429, {'message': 'throttled'}, {'Retry-After': '0.3'}), (200, {'value': [], 'count': 0}, {})]
+        self.server.addRoute('GET', r'/pullrequests$', lambda path, query: responses.pop(0))
+        client = AdoPullRequestsClient("myorg", self.server.host, "6.0", "token", {}, retry_backoff_factor=0, scheme='http')
+
+        started = time.monotonic()
+        response = self.sendGetRequest(client)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'value': [], 'count': 0})
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(self.server.requestCount(), 2)
+
+    def test_raises_once_retries_are_exhausted(self):
+        self.server.addRoute('GET', r'/pullrequests$', lambda path, query: (503, {'message': 'unavailable'}, {}))
+        client = AdoPullRequestsClient("myorg", self.server.host, "6.0", "token", {}, retry_count=2, retry_backoff_factor=0, scheme='http')
+
+        with self.assertRaises(RetryError):
+            self.sendGetRequest(client)
+
+        self.assertEqual(self.server.requestCount(), 3)
+
+    def test_backoff_matches_urllib3_retry(self):
+        client = AdoPullRequestsClient("myorg", "dev.azure.com", "6.0", "token", {}, retry_backoff_factor=0.5)
+        asyncClient = AsyncApiClient(client, None)
+
+        self.assertEqual(asyncClient.backoffSeconds(1), 0)
+        self.assertEqual(asyncClient.backoffSeconds(2), 1)
+        self.assertEqual(asyncClient.backoffSeconds(3), 2)
+        self.assertEqual(asyncClient.backoffSeconds(3, JsonResponse(429, {'Retry-After': '7'}, None)), 7)
+        self.assertEqual(asyncClient.backoffSeconds(3, JsonResponse(500, {'Retry-After': '7'}, None)), 2)
+        self.assertEqual(asyncClient.backoffSeconds(3, JsonResponse(429, {'Retry-After': 'soon'}, None)), 2)
@@ -0,0 +1,50 @@
+import asyncio
+from unittest import TestCase
+
+import pandas as pd
+
+from gitinsights.tests.benchmarks.benchmark import findRegressions
+from gitinsights.tests.benchmarks.benchmark import runBenchmark
+from gitinsights.tests.benchmarks.synthetic_ado import SyntheticAdoDataset
+from gitinsights.tests.synthetic_ado_case import SyntheticAdoTestCase
+
+
+class Test_SyntheticAdoDataset(SyntheticAdoTestCase):
+    datasetSettings = {'repos': 2, 'pullRequestsPerRepo': 12, 'threadsPerPullRequest': 3, 'commentsPerThread': 2, 'commitsPerPullRequest': 3, 'workitems': 30, 'contributors': 8}
+
+    def test_payloads_are_deterministic(self):
+        self.assertEqual(self.dataset.pullRequest('repo1', 3), SyntheticAdoDataset(repos=2, contributors=8).pullRequest('repo1', 3))
+        self.assertNotEqual(self.dataset.pullRequest('repo1', 3), SyntheticAdoDataset(repos=2, contributors=8, seed=1).pullRequest('repo1', 3))
+        self.assertEqual(self.dataset.parseCommitId(self.dataset.commitId('repo2', 11, 2)), ('repo2', 11, 2))
+
+    def test_collects_every_synthetic_event(self):
+        frame = self.manager().collectPullRequestActivity()
+
+        self.assertEqual(frame['prs_submitted'].sum(), 24)
+        self.assertEqual(frame['pr_commits_pushed'].sum(), 24 * 3)
+        self.assertEqual(frame['pr_comments'].sum(), 24 * 2 * 2)
+        self.assertEqual(frame['user_stories_created'].sum(), 30)
+        self.assertGreater(frame['user_story_initial_pr_submission_days'].notna().sum(), 0)
+        self.assertEqual(frame['contributor'].dtype, 'category')
+        self.assertEqual(frame['week'].dtype, 'Int32')
+        # the work item details and relations come in one batch
+        self.assertEqual(self.server.requestCount(), 1 + 2 * 2 + 24 * 2 + 1 + 1)
+
+    def test_collection_modes_agree(self):
+        repoHistoryFrame = self.manager().collectPullRequestActivity()
+
+        pd.testing.assert_frame_equal(repoHistoryFrame, asyncio.run(self.manager(changeCountsByCommitId=True).collectPullRequestActivityAsync()))
+
+
+class Test_Benchmark(TestCase):
+    def test_reports_wall_time_requests_and_stages(self):
+        dataset = SyntheticAdoDataset(repos=1, pullRequestsPerRepo=5, threadsPerPullRequest=2, commitsPerPullRequest=2, workitems=5, contributors=4)
+        result = runBenchmark(dataset, maxWorkers=2)
+
+        self.assertEqual(result['requests'], 1 + 2 + 5 * 2 + 2)
+        self.assertEqual(result['stages']['pr_commits']['calls'], 5)
+        self.assertEqual(result['stages']['pr_commits']['records'], 10)
+        self.assertEqual(set(result['stages']), {'entitlements', 'pull_requests', 'pr_commits', 'pr_comments', 'workitems', 'frame', 'collect', 'aggregate'})
+        self.assertGreater(result['peak_rss_mb'], 0)
+        self.assertEqual(findRegressions(result, result, 0.2), [])
+        self.assertEqual(len(findRegressions({**result, 'requests': result['requests'] + 1}, result, 0.2)), 1)
@@ -0,0 +1,76 @@
+import datetime
+import json
+import re
+
+from gitinsights.mods.clients.ado.comments import AdoPullRequestReviewCommentsClient
+from gitinsights.mods.timestamps import parseIsoTimestamp
+from gitinsights.mods.transport import JsonResponse
+from gitinsights.tests.synthetic_ado_case import SyntheticAdoTestCase
+
+THREADS_PATH = re.compile(r'/repositories/(?P<repo>[^/]+)/pullrequests/(?P<pullRequestId>\d+)/threads')
+
+
+class Test_AdoPullRequestReviewCommentsClient(SyntheticAdoTestCase):
+    datasetSettings = {'repos': 2, 'pullRequestsPerRepo': 20, 'threadsPerPullRequest': 3, 'commitsPerPullRequest': 1, 'workitems': 0, 'contributors': 5}
+
+    def setUp(self):
+        super().setUp()
+        self.client = AdoPullRequestReviewCommentsClient("fabrikam", "dev.azure.com", "6.0", "token", {})
+
+    def test_threads_are_decoded_down_to_the_comment_fields(self):
+        threads = [self.dataset.thread('repo1', 1, threadId) for threadId in range(3)]
+
+        # the thread context, properties and links ADO adds to every thread
+        for thread in threads:
+            thread.update({'threadContext': {'filePath': '/src/app.py', 'rightFileStart': {'line': 4, 'offset': 1}}, 'properties': {'CodeReviewThreadType': {'$type': 'System.String', '$value': 'VoteUpdate'}},
+                           '_links': {'self': {'href': 'https://dev.azure.com/fabrikam/_apis/git/repositories/repo1/pullRequests/1/threads'}}})
+
+        body = json.dumps({'value': threads, 'count': len(threads)}).encode('utf-8')
+        page = JsonResponse(200, {}, None, body).json(**self.client.pageDecodeOptions)['value']
+
+        self.assertEqual(page[1], {'comments': [{'author': {'displayName': comment['author']['displayName']}, 'lastUpdatedDate': comment['lastUpdatedDate'], 'commentType': 'text'}
+                                                for comment in threads[1]['comments']]})
+        self.assertEqual(self.client.DeserializeThreads(page, 'repo1'), self.client.DeserializeThreads(json.loads(body)['value'], 'repo1'))
+        self.assertIsNone(JsonResponse(200, {}, None, b'').json())
+
+    def test_threads_without_comments_are_decoded_empty(self):
+        body = json.dumps({'value': [{'id': 1, 'status': 'closed', 'properties': {}}, self.dataset.thread('repo1', 1, 1)], 'count': 2}).encode('utf-8')
+        page = JsonResponse(200, {}, None, body).json(**self.client.pageDecodeOptions)['value']
+
+        self.assertEqual(page[0], {})
+        self.assertEqual(len(self.client.DeserializeThreads(page, 'repo1')), len(self.dataset.thread('repo1', 1, 1)['comments']))
+
+    def test_skips_the_threads_of_pull_requests_outside_the_window(self):
+        fromDate = datetime.datetime(2021, 7, 1)
+        toDate = datetime.datetime(2021, 10, 1)
+        events = self.manager(commentsFromDate=fromDate, commentsToDate=toDate).collectPullRequestActivity()
+
+        fromDate, toDate = fromDate.replace(tzinfo=datetime.timezone.utc), toDate.replace(tzinfo=datetime.timezone.utc)
+        fetched = {(match.group('repo'), int(match.group('pullRequestId'))) for match in (THREADS_PATH.search(path) for method, path in self.server.requestLog) if match}
+        expectedComments = 0
+
+        for repo in self.dataset.repos:
+            for pullRequestId in range(1, 21):
+                pullRequest = self.dataset.pullRequest(repo, pullRequestId)
+                createdAfter = parseIsoTimestamp(pullRequest['creationDate']) > toDate
+                self.assertEqual((repo, pullRequestId) in fetched, not createdAfter)
+
+                if (repo, pullRequestId) in fetched:
+                    comments = [comment for threadId in range(3) for comment in self.dataset.thread(repo, pullRequestId, threadId)['comments']]
+                    expectedComments += len([c for c in comments if c['commentType'] != 'system' and fromDate <= parseIsoTimestamp(c['lastUpdatedDate']) <= toDate])
+
+        self.assertLess(0, len(fetched))
+        self.assertLess(len(fetched), 40)
+        self.assertEqual(events['pr_comments'].sum(), expectedComments)
+
+    def test_collects_the_comments_updated_after_a_completion_before_the_window(self):
+        fromDate = datetime.datetime(2021, 7, 1, tzinfo=datetime.timezone.utc)
+        repo, pullRequestId = next((repo, pullRequestId) for repo in self.dataset.repos for pullRequestId in range(1, 21)
+                                   if self.dataset.pullRequest(repo, pullRequestId)['status'] == 'completed' and parseIsoTimestamp(self.dataset.pullRequest(repo, pullRequestId)['closedDate']) < fromDate)
+        # a comment edited within the window, long after the pull request was completed
+        thread = {'id': 1, 'comments': [{'id': 1, 'author': {'displayName': 'Late Reviewer'}, 'lastUpdatedDate': '2021-08-02T10:00:00Z', 'commentType': 'text'}]}
+        self.server.routes.insert(0, ('GET', r'/repositories/{}/pullrequests/{}/threads$'.format(repo, pullRequestId), lambda path, query: (200, {'value': [thread], 'count': 1}, {}), None, False))
+
+        events = self.manager(commentsFromDate=fromDate.replace(tzinfo=None)).collectPullRequestActivity()
+
+        self.assertEqual(events.loc[events['contributor'] == 'Late Reviewer', 'pr_comments'].sum(), 1)
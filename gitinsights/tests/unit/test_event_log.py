@@ -0,0 +1,77 @@
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from gitinsights.mods.event_log import EventLog
+from gitinsights.mods.incremental import IncrementalStateStore
+from gitinsights.tests.synthetic_ado_case import SyntheticAdoTestCase
+
+GROUP_BY_COLUMNS = ['contributor', 'week', 'repo']
+
+
+class Test_EventLog(SyntheticAdoTestCase):
+    datasetSettings = {'repos': 2, 'pullRequestsPerRepo': 6, 'threadsPerPullRequest': 2, 'commitsPerPullRequest': 2, 'workitems': 10, 'contributors': 5}
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.eventLog = EventLog(os.path.join(self.directory.name, 'runs', 'events.ndjson.gz'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay_rebuilds_the_report_without_requests(self):
+        events = self.manager(eventLog=self.eventLog).collectPullRequestActivity()
+        requestCount = self.server.requestCount()
+        replayed = self.manager(eventLog=self.eventLog).replayPullRequestActivity()
+
+        self.assertEqual(self.server.requestCount(), requestCount)
+        self.assertEqual(self.eventLog.metadata()['repos'], self.dataset.repos)
+        pd.testing.assert_frame_equal(replayed, events)
+
+        # a different grouping of the same log
+        pd.testing.assert_frame_equal(self.manager(eventLog=self.eventLog).aggregateReplayedActivity(['repo']),
+                                      self.manager().aggregateEvents(events, ['repo']))
+
+    def test_async_collection_spills_the_same_records(self):
+        expected = self.manager().aggregatePullRequestActivity(GROUP_BY_COLUMNS)
+        asyncio.run(self.manager(eventLog=self.eventLog).collectPullRequestActivityAsync())
+
+        pd.testing.assert_frame_equal(self.manager(eventLog=self.eventLog).aggregateReplayedActivity(GROUP_BY_COLUMNS), expected)
+
+    def test_failed_collection_keeps_the_previous_log(self):
+        self.manager(eventLog=self.eventLog).collectPullRequestActivity()
+        recordCount = len(list(self.eventLog.records()))
+        manager = self.manager(eventLog=self.eventLog)
+        manager.workitemsClient = None
+
+        self.assertRaises(AttributeError, manager.collectPullRequestActivity)
+        self.assertEqual(len(list(self.eventLog.records())), recordCount)
+        self.assertFalse(os.path.exists(self.eventLog.path + '.tmp'))
+
+    def test_rejects_unusable_logs(self):
+        self.assertRaises(ValueError, self.manager().replayPullRequestActivity)
+        self.assertRaises(FileNotFoundError, self.manager(eventLog=self.eventLog).replayPullRequestActivity)
+        self.assertRaises(ValueError, self.manager, eventLog=self.eventLog, incrementalStore=IncrementalStateStore(os.path.join(self.directory.name, 'state')))
+
+        with self.eventLog.writer() as writer:
+            writer.append({'pullRequestId': np.int64(3), 'pr_completion_days': np.float64(1.5)})
+
+        self.assertEqual(list(self.eventLog.records()), [{'pullRequestId': 3, 'pr_completion_days': 1.5}])
+
+        with gzip.open(self.eventLog.path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'version': 0}) + '\n')
+
+        self.assertRaises(ValueError, self.eventLog.metadata)
+
+        # an empty log, such as one truncated before its header was flushed
+        with gzip.open(self.eventLog.path, 'wt', encoding='utf-8'):
+            pass
+
+        self.assertRaises(ValueError, self.eventLog.metadata)
+        self.assertRaises(ValueError, list, self.eventLog.records())
@@ -0,0 +1,130 @@
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import aiohttp
+
+from gitinsights.mods.clients.ado.commits import AdoPullRequestCommitsClient
+from gitinsights.mods.clients.ado.entitlements import AdoGetOrgEntitlementsClient
+from gitinsights.mods.identity import IdentityIndex
+from gitinsights.mods.identity import IdentityIndexStore
+from gitinsights.mods.managers.ado import AzureDevopsClientManager
+from gitinsights.mods.managers.ado import CollectionSettings
+from gitinsights.tests.fake_ado_server import FIXTURE_DIRECTORY
+from gitinsights.tests.fake_ado_server import FakeAdoServer
+
+PROFILES = [
+    {'principalName': 'NPaulk@Fabrikam.com', 'mailAddress': 'norman.paulk@fabrikam.com', 'displayName': 'Norman Paulk', 'origin': 'aad'},
+    {'principalName': 'jsmith@fabrikam.com', 'mailAddress': '', 'displayName': 'John Smith', 'origin': 'aad'},
+    {'principalName': 'john.smith@fabrikam.com', 'mailAddress': 'john.smith@fabrikam.com', 'displayName': 'JOHN SMITH', 'origin': 'aad'},
+    {'principalName': 'guest@outlook.com', 'mailAddress': 'guest@outlook.com', 'displayName': 'Guest', 'origin': 'msa'}
+]
+
+
+def commit(commitId: str, author: dict) -> dict:
+    return {'commitId': commitId, 'author': {**author, 'date': '2021-03-01T10:00:00Z'}}
+
+
+class Test_IdentityIndex(TestCase):
+    def setUp(self):
+        self.index = IdentityIndex(AdoGetOrgEntitlementsClient.DeserializeProfiles(PROFILES), {'npaulk@gmail.com': 'Norman Paulk', 'jsmith@fabrikam.com': 'Johnny Smith'})
+
+    def test_resolves_principal_names_mail_addresses_and_aliases(self):
+        self.assertEqual(self.index.contributorByEmail('npaulk@fabrikam.com'), 'Norman Paulk')
+        self.assertEqual(self.index.contributorByEmail(' Norman.Paulk@Fabrikam.com'), 'Norman Paulk')
+        self.assertEqual(self.index.contributorByEmail('npaulk@gmail.com'), 'Norman Paulk')
+        self.assertIsNone(self.index.contributorByEmail('guest@outlook.com'))
+        # aliases override the org profiles
+        self.assertEqual(self.index['JSmith@fabrikam.com'], 'Johnny Smith')
+        self.assertIn('NPAULK@GMAIL.COM', self.index)
+        self.assertEqual(len(self.index), 5)
+
+    def test_resolves_display_names(self):
+        self.assertEqual(self.index.contributorByName('norman paulk'), 'Norman Paulk')
+        self.assertEqual(self.index.contributorByName('Johnny Smith'), 'Johnny Smith')
+        self.assertIsNone(self.index.contributorByName('Guest'))
+
+    def test_ambiguous_display_names(self):
+        index = IdentityIndex({'jsmith@fabrikam.com': 'John Smith', 'john.smith@fabrikam.com': 'JOHN SMITH'})
+
+        self.assertEqual(index.contributorByName('John Smith'), 'John Smith')
+        self.assertIsNone(index.contributorByName('john smith'))
+
+    def test_is_built_once_from_a_plain_mapping(self):
+        self.assertIs(IdentityIndex.of(self.index), self.index)
+        self.assertEqual(IdentityIndex.of({'A@b.com': 'A'})['a@B.com'], 'A')
+
+    def test_commit_authors_without_email_do_not_raise(self):
+        client = AdoPullRequestCommitsClient("myorg", "dev.azure.com", "6.0", "", {}, changeCountsByCommitId=True)
+        commits = [commit('1', {'name': 'Norman Paulk'}), commit('2', {'name': 'Unknown Author'}), commit('3', {'name': 'Norman Paulk', 'email': 'NPaulk@gmail.com'})]
+        changeCounts = {c['commitId']: {'Add': 1, 'Edit': 0, 'Delete': 0} for c in commits}
+
+        with self.assertLogs(level='WARNING'):
+            records = client.ParsePrCommits(commits, changeCounts, 'repo1', self.index)
+
+        self.assertEqual([r['contributor'] for r in records], ['Norman Paulk', 'Unknown Author', 'Norman Paulk'])
+
+
+class Test_IdentityIndexStore(TestCase):
+    def test_entries_expire_after_the_ttl(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = IdentityIndexStore(directory)
+            store.save('myorg/project', {'npaulk@fabrikam.com': 'Norman Paulk'})
+
+            self.assertEqual(store.load('myorg/project'), {'npaulk@fabrikam.com': 'Norman Paulk'})
+            self.assertIsNone(store.load('myorg'))
+            self.assertIsNone(IdentityIndexStore(directory, ttl=datetime.timedelta(0)).load('myorg/project'))
+
+
+class Test_ScopedEntitlements(TestCase):
+    def setUp(self):
+        with open(os.path.join(FIXTURE_DIRECTORY, 'entitlements.json')) as f:
+            self.profiles = json.load(f)['value']
+
+        self.server = FakeAdoServer().start()
+        self.server.addJsonRoute('GET', r'/_apis/projects/my-super-project$', {'id': 'project-guid', 'name': 'my-super-project'})
+        self.server.addJsonRoute('GET', r'/_apis/graph/descriptors/project-guid$', {'value': 'scp.project'})
+        self.server.addJsonRoute('GET', r'/_apis/projects/my-super-project/teams/team-buffalo/members$',
+                                 {'value': [{'identity': {'uniqueName': 'FTotten@vscsi.us', 'displayName': 'Francis Totten'}}], 'count': 1})
+        # the project scope only holds the first three profiles
+        self.server.addRoute('GET', r'/_apis/graph/users$', lambda path, query: (200, {'value': self.profiles[:3] if query.get('scopeDescriptor') == ['scp.project'] else self.profiles}, {}))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def manager(self, **kwargs) -> AzureDevopsClientManager:
+        manager = AzureDevopsClientManager("myorg", "my-super-project", ["repo1"], "team-buffalo", "token", settings=CollectionSettings(**kwargs))
+        self.server.redirect(manager)
+
+        return manager
+
+    def test_scopes_profiles_to_project_and_team_members(self):
+        self.assertEqual(len(self.manager().loadEntitlements()), 4)
+        self.assertEqual(set(self.manager(entitlementsScope='project').loadEntitlements().values()), {'Norman Paulk', 'Jamal Hartnett', 'Francis Totten'})
+
+        async def collect():
+            manager = self.manager(entitlementsScope='team')
+
+            async with aiohttp.ClientSession() as session:
+                manager.asyncSession = session
+
+                # pylint: disable=protected-access
+                return await manager._loadProjectEntitlementsAsync()
+
+        self.assertEqual(self.manager(entitlementsScope='team').loadEntitlements(), {'ftotten@vscsi.us': 'Francis Totten'})
+        self.assertEqual(asyncio.run(collect()), {'ftotten@vscsi.us': 'Francis Totten'})
+        self.assertRaises(ValueError, AzureDevopsClientManager, "myorg", "my-super-project", ["repo1"], "team-buffalo", "token", settings=CollectionSettings(entitlementsScope='tenant'))
+
+    def test_cold_starts_reuse_the_stored_profiles(self):
+        with tempfile.TemporaryDirectory() as directory:
+            entitlements = self.manager(entitlementsScope='project', identityStore=IdentityIndexStore(directory)).loadEntitlements()
+            requestCount = self.server.requestCount()
+
+            self.assertEqual(self.manager(entitlementsScope='project', identityStore=IdentityIndexStore(directory)).loadEntitlements(), entitlements)
+            self.assertEqual(self.server.requestCount(), requestCount)
+            # another scope is stored on its own
+            self.manager(identityStore=IdentityIndexStore(directory)).loadEntitlements()
+            self.assertEqual(self.server.requestCount(), requestCount + 1)
@@ -0,0 +1,69 @@
+import datetime
+import math
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from gitinsights.mods.incremental import IncrementalStateStore
+from gitinsights.mods.incremental import finalizeAggregates
+from gitinsights.mods.incremental import mergePartialAggregates
+from gitinsights.mods.incremental import partialAggregates
+
+MEASURES = {'prs_submitted': 'sum', 'pr_completion_days': 'mean'}
+GRAIN = ['contributor', 'week', 'repo']
+
+
+def events(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['contributor', 'week', 'repo', 'pullRequestId', 'workItemId', 'prs_submitted', 'pr_completion_days'])
+
+
+class Test_IncrementalAggregation(TestCase):
+    def test_changed_owners_replace_previous_partials(self):
+        previous = partialAggregates(events([
+            ['Jerry', '44', 'repo1', 1, np.nan, 1, np.nan],
+            ['Elaine', '44', 'repo1', 2, np.nan, 1, 4],
+            ['Elaine', '44', 'repo1', np.nan, 7, 0, np.nan]
+        ]), GRAIN, MEASURES)
+        # pull request 1 was completed since the last run and pull request 3 is new
+        delta = partialAggregates(events([
+            ['Jerry', '44', 'repo1', 1, np.nan, 1, 2],
+            ['Jerry', '45', 'repo1', 3, np.nan, 1, np.nan]
+        ]), GRAIN, MEASURES)
+
+        result = finalizeAggregates(mergePartialAggregates(previous, delta), ['contributor'], MEASURES)
+
+        self.assertEqual(result.loc['Jerry', 'prs_submitted'], 2)
+        self.assertEqual(result.loc['Jerry', 'pr_completion_days'], 2)
+        self.assertEqual(result.loc['Elaine', 'prs_submitted'], 1)
+        self.assertEqual(result.loc['Elaine', 'pr_completion_days'], 4)
+
+    def test_events_without_owner_are_rejected(self):
+        with self.assertRaises(ValueError):
+            partialAggregates(events([['Jerry', '44', 'repo1', np.nan, np.nan, 1, np.nan]]), GRAIN, MEASURES)
+
+        with self.assertRaises(ValueError):
+            partialAggregates(events([['Jerry', '44', 'repo1', 1, np.nan, 1, np.nan]]), GRAIN, {'prs_submitted': 'max'})
+
+    def test_state_store_round_trip(self):
+        with tempfile.TemporaryDirectory() as stateDirectory:
+            store = IncrementalStateStore(stateDirectory, overlap=datetime.timedelta(minutes=5))
+            self.assertIsNone(store.watermark('myorg/project/repo1', 'pullrequests'))
+            self.assertTrue(store.loadAggregates().empty)
+            self.assertEqual(store.loadLookup('pullRequestSubmitters'), {})
+            self.assertTrue(finalizeAggregates(store.loadAggregates(), ['week'], MEASURES).empty)
+
+            watermark = datetime.datetime(2020, 11, 6, 9, tzinfo=datetime.timezone.utc)
+            partials = partialAggregates(events([['Jerry', '44', 'repo1', 1, np.nan, 1, np.nan]]), GRAIN, MEASURES)
+            store.setWatermark('myorg/project/repo1', 'pullrequests', watermark)
+            store.saveWatermarks()
+            store.saveAggregates(partials)
+            store.saveLookup('pullRequestSubmitters', {'repo-id': {'20': 'Jerry'}})
+
+            reloaded = IncrementalStateStore(stateDirectory, overlap=datetime.timedelta(minutes=5))
+            self.assertEqual(reloaded.watermark('myorg/project/repo1', 'pullrequests'), watermark - datetime.timedelta(minutes=5))
+            self.assertEqual(reloaded.loadLookup('pullRequestSubmitters'), {'repo-id': {'20': 'Jerry'}})
+            pd.testing.assert_frame_equal(reloaded.loadAggregates(), partials, check_dtype=False)
+            self.assertEqual(reloaded.loadAggregates()['week'][0], '44')
+            self.assertTrue(math.isnan(finalizeAggregates(reloaded.loadAggregates(), ['week'], MEASURES).loc['44', 'pr_completion_days']))
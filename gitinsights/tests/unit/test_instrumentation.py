@@ -0,0 +1,122 @@
+import asyncio
+import json
+import pickle
+from unittest import TestCase
+
+import aiohttp
+
+from gitinsights.mods.async_client import AsyncApiClient
+from gitinsights.mods.clients.ado.pull_request import AdoPullRequestsClient
+from gitinsights.mods.instrumentation import LATENCY_BUCKETS
+from gitinsights.mods.instrumentation import Instrumentation
+from gitinsights.mods.instrumentation import LatencyHistogram
+from gitinsights.mods.instrumentation import MetricsInstrumentation
+from gitinsights.mods.managers.ado import AzureDevopsClientManager
+from gitinsights.mods.managers.ado import CollectionSettings
+from gitinsights.tests.fake_ado_server import FakeAdoServer
+
+
+class Test_LatencyHistogram(TestCase):
+    def test_buckets_and_quantiles(self):
+        histogram = LatencyHistogram()
+
+        for seconds in [0.001, 0.02, 0.02, 0.3, 120]:
+            histogram.observe(seconds)
+
+        buckets = dict(histogram.cumulativeBuckets())
+        self.assertEqual(buckets['0.005'], 1)
+        self.assertEqual(buckets['0.025'], 3)
+        self.assertEqual(buckets[str(LATENCY_BUCKETS[-1])], 4)
+        self.assertEqual(buckets['+Inf'], 5)
+        self.assertEqual(histogram.quantile(0.5), 0.025)
+        self.assertEqual(histogram.quantile(0.99), LATENCY_BUCKETS[-1])
+        self.assertIsNone(LatencyHistogram().quantile(0.5))
+
+
+class Test_MetricsInstrumentation(TestCase):
+    def setUp(self):
+        self.server = FakeAdoServer().start()
+        self.instrumentation = MetricsInstrumentation()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def throttledClient(self) -> AdoPullRequestsClient:
+        responses = [(429, {'message': 'throttled'}, {'Retry-After': '0'}), (200, {'value': [], 'count': 0}, {})] * 2
+        self.server.addRoute('GET', r'/pullrequests$', lambda path, query: responses.pop(0))
+
+        return AdoPullRequestsClient("myorg", self.server.host, "6.0", "token", {}, retry_backoff_factor=0, scheme='http', instrumentation=self.instrumentation)
+
+    def test_records_retries_and_throttles(self):
+        client = self.throttledClient()
+        client.getDeserializedDataset(repo="repo1", project="project")
+
+        async def collect():
+            async with aiohttp.ClientSession() as session:
+                return await client.getDeserializedDatasetAsync(AsyncApiClient(client, session), repo="repo1", project="project")
+
+        asyncio.run(collect())
+        requests = self.instrumentation.summary()['requests'][0]
+
+        self.assertEqual(requests['count'], 2)
+        self.assertEqual(requests['statuses'], {'200': 2})
+        self.assertEqual(requests['retries'], 2)
+        self.assertEqual(requests['throttled'], 2)
+        self.assertEqual(requests['bytes_received'], 2 * len(json.dumps({'value': [], 'count': 0})))
+        self.assertEqual(self.instrumentation.summary()['deserialization']['AdoPullRequestsClient']['calls'], 2)
+
+    def test_records_collection_stages(self):
+        self.server.addAdoFixtureRoutes()
+        manager = AzureDevopsClientManager("myorg", "my-super-project", ["repo1", "repo2"], "team-buffalo", "token-1", settings=CollectionSettings(instrumentation=self.instrumentation))
+        self.server.redirect(manager)
+
+        aggregated = manager.aggregatePullRequestActivity(['contributor', 'week'])
+        summary = self.instrumentation.summary()
+
+        self.assertEqual(summary['stages']['aggregate']['records'], len(aggregated))
+        self.assertEqual(summary['stages']['pull_requests']['calls'], 2)
+        self.assertEqual(summary['stages']['pr_commits']['calls'], summary['stages']['pr_comments']['calls'])
+        self.assertEqual(sum(r['count'] for r in summary['requests']), self.server.requestCount())
+        self.assertGreater(next(r for r in summary['requests'] if r['method'] == 'POST')['bytes_sent'], 0)
+        self.assertEqual(summary['deserialization']['AdoPullRequestReviewCommentsClient']['records'], summary['stages']['pr_comments']['records'])
+
+    def test_exports_json_and_prometheus_text(self):
+        self.throttledClient().getDeserializedDataset(repo="repo1", project="project")
+
+        with self.instrumentation.stage('pull_requests') as stage:
+            stage.addRecords(3)
+
+        prometheusText = self.instrumentation.export('prometheus')
+        self.assertIn('gitinsights_request_duration_seconds_bucket{{host="{}",method="GET",le="+Inf"}} 1'.format(self.server.host), prometheusText)
+        self.assertIn('gitinsights_request_throttled_total{{host="{}",method="GET"}} 1'.format(self.server.host), prometheusText)
+        self.assertIn('gitinsights_stage_records_total{stage="pull_requests"} 3', prometheusText)
+        self.assertRaises(ValueError, self.instrumentation.export, 'xml')
+        self.assertEqual(json.loads(self.instrumentation.export('json')), self.instrumentation.summary())
+
+    def test_merges_the_metrics_of_worker_processes(self):
+        self.throttledClient().getDeserializedDataset(repo="repo1", project="project")
+        self.instrumentation.recordRateLimit('myorg', 4, 'retry_after', 0.5)
+
+        with self.instrumentation.stage('pull_requests') as stage:
+            stage.addRecords(3)
+
+        merged = MetricsInstrumentation()
+        merged.merge(pickle.loads(pickle.dumps(self.instrumentation)))
+        merged.merge(self.instrumentation)
+        summary = self.instrumentation.summary()
+        requests = merged.summary()['requests'][0]
+
+        self.assertEqual(requests['count'], 2 * summary['requests'][0]['count'])
+        self.assertEqual(requests['statuses'], {status: 2 * count for status, count in summary['requests'][0]['statuses'].items()})
+        self.assertEqual(requests['latency_seconds']['buckets']['+Inf'], 2 * summary['requests'][0]['count'])
+        self.assertEqual(merged.summary()['stages']['pull_requests']['records'], 6)
+        self.assertEqual(merged.summary()['rate_limits']['myorg'], {'concurrency': 4, 'min_concurrency': 4, 'throttle_events': {'retry_after': 2}, 'throttle_delay_seconds': 1.0})
+
+    def test_noop_default_records_nothing(self):
+        client = AdoPullRequestsClient("myorg", self.server.host, "6.0", "token", {}, scheme='http')
+
+        self.assertIsInstance(client.instrumentation, Instrumentation)
+        self.assertFalse(client.instrumentation.enabled)
+
+        with client.instrumentation.stage('collect') as stage:
+            stage.addRecords(1)
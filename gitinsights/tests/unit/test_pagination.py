@@ -0,0 +1,186 @@
+import asyncio
+import copy
+import datetime
+import json
+import os
+import threading
+import time
+
+import aiohttp
+
+from gitinsights.mods.async_client import AsyncApiClient
+from gitinsights.mods.clients.ado.commits import AdoPullRequestCommitsClient
+from gitinsights.mods.clients.ado.entitlements import AdoGetOrgEntitlementsClient
+from gitinsights.mods.clients.ado.pull_request import AdoPullRequestsClient
+from gitinsights.mods.clients.ado.workitems import AdoGetProjectWorkItemsClient
+from gitinsights.mods.managers.repo_insights_base import ApiClient
+from gitinsights.mods.timestamps import parseIsoTimestamp
+from gitinsights.mods.transport import CONTINUATION_TOKEN_HEADER
+from gitinsights.mods.transport import JsonResponse
+from gitinsights.tests.benchmarks.synthetic_ado import SyntheticAdoDataset
+from gitinsights.tests.fake_ado_server import FIXTURE_DIRECTORY
+from gitinsights.tests.synthetic_ado_case import SyntheticAdoTestCase
+
+
+def loadFixture(fileName: str) -> dict:
+    with open(os.path.join(FIXTURE_DIRECTORY, fileName)) as f:
+        return json.load(f)
+
+
+def skipTopPages(records: list, skipParameter: str = '$skip', topParameter: str = '$top'):
+    # pylint: disable=unused-argument
+    def handler(path, query):
+        skip = int(query.get(skipParameter, ['0'])[0])
+        top = int(query[topParameter][0])
+
+        return 200, {'value': records[skip:skip + top], 'count': len(records[skip:skip + top])}, {}
+
+    return handler
+
+
+class Test_Pagination(SyntheticAdoTestCase):
+    def test_next_page_parameters(self):
+        page = [{}] * 2
+        self.assertEqual(ApiClient.nextPageParameters({'$top': '2'}, page, JsonResponse(200, {}, None)), {'$top': '2', '$skip': '2'})
+        self.assertIsNone(ApiClient.nextPageParameters({'$top': '3'}, page, JsonResponse(200, {}, None)))
+        self.assertIsNone(ApiClient.nextPageParameters({}, page, JsonResponse(200, {}, None)))
+        self.assertEqual(ApiClient.nextPageParameters({}, page, JsonResponse(200, {CONTINUATION_TOKEN_HEADER: 'abc'}, None)), {'continuationToken': 'abc'})
+
+    def test_pull_requests_are_not_truncated(self):
+        template = loadFixture('prStatsByProject.json')['value'][0]
+        pullRequests = []
+
+        for pullRequestId in range(1, 2501):
+            pullRequest = copy.deepcopy(template)
+            pullRequest['pullRequestId'] = pullRequestId
+            pullRequest['reviewers'] = []
+            pullRequests.append(pullRequest)
+
+        self.server.addRoute('GET', r'/pullrequests$', skipTopPages(pullRequests))
+        client = AdoPullRequestsClient("myorg", self.server.host, "6.0", "token", {}, scheme='http')
+
+        records = client.getDeserializedDataset(repo="repo1", project="project")
+
+        self.assertEqual([r['pullRequestId'] for r in records], list(range(1, 2501)))
+        self.assertEqual(self.server.requestCount(), 3)
+
+        async def collect():
+            async with aiohttp.ClientSession() as session:
+                return await client.getDeserializedDatasetAsync(AsyncApiClient(client, session), repo="repo1", project="project")
+
+        self.assertEqual(asyncio.run(collect()), records)
+
+    def test_repo_commits_page_by_skip(self):
+        commits = loadFixture('repoCommits.json')['value']
+        self.server.addRoute('GET', r'/commits$', skipTopPages(commits, 'searchCriteria.$skip', 'searchCriteria.$top'))
+        client = AdoPullRequestCommitsClient("myorg", self.server.host, "6.0", "token", {}, scheme='http')
+
+        changeCounts = client.getAllCommitsByRepo("repo1", "project", topRecords=3)
+
+        self.assertEqual(list(changeCounts), [c['commitId'] for c in commits])
+        self.assertEqual([query.split('searchCriteria.$skip=')[1].split('&')[0] for _, query in self.server.requestLog], ['0', '3', '6'])
+
+    def test_entitlements_page_by_continuation_token(self):
+        profiles = loadFixture('entitlements.json')['value']
+        half = len(profiles) // 2
+
+        # pylint: disable=unused-argument
+        def handler(path, query):
+            if 'continuationToken' not in query:
+                return 200, {'value': profiles[:half]}, {CONTINUATION_TOKEN_HEADER: 'page-2'}
+
+            return 200, {'value': profiles[half:]}, {}
+
+        self.server.addRoute('GET', r'/_apis/graph/users$', handler)
+        client = AdoGetOrgEntitlementsClient("myorg", self.server.host, "6.0", "token", {}, scheme='http')
+
+        self.assertEqual(client.getDeserializedDataset(), [AdoGetOrgEntitlementsClient.DeserializeProfiles(profiles)])
+        self.assertEqual(self.server.requestCount(), 2)
+
+        async def collect():
+            async with aiohttp.ClientSession() as session:
+                return await client.getDeserializedDatasetAsync(AsyncApiClient(client, session))
+
+        self.assertEqual(asyncio.run(collect()), [AdoGetOrgEntitlementsClient.DeserializeProfiles(profiles)])
+
+    def test_workitem_batches_are_fetched_concurrently_with_trimmed_fields(self):
+        dataset = SyntheticAdoDataset(repos=1, pullRequestsPerRepo=10, workitems=450, contributors=5)
+        pullRequestSubmitters = {dataset.repoId('repo1'): {pullRequestId: 'Contributor' for pullRequestId in range(1, 11)}}
+        inFlight = [0, 0]
+        lock = threading.Lock()
+
+        def workitemDetails(path, query):
+            with lock:
+                inFlight[0] += 1
+                inFlight[1] = max(inFlight)
+
+            time.sleep(0.05)
+
+            with lock:
+                inFlight[0] -= 1
+
+            return dataset.workitemDetails(path, query)
+
+        self.server.addRoute('POST', r'/_apis/wit/wiql$', dataset.wiql, withBody=True)
+        self.server.addRoute('GET', r'/_apis/wit/workitems$', workitemDetails)
+
+        def collect(maxConcurrentBatches: int) -> list:
+            client = AdoGetProjectWorkItemsClient("myorg", self.server.host, "6.0", "token", {}, maxConcurrentBatches=maxConcurrentBatches, scheme='http')
+
+            return client.getDeserializedDataset(teamId='team', project='project', repo='repo1', pullRequestSubmitters=pullRequestSubmitters)
+
+        serialRecords = collect(1)
+        self.assertEqual(inFlight[1], 1)
+        self.assertEqual(collect(3), serialRecords)
+        self.assertEqual(inFlight[1], 3)
+        self.assertEqual(sum(r.get('user_stories_created', 0) for r in serialRecords), 450)
+        self.assertTrue(any('pr_submission_date' in r for r in serialRecords))
+
+        detailQueries = [query for method, query in self.server.requestLog if method == 'GET']
+        # each run fetches three batches of details, each along with the relations of its work items
+        self.assertEqual(len(detailQueries), 2 * 3)
+        self.assertTrue(all('$expand=Relations' in query and 'fields=' not in query for query in detailQueries))
+
+        client = AdoGetProjectWorkItemsClient("myorg", self.server.host, "6.0", "token", {}, maxConcurrentBatches=2, scheme='http')
+
+        async def collectAsync():
+            async with aiohttp.ClientSession() as session:
+                return await client.getDeserializedDatasetAsync(AsyncApiClient(client, session), teamId='team', project='project', repo='repo1', pullRequestSubmitters=pullRequestSubmitters)
+
+        self.assertEqual(asyncio.run(collectAsync()), serialRecords)
+        self.assertRaises(ValueError, AdoGetProjectWorkItemsClient, "myorg", self.server.host, "6.0", "token", {}, maxConcurrentBatches=0)
+
+    def test_wiql_windows_reaching_the_cap_are_sharded_by_created_date(self):
+        self.serveDataset(repos=1, pullRequestsPerRepo=2, workitems=60, contributors=5)
+        client = AdoGetProjectWorkItemsClient("myorg", self.server.host, "6.0", "token", {}, workItemTypes=['User Story', 'Bug'], toDate=datetime.datetime(2030, 1, 1), wiqlResultCap=25, scheme='http')
+
+        def postQuery(query: str) -> list:
+            return client.PostResponse(client.WiqlResourcePath('project', 'team'), {"query": query}, client.WiqlUriParameters()).json()['workItems']
+
+        workitemIds = client.ShardedWorkitemIds(postQuery)
+
+        self.assertEqual(sorted(workitemIds, key=int), [str(i) for i in range(1, 61)])
+        self.assertGreater(self.server.requestCount(), 3)
+        self.assertIn("[System.WorkItemType] IN ('User Story', 'Bug')", client.WiqlQuery())
+        self.assertIn("[System.CreatedDate] < '2030-01-01T00:00:00Z'", client.WiqlQuery())
+
+        async def postQueryAsync(query: str) -> list:
+            async with aiohttp.ClientSession() as session:
+                response = await AsyncApiClient(client, session).sendPostRequest(client.WiqlResourcePath('project', 'team'), {"query": query}, client.WiqlUriParameters())
+
+                return response.json()['workItems']
+
+        self.assertEqual(asyncio.run(client.ShardedWorkitemIdsAsync(postQueryAsync)), workitemIds)
+
+        # a window that can't be split any further is reported rather than silently truncated
+        self.assertRaises(ValueError, client.SplitShard, datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc), datetime.datetime(2021, 1, 1, 0, 1, tzinfo=datetime.timezone.utc))
+
+    def test_reporting_window_filters_work_items(self):
+        dataset = self.serveDataset(repos=1, pullRequestsPerRepo=2, workitems=40, contributors=5)
+        changedDates = sorted(parseIsoTimestamp(dataset.workitem(i)['fields']['System.ChangedDate']) for i in range(1, 41))
+        client = AdoGetProjectWorkItemsClient("myorg", self.server.host, "6.0", "token", {}, fromDate=changedDates[20], scheme='http')
+
+        pullRequestSubmitters = {dataset.repoId('repo1'): {1: 'Contributor', 2: 'Contributor'}}
+        records = client.getDeserializedDataset(teamId='team', project='project', repo='repo1', pullRequestSubmitters=pullRequestSubmitters)
+
+        self.assertEqual(sum(r.get('user_stories_created', 0) for r in records), 20)
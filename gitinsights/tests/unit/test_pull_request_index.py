@@ -0,0 +1,74 @@
+from unittest import TestCase
+
+from gitinsights.mods.clients.ado.workitems import AdoGetProjectWorkItemsClient
+from gitinsights.mods.instrumentation import MetricsInstrumentation
+from gitinsights.mods.pull_request_index import MALFORMED_LINK
+from gitinsights.mods.pull_request_index import UNKNOWN_PULL_REQUEST
+from gitinsights.mods.pull_request_index import UNKNOWN_REPO
+from gitinsights.mods.pull_request_index import PullRequestIndex
+
+SUBMITTERS = {'Repo-A': {1: 'Norman Paulk', 2: 'Jamal Hartnett'}, 'repo-b': {'3': 'Francis Totten'}}
+
+
+def pullRequestLink(url: str, createdDate: str) -> dict:
+    return {'rel': 'ArtifactLink', 'url': url, 'attributes': {'name': 'Pull Request', 'resourceCreatedDate': createdDate}}
+
+
+def workitem(workItemId: int, activatedDate: str, relations: list) -> dict:
+    return {'id': workItemId, 'fields': {'Microsoft.VSTS.Common.ActivatedDate': activatedDate}, 'relations': relations}
+
+
+class Test_PullRequestIndex(TestCase):
+    def setUp(self):
+        self.index = PullRequestIndex(SUBMITTERS)
+
+    def test_is_keyed_by_repo_and_pull_request(self):
+        self.assertEqual(self.index[('REPO-A', 2)], 'Jamal Hartnett')
+        self.assertEqual(self.index[('repo-b', 3)], 'Francis Totten')
+        self.assertEqual(len(self.index), 3)
+        self.assertIs(PullRequestIndex.of(self.index), self.index)
+        self.assertTrue(PullRequestIndex.of(SUBMITTERS).hasRepo('repo-a'))
+
+    def test_resolves_the_earliest_link_after_activation(self):
+        workitems = [
+            workitem(10, '2021-03-02T00:00:00Z', [
+                # linked before the story was activated
+                pullRequestLink('vstfs:///Git/PullRequestId/project%2Frepo-a%2F1', '2021-03-01T00:00:00Z'),
+                pullRequestLink('vstfs:///Git/PullRequestId/project%2Frepo-b%2F3', '2021-03-05T00:00:00.1234567Z'),
+                pullRequestLink('vstfs:///Git/PullRequestId/project%2Frepo-a%2F2', '2021-03-04T00:00:00Z'),
+                {'rel': 'System.LinkTypes.Hierarchy-Reverse', 'url': 'https://dev.azure.com/fabrikam/_apis/wit/workItems/1', 'attributes': {'name': 'Parent'}}
+            ]),
+            workitem(11, '2021-03-02T00:00:00Z', []),
+            workitem(12, '2021-03-10T00:00:00Z', [pullRequestLink('vstfs:///Git/PullRequestId/project%2Frepo-a%2F1', '2021-03-01T00:00:00Z')])
+        ]
+
+        links, unresolved = self.index.initialPullRequests(workitems)
+
+        self.assertEqual(links[['workItemId', 'contributor', 'pr_submission_date']].values.tolist(), [[10, 'Jamal Hartnett', '2021-03-04T00:00:00Z']])
+        self.assertEqual(sum(unresolved.values()), 0)
+        self.assertTrue(self.index.initialPullRequests([])[0].empty)
+
+    def test_counts_unresolved_links(self):
+        workitems = [
+            workitem(1, '2021-03-01T00:00:00Z', [pullRequestLink('vstfs:///Git/PullRequestId/repo-a%2F1', '2021-03-02T00:00:00Z')]),
+            workitem(2, '2021-03-01T00:00:00Z', [pullRequestLink('vstfs:///Git/PullRequestId/project%2Frepo-c%2F1', '2021-03-02T00:00:00Z')]),
+            workitem(3, '2021-03-01T00:00:00Z', [pullRequestLink('vstfs:///Git/PullRequestId/project%2Frepo-a%2F9', '2021-03-02T00:00:00Z')]),
+            workitem(4, '2021-03-01T00:00:00Z', [pullRequestLink('vstfs:///Git/PullRequestId/project%2Frepo-b%2F3', '2021-03-02T00:00:00Z')])
+        ]
+
+        links, unresolved = self.index.initialPullRequests(workitems)
+
+        self.assertEqual(links['contributor'].tolist(), ['Francis Totten'])
+        self.assertEqual(unresolved, {MALFORMED_LINK: 1, UNKNOWN_REPO: 1, UNKNOWN_PULL_REQUEST: 1})
+
+    def test_unresolved_links_are_recorded_instead_of_raised(self):
+        instrumentation = MetricsInstrumentation()
+        client = AdoGetProjectWorkItemsClient("myorg", "dev.azure.com", "6.0", "", {}, instrumentation=instrumentation)
+        crossRepoLink = pullRequestLink('vstfs:///Git/PullRequestId/project%2Fanother-repo%2F1', '2021-03-02T00:00:00Z')
+
+        with self.assertLogs(level='WARNING'):
+            records = client.InitialPullRequestRecords('repo1', [workitem(1, '2021-03-01T00:00:00Z', [crossRepoLink])], self.index)
+
+        self.assertEqual(records, [])
+        self.assertEqual(instrumentation.summary()['unresolved_links'], {MALFORMED_LINK: 0, UNKNOWN_PULL_REQUEST: 0, UNKNOWN_REPO: 1})
+        self.assertIn('gitinsights_unresolved_links_total{reason="unknown_repo"} 1', instrumentation.toPrometheusText())
@@ -0,0 +1,44 @@
+import datetime
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from gitinsights.mods.records import ColumnarRecordBuilder
+
+REPORTABLE_FIELDS = {
+    'contributor': {'default': np.nan, 'agg_function': None},
+    'prs_submitted': {'default': 0, 'agg_function': 'sum'},
+    'creation_datetime': {'default': np.nan, 'agg_function': None},
+    'pr_completion_days': {'default': np.nan, 'agg_function': 'mean'},
+    'user_story_points_assigned': {'default': 0, 'agg_function': 'sum'}
+}
+
+
+class Test_ColumnarRecordBuilder(TestCase):
+    def test_matches_a_frame_built_from_records(self):
+        defaults = {field: settings['default'] for field, settings in REPORTABLE_FIELDS.items()}
+        created = datetime.datetime(2020, 11, 1, tzinfo=datetime.timezone.utc)
+        records = [
+            {'contributor': 'Jane Doe', 'prs_submitted': 1, 'creation_datetime': created, 'pr_completion_days': 3.0, 'pullRequestId': 7},
+            {'contributor': 'John Doe', 'user_story_points_assigned': 2.5, 'workItemId': 12},
+            {'contributor': 'Jane Doe', 'prs_submitted': 1}
+        ]
+        builder = ColumnarRecordBuilder(REPORTABLE_FIELDS)
+        builder.extend(records)
+
+        self.assertEqual(len(builder), 3)
+        pd.testing.assert_frame_equal(builder.toDataFrame(), pd.DataFrame([{**defaults, **record} for record in records]))
+
+    def test_columns_stay_typed(self):
+        builder = ColumnarRecordBuilder(REPORTABLE_FIELDS)
+        builder.extend([{'prs_submitted': 1, 'user_story_points_assigned': 1}, {'prs_submitted': 2, 'user_story_points_assigned': 0.5}])
+        frame = builder.toDataFrame()
+
+        self.assertEqual(frame['prs_submitted'].dtype, np.int64)
+        self.assertEqual(frame['user_story_points_assigned'].dtype, np.float64)
+        self.assertEqual(frame['user_story_points_assigned'].tolist(), [1.0, 0.5])
+        self.assertTrue(frame['pr_completion_days'].isna().all())
+
+    def test_empty_builder(self):
+        self.assertTrue(ColumnarRecordBuilder(REPORTABLE_FIELDS).toDataFrame().empty)
@@ -0,0 +1,73 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+
+from gitinsights.mods.report_store import ParquetReportStore
+from gitinsights.mods.report_store import reportSchema
+from gitinsights.tests.benchmarks.synthetic_ado import SyntheticAdoDataset
+from gitinsights.tests.synthetic_ado_case import collectSyntheticActivity
+
+GROUP_BY_COLUMNS = ['contributor', 'year', 'week', 'repo']
+
+
+class Test_ParquetReportStore(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.manager, cls.events = collectSyntheticActivity(SyntheticAdoDataset(repos=2, pullRequestsPerRepo=8, threadsPerPullRequest=2, commitsPerPullRequest=2, workitems=12, contributors=5))
+        cls.report = cls.manager.aggregateEvents(cls.events, GROUP_BY_COLUMNS)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ParquetReportStore(self.directory.name, self.manager.ReportSchema())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_schema_is_derived_from_the_reportable_fields(self):
+        schema = self.manager.ReportSchema()
+
+        self.assertEqual(schema['contributor'], 'category')
+        self.assertEqual(schema['prs_submitted'], 'int32')
+        self.assertEqual(schema['pr_completion_days'], 'float64')
+        self.assertEqual(schema['pr_completion_days_p90'], 'float64')
+        self.assertEqual(schema['user_story_points_assigned'], 'float64')
+        self.assertEqual(schema['year'], 'Int16')
+        self.assertNotIn('creation_datetime', schema)
+        self.assertRaises(ValueError, reportSchema, {'span': {'agg_function': None, 'derived_from': ('fortnights', 'activity_date')}})
+
+    def test_round_trips_the_report_with_compact_dtypes(self):
+        stats = self.store.write('aggregates', self.report)
+        stored = self.store.read('aggregates')
+        weeks = self.report.reset_index()[['year', 'week', 'repo']].drop_duplicates()
+
+        self.assertEqual(stats, {'written': len(weeks), 'unchanged': 0, 'removed': 0})
+        self.assertTrue(os.path.isfile(os.path.join(self.directory.name, 'aggregates', 'year=2021', 'week=202101', 'repo=repo1', 'part-0.parquet')))
+        self.assertEqual(stored['prs_submitted'].dtype, 'int32')
+        self.assertEqual(stored['repo'].dtype, 'category')
+
+        expected = self.report.reset_index().sort_values(['year', 'week', 'repo', 'contributor']).reset_index(drop=True)
+        actual = stored.set_index(GROUP_BY_COLUMNS).reset_index().sort_values(['year', 'week', 'repo', 'contributor']).reset_index(drop=True)
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_categorical=False)
+
+    def test_reruns_only_rewrite_changed_partitions(self):
+        partitionCount = self.store.write('aggregates', self.report)['written']
+        self.assertEqual(self.store.write('aggregates', self.report), {'written': 0, 'unchanged': partitionCount, 'removed': 0})
+
+        # one changed partition, and the partitions of the last week are gone
+        changed = self.report.copy()
+        changed.iloc[0, changed.columns.get_loc('prs_submitted')] += 1
+        lastWeek = changed.index.get_level_values('week') == changed.index.get_level_values('week').max()
+        removed = len(set(changed[lastWeek].index.get_level_values('repo')))
+
+        self.assertEqual(self.store.write('aggregates', changed[~lastWeek]), {'written': 1, 'unchanged': partitionCount - 1 - removed, 'removed': removed})
+        self.assertEqual(self.store.read('aggregates')['prs_submitted'].sum(), changed[~lastWeek]['prs_submitted'].sum())
+
+    def test_writes_raw_events(self):
+        self.store.write('events', self.events)
+        stored = self.store.read('events')
+
+        self.assertEqual(len(stored), len(self.events))
+        self.assertEqual(stored['pr_comments'].sum(), self.events['pr_comments'].sum())
+        self.assertRaises(ValueError, self.store.write, 'events', self.events.drop(columns=['year']))
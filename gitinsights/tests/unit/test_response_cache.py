@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+import json
+import os
+import pickle
+import tempfile
+import time
+from unittest import TestCase
+
+import aiohttp
+
+from gitinsights.mods.async_client import AsyncApiClient
+from gitinsights.mods.clients.ado.comments import AdoPullRequestReviewCommentsClient
+from gitinsights.mods.clients.ado.workitems import AdoGetProjectWorkItemsClient
+from gitinsights.mods.response_cache import IMMUTABLE
+from gitinsights.mods.response_cache import CacheEntry
+from gitinsights.mods.response_cache import DirectoryResponseCache
+from gitinsights.tests.fake_ado_server import FIXTURE_DIRECTORY
+from gitinsights.tests.fake_ado_server import FakeAdoServer
+
+
+class Test_DirectoryResponseCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DirectoryResponseCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lookup_hits_and_misses(self):
+        url = 'https://dev.azure.com/org/_apis/threads?'
+        self.assertEqual(self.cache.lookup(url, IMMUTABLE), (None, None))
+
+        self.cache.store(url, 200, {'Content-Type': 'application/json'}, b'{"value": []}', IMMUTABLE)
+        response, entry = self.cache.lookup(url, IMMUTABLE)
+
+        self.assertEqual(response.json(), {'value': []})
+        self.assertTrue(entry.immutable)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.cache.stats()['bytes_saved'], len(b'{"value": []}'))
+
+    def test_pickled_caches_share_the_directory(self):
+        url = 'https://dev.azure.com/org/_apis/threads?'
+        self.cache.store(url, 200, {}, b'{"value": []}', IMMUTABLE)
+        # as handed to the worker processes of a sharded collection
+        workerCache = pickle.loads(pickle.dumps(self.cache))
+
+        self.assertEqual(workerCache.lookup(url, IMMUTABLE)[0].json(), {'value': []})
+        self.assertEqual(workerCache.maxSizeBytes, self.cache.maxSizeBytes)
+        self.assertEqual(workerCache.stats()['hits'], 1)
+
+    def test_skips_responses_that_cannot_be_reused(self):
+        url = 'https://dev.azure.com/org/_apis/threads?'
+        self.cache.store(url, 200, {}, b'{}')
+        self.cache.store(url, 404, {'ETag': '"v1"'}, b'{}', IMMUTABLE)
+
+        self.assertEqual(self.cache.stats()['stored'], 0)
+        self.assertEqual(self.cache.lookup(url), (None, None))
+
+    def test_mutable_entries_are_revalidated(self):
+        url = 'https://dev.azure.com/org/_apis/threads?'
+        self.cache.store(url, 200, {'ETag': '"v1"', 'Content-Type': 'application/json'}, b'{}')
+        response, entry = self.cache.lookup(url, IMMUTABLE)
+
+        self.assertIsNone(response)
+        self.assertEqual(entry.headers, {'ETag': '"v1"'})
+        self.assertEqual(entry.conditionalHeaders(), {'If-None-Match': '"v1"'})
+
+    def test_expired_entries_are_evicted(self):
+        cache = DirectoryResponseCache(self.directory.name, ttl=datetime.timedelta(seconds=60))
+        cache.write(cache.key('expired'), CacheEntry(200, {'ETag': '"v1"'}, b'{}', time.time() - 120))
+        cache.write(cache.key('immutable'), CacheEntry(200, {}, b'{}', time.time() - 120, immutable=True))
+
+        self.assertIsNone(cache.read(cache.key('expired')))
+        self.assertIsNotNone(cache.read(cache.key('immutable')))
+        self.assertEqual(cache.stats()['evicted'], 1)
+
+    def test_least_recently_used_entries_are_evicted_over_budget(self):
+        # pylint: disable=protected-access
+        body = json.dumps(os.urandom(2048).hex()).encode('utf-8')
+        cache = self.cache
+
+        for i in range(3):
+            cache.store('url{}'.format(i), 200, {}, body, IMMUTABLE)
+            os.utime(cache._path(cache.key('url{}'.format(i))), (i, i))
+
+        # the budget fits exactly the three entries written so far
+        cache.maxSizeBytes = cache._sizeBytes
+        cache.lookup('url0', IMMUTABLE)
+        cache.store('url3', 200, {}, body, IMMUTABLE)
+
+        self.assertIsNotNone(cache.lookup('url0', IMMUTABLE)[0])
+        self.assertIsNone(cache.lookup('url1', IMMUTABLE)[0])
+        self.assertGreater(cache.stats()['evicted'], 0)
+
+
+class Test_CachedApiClient(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DirectoryResponseCache(self.directory.name)
+        self.server = FakeAdoServer().start()
+        with open(os.path.join(FIXTURE_DIRECTORY, 'prThreads.json')) as f:
+            self.server.addJsonRoute('GET', r'/threads$', json.load(f), etag='"threads-v1"')
+
+        self.client = AdoPullRequestReviewCommentsClient("myorg", self.server.host, "6.0", "token", {}, scheme='http', responseCache=self.cache)
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def test_conditional_requests_replay_cached_responses(self):
+        first = self.client.getDeserializedDataset(repo="repo1", project="project", pullRequestId=1)
+        second = self.client.getDeserializedDataset(repo="repo1", project="project", pullRequestId=1)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.requestCount(), 2)
+        self.assertEqual(self.cache.stats()['revalidated'], 1)
+
+    def test_completed_pull_requests_skip_the_network(self):
+        first = self.client.getDeserializedDataset(repo="repo1", project="project", pullRequestId=1, immutable=True)
+        second = self.client.getDeserializedDataset(repo="repo1", project="project", pullRequestId=1, immutable=True)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.requestCount(), 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_async_client_shares_the_cache(self):
+        self.client.getDeserializedDataset(repo="repo1", project="project", pullRequestId=1, immutable=True)
+
+        async def collect():
+            async with aiohttp.ClientSession() as session:
+                return await self.client.getDeserializedDatasetAsync(AsyncApiClient(self.client, session), repo="repo1", project="project", pullRequestId=1, immutable=True)
+
+        self.assertGreater(len(asyncio.run(collect())), 0)
+        self.assertEqual(self.server.requestCount(), 1)
+
+    def test_closed_workitems_are_cached_individually(self):
+        workitems = [{'id': 1, 'fields': {'System.State': 'Closed'}}, {'id': 2, 'fields': {'System.State': 'Active'}}]
+        workitemsClient = AdoGetProjectWorkItemsClient("myorg", self.server.host, "6.0", "token", {}, scheme='http', responseCache=self.cache)
+        self.server.addRoute('GET', r'/_apis/wit/workitems$', lambda path, query: (200, {'value': [w for w in workitems if str(w['id']) in query['ids'][0].split(',')]}, {}))
+
+        cachedWorkitems, missingIds = workitemsClient.CachedWorkitems(['1', '2'], 'project')
+        self.assertEqual(workitemsClient.MergeCachedWorkitems(['1', '2'], cachedWorkitems, workitemsClient.GetWorkitemDetails(missingIds, 'project'), 'project'), workitems)
+
+        cachedWorkitems, missingIds = workitemsClient.CachedWorkitems(['1', '2'], 'project')
+        self.assertEqual(missingIds, ['2'])
+        self.assertEqual(workitemsClient.MergeCachedWorkitems(['1', '2'], cachedWorkitems, workitemsClient.GetWorkitemDetails(missingIds, 'project'), 'project'), workitems)
+
+    def test_changed_closed_workitems_are_fetched_again(self):
+        workitems = {1: {'id': 1, 'rev': 3, 'fields': {'System.State': 'Closed'}}, 2: {'id': 2, 'rev': 1, 'fields': {'System.State': 'Active'}}}
+        workitemsClient = AdoGetProjectWorkItemsClient("myorg", self.server.host, "6.0", "token", {}, scheme='http', responseCache=self.cache)
+        detailRequests = []
+
+        def workitemDetails(_path, query):
+            ids = [int(i) for i in query['ids'][0].split(',')]
+
+            if 'fields' in query:
+                return 200, {'value': [{'id': i, 'rev': workitems[i]['rev'], 'fields': {'System.Rev': workitems[i]['rev']}} for i in ids]}, {}
+
+            detailRequests.append(ids)
+            return 200, {'value': [workitems[i] for i in ids]}, {}
+
+        self.server.addRoute('GET', r'/_apis/wit/workitems$', workitemDetails)
+        self.assertEqual(workitemsClient.GetWorkitemBatch(['1', '2'], 'project'), [workitems[1], workitems[2]])
+
+        # an unchanged closed work item is served from the cache
+        self.assertEqual(workitemsClient.GetWorkitemBatch(['1', '2'], 'project'), [workitems[1], workitems[2]])
+        self.assertEqual(detailRequests, [[1, 2], [2]])
+
+        # reopened since it was cached, as WIQL returns it for having changed
+        workitems[1] = {'id': 1, 'rev': 4, 'fields': {'System.State': 'Active'}}
+
+        async def collect():
+            async with aiohttp.ClientSession() as session:
+                return await workitemsClient.GetWorkitemsAsync(AsyncApiClient(workitemsClient, session), ['1', '2'], 'project')
+
+        self.assertEqual(workitemsClient.GetWorkitemBatch(['1', '2'], 'project'), [workitems[1], workitems[2]])
+        self.assertEqual(asyncio.run(collect()), [workitems[1], workitems[2]])
+        self.assertEqual(detailRequests[2:], [[2, 1], [2, 1]])
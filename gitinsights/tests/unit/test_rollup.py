@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from gitinsights.mods.rollup import rollup
+from gitinsights.mods.rollup import rollupCube
+from gitinsights.tests.benchmarks.synthetic_ado import SyntheticAdoDataset
+from gitinsights.tests.synthetic_ado_case import collectSyntheticActivity
+
+GRAINS = {
+    'contributor_day': ['contributor', 'day', 'repo'],
+    'contributor_week': ['contributor', 'year', 'week', 'repo'],
+    'repo_month': ['repo', 'month'],
+    'team_quarter': ['team', 'quarter'],
+    'org': ['organization']
+}
+
+
+class Test_Rollup(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.manager, cls.events = collectSyntheticActivity(SyntheticAdoDataset(repos=2, pullRequestsPerRepo=8, threadsPerPullRequest=2, commitsPerPullRequest=2, workitems=12, contributors=5))
+
+    def test_every_grain_matches_a_direct_aggregation(self):
+        rollups = self.manager.rollupEvents(self.events, GRAINS)
+        events = self.events.assign(organization='fabrikam', team='synthetic-team')
+
+        self.assertEqual(list(rollups), list(GRAINS))
+
+        for name, columns in GRAINS.items():
+            expected = self.manager.aggregateEvents(events, columns)
+            pd.testing.assert_frame_equal(rollups[name], expected, check_index_type=False, check_categorical=False)
+
+        self.assertEqual(rollups['org']['prs_submitted'].tolist(), [16])
+
+    def test_means_roll_up_from_sum_and_count(self):
+        events = pd.DataFrame({'repo': ['a', 'a', 'a', 'b'], 'week': [1, 1, 2, 2], 'contributor': ['x', np.nan, 'y', 'y'],
+                               'prs': [1, 1, 1, 1], 'days': [1.0, 3.0, 8.0, np.nan]})
+        rollups = rollup(events, {'weekly': ['repo', 'week', 'contributor'], 'repo': ['repo']}, {'prs': 'sum', 'days': 'mean'})
+
+        # averaging the weekly means of repo a would give 5, and its event without a contributor still counts
+        self.assertEqual(rollups['repo'].loc['a'].tolist(), [3, 4.0])
+        self.assertTrue(np.isnan(rollups['repo'].loc['b', 'days']))
+        self.assertEqual(len(rollups['weekly']), 3)
+
+        cube = rollupCube(rollups)
+        self.assertEqual(list(cube.columns), ['grain', 'repo', 'week', 'contributor', 'prs', 'days'])
+        self.assertEqual(cube[cube['grain'] == 'repo']['week'].isna().tolist(), [True, True])
+
+    def test_rejects_unknown_grains(self):
+        self.assertRaises(ValueError, rollup, self.events, {}, {})
+        self.assertRaises(ValueError, rollup, self.events, {'total': []}, {})
+        self.assertRaises(ValueError, rollup, self.events, {'teams': ['team']}, self.manager.AggregationMeasures())
+        self.assertRaises(ValueError, rollup, self.events, {'repos': ['repo']}, {'prs_submitted': 'max'})
@@ -0,0 +1,67 @@
+from functools import partial
+
+import pandas as pd
+
+from gitinsights.mods.instrumentation import MetricsInstrumentation
+from gitinsights.mods.managers.ado import AzureDevopsClientManager
+from gitinsights.mods.managers.ado import CollectionSettings
+from gitinsights.mods.managers.sharded import CollectionTarget
+from gitinsights.mods.managers.sharded import ShardedCollectionDriver
+from gitinsights.tests.fake_ado_server import redirectManager
+from gitinsights.tests.synthetic_ado_case import SyntheticAdoTestCase
+
+
+# module level so the worker processes can unpickle it
+def redirectedManager(host: str, *args, **kwargs) -> AzureDevopsClientManager:
+    manager = AzureDevopsClientManager(*args, **kwargs)
+    redirectManager(manager, host)
+
+    return manager
+
+
+class Test_ShardedCollectionDriver(SyntheticAdoTestCase):
+    datasetSettings = {'repos': 2, 'pullRequestsPerRepo': 6, 'threadsPerPullRequest': 2, 'commitsPerPullRequest': 2, 'workitems': 10, 'contributors': 6}
+
+    def setUp(self):
+        super().setUp()
+        self.targets = [CollectionTarget('fabrikam', self.dataset.project, self.dataset.repos, 'synthetic-team'),
+                        CollectionTarget('fabrikam', 'other-project', self.dataset.repos[:1], 'synthetic-team'),
+                        CollectionTarget('contoso', self.dataset.project, self.dataset.repos, 'synthetic-team')]
+
+    def driver(self, maxProcesses: int = None, maxConcurrentRequestsPerOrg: int = 8, **kwargs) -> ShardedCollectionDriver:
+        return ShardedCollectionDriver(self.targets, 'token', maxProcesses, maxConcurrentRequestsPerOrg, partial(redirectedManager, self.server.host), CollectionSettings(**kwargs))
+
+    def entitlementsRequests(self, organization: str) -> int:
+        return len([path for method, path in self.server.requestLog if path.startswith('/{}/_apis/graph/users'.format(organization))])
+
+    def test_merges_the_target_frames(self):
+        instrumentation = MetricsInstrumentation()
+        events = self.driver(maxProcesses=2, maxConcurrentRequestsPerOrg=2, instrumentation=instrumentation).collectPullRequestActivity()
+
+        # the metrics of every worker process are merged into the driver's
+        self.assertEqual(sum(r['count'] for r in instrumentation.summary()['requests']), self.server.requestCount())
+        self.assertEqual(instrumentation.summary()['stages']['collect']['calls'], len(self.targets))
+
+        for target in self.targets:
+            manager = redirectedManager(self.server.host, *target, 'token')
+            expected = manager.collectPullRequestActivity()
+            actual = events[(events['organization'] == target.organization) & (events['project'] == target.project)].drop(columns=['organization', 'project', 'team'])
+
+            # the merged categoricals hold the contributors and repos of every target
+            pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected, check_categorical=False)
+
+    def test_loads_entitlements_once_per_org(self):
+        report = self.driver(maxProcesses=2).aggregatePullRequestActivity(['organization', 'project', 'contributor', 'week', 'repo'])
+        singleOrgRequests = self.entitlementsRequests('contoso')
+
+        self.assertEqual(self.entitlementsRequests('fabrikam'), singleOrgRequests)
+        self.assertEqual(set(report.index.get_level_values('project')), {self.dataset.project, 'other-project'})
+        self.assertEqual(report.loc['fabrikam', self.dataset.project]['prs_submitted'].sum(), 12)
+        self.assertEqual(report.loc['fabrikam', 'other-project']['prs_submitted'].sum(), 6)
+
+        self.assertEqual(self.driver().ReportSchema()['project'], 'category')
+        # project scoped profiles are loaded by every target
+        self.driver(maxProcesses=2, entitlementsScope='project')
+        self.assertRaises(ValueError, self.driver, incrementalStore=object())
+        self.assertRaises(ValueError, self.driver, eventLog=object())
+        self.assertRaises(TypeError, ShardedCollectionDriver, self.targets, {'fabrikam': 'token'})
@@ -0,0 +1,60 @@
+import json
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from gitinsights.mods.incremental import finalizeMeasures
+from gitinsights.mods.incremental import measurePartials
+from gitinsights.mods.incremental import sumPartials
+from gitinsights.mods.sketches import DEFAULT_RELATIVE_ACCURACY
+from gitinsights.mods.sketches import QuantileMeasure
+from gitinsights.mods.sketches import QuantileSketch
+from gitinsights.mods.sketches import namedAggregations
+from gitinsights.mods.sketches import quantileMeasures
+
+MEASURES = {'days': 'mean', 'days_p50': QuantileMeasure('days', 0.5), 'days_p99': QuantileMeasure('days', 0.99)}
+
+
+class Test_QuantileSketch(TestCase):
+    def setUp(self):
+        self.durations = np.random.default_rng(7).lognormal(mean=1.5, sigma=1.2, size=5000)
+
+    def test_quantiles_are_within_the_relative_accuracy(self):
+        sketch = QuantileSketch().addValues(self.durations)
+
+        for quantile in (0, 0.5, 0.9, 0.99, 1):
+            exact = np.quantile(self.durations, quantile, method='lower')
+            self.assertLessEqual(abs(sketch.quantile(quantile) - exact), exact * DEFAULT_RELATIVE_ACCURACY)
+
+        self.assertEqual(sketch.count, 5000)
+        self.assertTrue(np.isnan(QuantileSketch().quantile(0.5)))
+        self.assertRaises(ValueError, sketch.quantile, 1.5)
+
+    def test_merged_sketches_equal_the_sketch_of_every_value(self):
+        left, right = self.durations[:1200], self.durations[1200:]
+        merged = QuantileSketch().addValues(left) + QuantileSketch().addValues(right)
+
+        self.assertEqual(merged, QuantileSketch().addValues(self.durations))
+        self.assertEqual(QuantileSketch.fromDict(json.loads(json.dumps(merged.toDict()))), merged)
+        self.assertRaises(ValueError, merged.merge, QuantileSketch(0.05))
+
+    def test_zero_and_negative_durations(self):
+        sketch = QuantileSketch().addValues([-4.0, 0.0, 0.0, np.nan, 3.0])
+
+        self.assertEqual(sketch.count, 4)
+        self.assertAlmostEqual(sketch.quantile(0), -4.0, delta=0.04)
+        self.assertEqual(sketch.quantile(0.5), 0.0)
+        self.assertAlmostEqual(sketch.quantile(1), 3.0, delta=0.03)
+
+    def test_partials_match_the_batch_aggregation(self):
+        events = pd.DataFrame({'repo': np.repeat(['a', 'b', 'c'], [2000, 2000, 1000]), 'days': self.durations})
+        events.loc[::7, 'days'] = np.nan
+        expected = events.groupby('repo').agg(**namedAggregations(MEASURES))
+
+        # partials of two disjoint halves, merged like the runs of an incremental store
+        halves = [sumPartials(pd.concat([half[['repo']], measurePartials(half, MEASURES)], axis=1), ['repo']) for half in (events.iloc[::2], events.iloc[1::2])]
+        merged = finalizeMeasures(sumPartials(pd.concat(halves), level=['repo']), MEASURES)
+
+        pd.testing.assert_frame_equal(merged, expected)
+        self.assertEqual(list(quantileMeasures({'days': {'quantiles': (0.5, 0.999)}, 'repo': {}})), ['days_p50', 'days_p99.9'])
@@ -0,0 +1,39 @@
+import asyncio
+
+import pandas as pd
+
+from gitinsights.mods.streaming import StreamingAggregator
+from gitinsights.tests.synthetic_ado_case import SyntheticAdoTestCase
+
+GROUP_BY_COLUMNS = ['contributor', 'week', 'repo']
+
+
+class Test_StreamingAggregator(SyntheticAdoTestCase):
+    datasetSettings = {'repos': 2, 'pullRequestsPerRepo': 8, 'threadsPerPullRequest': 3, 'commitsPerPullRequest': 2, 'workitems': 12, 'contributors': 5}
+
+    def test_matches_the_batch_aggregation(self):
+        expected = self.manager().aggregatePullRequestActivity(GROUP_BY_COLUMNS)
+
+        # chunks smaller than a repo's records so the groups are folded across many chunks
+        for chunkSize in (40, 100000):
+            pd.testing.assert_frame_equal(self.manager().aggregatePullRequestActivityStreaming(GROUP_BY_COLUMNS, chunkSize), expected)
+
+        pd.testing.assert_frame_equal(self.manager().aggregatePullRequestActivityStreaming(['repo'], 5), self.manager().aggregatePullRequestActivity(['repo']))
+        pd.testing.assert_frame_equal(asyncio.run(self.manager().aggregatePullRequestActivityStreamingAsync(['year', 'week'], 11)), self.manager().aggregatePullRequestActivity(['year', 'week']))
+
+    def test_memory_is_bounded_by_the_groups(self):
+        # pylint: disable=protected-access
+        manager = self.manager()
+        events = manager.collectPullRequestActivity()
+        aggregator = StreamingAggregator(manager._reportableFields, GROUP_BY_COLUMNS, manager.AggregationMeasures(), manager._toDataFrame, chunkSize=10)
+        aggregator.extend({'contributor': 'Norman Paulk', 'repo': 'repo1', 'activity_date': '2021-01-0{}T00:00:00Z'.format(day % 3 + 4), 'prs_submitted': 1} for day in range(95))
+
+        # three days of the same ISO week
+        self.assertEqual(len(aggregator), 95)
+        self.assertEqual(aggregator.groups, 1)
+        self.assertEqual(aggregator.result()['prs_submitted'].tolist(), [95])
+        self.assertGreater(len(events), manager.aggregateEvents(events, GROUP_BY_COLUMNS).shape[0])
+
+    def test_rejects_unsupported_settings(self):
+        self.assertRaises(ValueError, StreamingAggregator, {}, GROUP_BY_COLUMNS, {}, None, 0)
+        self.assertTrue(StreamingAggregator({}, GROUP_BY_COLUMNS, {'prs_submitted': 'sum'}, None).result().empty)
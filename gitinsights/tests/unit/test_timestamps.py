@@ -0,0 +1,51 @@
+import datetime
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from dateutil import parser
+
+from gitinsights.mods.timestamps import FRACTIONAL_DAYS
+from gitinsights.mods.timestamps import ISO_WEEK
+from gitinsights.mods.timestamps import TIMESTAMP
+from gitinsights.mods.timestamps import WHOLE_DAYS
+from gitinsights.mods.timestamps import deriveTimestampFields
+from gitinsights.mods.timestamps import parseIsoTimestamp
+
+REPORTABLE_FIELDS = {
+    'week': {'default': np.nan, 'agg_function': None, 'derived_from': (ISO_WEEK, 'activity_date')},
+    'creation_datetime': {'default': np.nan, 'agg_function': None, 'derived_from': (TIMESTAMP, 'creation_datetime')},
+    'completion_days': {'default': np.nan, 'agg_function': 'mean', 'derived_from': (WHOLE_DAYS, 'creation_datetime', 'closed_date')},
+    'submission_days': {'default': np.nan, 'agg_function': 'mean', 'derived_from': (FRACTIONAL_DAYS, 'creation_datetime', 'submitted_date')}
+}
+
+
+class Test_Timestamps(TestCase):
+    def test_parse_iso_timestamp_matches_dateutil(self):
+        for value in ['2016-11-01T16:30:31.6655471Z', '2020-10-29T21:54:44Z', '2020-10-29T21:54:44.77+02:00', '2020-10-29']:
+            self.assertEqual(parseIsoTimestamp(value), parser.parse(value).replace(microsecond=parser.parse(value).microsecond))
+
+    def test_derives_weeks_and_day_deltas_in_bulk(self):
+        frame = pd.DataFrame([
+            {'activity_date': '2020-10-29T21:54:44.7771234Z', 'creation_datetime': '2020-10-29T21:54:44.7771234Z', 'closed_date': '2020-11-01T20:00:00Z', 'submitted_date': '2020-10-30T03:54:44Z'},
+            {'activity_date': '2021-01-03T10:00:00Z', 'creation_datetime': '2021-01-03T10:00:00Z', 'closed_date': np.nan, 'submitted_date': np.nan},
+            {'activity_date': np.nan, 'creation_datetime': np.nan, 'closed_date': np.nan, 'submitted_date': np.nan}
+        ])
+
+        derived = deriveTimestampFields(frame, REPORTABLE_FIELDS)
+
+        self.assertEqual(list(derived.columns), ['creation_datetime', 'week', 'completion_days', 'submission_days'])
+        # the first days of 2021 belong to the last ISO week of 2020
+        self.assertEqual(derived['week'].tolist()[:2], [202044, 202053])
+        self.assertTrue(pd.isna(derived['week'][2]))
+        self.assertEqual(derived['creation_datetime'][1], pd.Timestamp(datetime.datetime(2021, 1, 3, 10, tzinfo=datetime.timezone.utc)))
+        self.assertEqual(derived['completion_days'][0], 2)
+        self.assertTrue(derived['completion_days'][1:].isna().all())
+        # partial minutes are dropped
+        self.assertEqual(derived['submission_days'][0], 359 / 60 / 24)
+
+    def test_missing_source_columns_derive_missing_values(self):
+        derived = deriveTimestampFields(pd.DataFrame([{'activity_date': '2020-10-29T21:54:44Z'}]), REPORTABLE_FIELDS)
+
+        self.assertEqual(derived['week'].tolist(), [202044])
+        self.assertTrue(derived['completion_days'].isna().all())
@@ -0,0 +1,280 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+import aiohttp
+
+from gitinsights.mods.async_client import AsyncApiClient
+from gitinsights.mods.clients.ado.comments import AdoPullRequestReviewCommentsClient
+from gitinsights.mods.clients.ado.pull_request import AdoPullRequestsClient
+from gitinsights.mods.instrumentation import MetricsInstrumentation
+from gitinsights.mods.transport import THROTTLE_RATE_LIMIT_DELAY
+from gitinsights.mods.transport import THROTTLE_RATE_LIMIT_REMAINING
+from gitinsights.mods.transport import THROTTLE_RETRY_AFTER
+from gitinsights.mods.transport import AdaptiveConcurrencyLimiter
+from gitinsights.mods.transport import HostConcurrencyLimiter
+from gitinsights.mods.transport import PooledTransport
+from gitinsights.mods.transport import SharedConcurrencyLimiter
+from gitinsights.tests.fake_ado_server import FakeAdoServer
+
+
+class Test_HostConcurrencyLimiter(TestCase):
+    def test_caps_in_flight_requests_per_host(self):
+        limiter = HostConcurrencyLimiter(2)
+        lock = threading.Lock()
+        inFlight = {'dev.azure.com': 0, 'vssps.dev.azure.com': 0}
+        peak = {'dev.azure.com': 0, 'vssps.dev.azure.com': 0}
+
+        def request(host: str):
+            with limiter.acquire(host):
+                with lock:
+                    inFlight[host] += 1
+                    peak[host] = max(peak[host], inFlight[host])
+                time.sleep(0.01)
+                with lock:
+                    inFlight[host] -= 1
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(request, ['dev.azure.com'] * 8 + ['vssps.dev.azure.com'] * 8))
+
+        self.assertEqual(peak['dev.azure.com'], 2)
+        self.assertEqual(peak['vssps.dev.azure.com'], 2)
+
+    def test_rejects_non_positive_limits(self):
+        with self.assertRaises(ValueError):
+            HostConcurrencyLimiter(0)
+
+    def test_shared_semaphore_caps_requests_across_hosts(self):
+        # the semaphore stands in for the org wide cap shared by the worker processes of a sharded collection
+        limiter = SharedConcurrencyLimiter(threading.BoundedSemaphore(3), 2)
+        lock = threading.Lock()
+        inFlight = {'total': 0}
+        peak = {'total': 0}
+
+        def request(host: str):
+            with limiter.acquire(host):
+                with lock:
+                    inFlight['total'] += 1
+                    peak['total'] = max(peak['total'], inFlight['total'])
+                time.sleep(0.01)
+                with lock:
+                    inFlight['total'] -= 1
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(request, ['dev.azure.com'] * 8 + ['vssps.dev.azure.com'] * 8))
+
+        self.assertEqual(peak['total'], 3)
+
+
+class Test_AdaptiveConcurrencyLimiter(TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.limiter = AdaptiveConcurrencyLimiter(HostConcurrencyLimiter(8), 'myorg', decreaseCooldown=10, clock=lambda: self.now[0])
+
+    def test_halves_on_throttling_and_recovers_additively(self):
+        self.limiter.observe('dev.azure.com', 200, {}, [429])
+        # the rest of a throttled burst is counted without halving the window again
+        self.limiter.observe('dev.azure.com', 429, {}, [])
+        self.assertEqual(self.limiter.concurrency, 4)
+
+        for _ in range(4):
+            self.limiter.observe('dev.azure.com', 200, {}, [])
+
+        self.assertEqual(int(self.limiter.concurrency), 4)
+        self.limiter.observe('dev.azure.com', 200, {}, [])
+        self.assertEqual(int(self.limiter.concurrency), 5)
+
+        self.now[0] = 10
+        self.limiter.observe('dev.azure.com', 200, {'X-RateLimit-Delay': '0.5'}, [])
+        self.now[0] = 20
+        self.limiter.observe('dev.azure.com', 200, {'X-RateLimit-Remaining': '10', 'X-RateLimit-Limit': '200'}, [])
+        self.assertLess(self.limiter.concurrency, 2)
+
+        with self.assertLogs(level='WARNING'):
+            self.limiter.observe('dev.azure.com', 200, {'X-RateLimit-Remaining': '150', 'X-RateLimit-Limit': '200', 'X-RateLimit-Delay': 'soon'}, [])
+
+        self.assertEqual(self.limiter.stats()['throttle_events'], {THROTTLE_RETRY_AFTER: 2, THROTTLE_RATE_LIMIT_DELAY: 1, THROTTLE_RATE_LIMIT_REMAINING: 1})
+        self.assertEqual(self.limiter.stats()['in_flight'], 0)
+
+    def test_never_drops_below_the_minimum(self):
+        for second in range(10):
+            self.now[0] = second * 10
+            self.limiter.observe('dev.azure.com', 429, {}, [])
+
+        self.assertEqual(self.limiter.concurrency, 1)
+        self.assertRaises(ValueError, AdaptiveConcurrencyLimiter, HostConcurrencyLimiter(2), minConcurrentRequests=3)
+        self.assertRaises(ValueError, AdaptiveConcurrencyLimiter, HostConcurrencyLimiter(2), decreaseFactor=1)
+
+    def test_retry_after_holds_requests_back(self):
+        limiter = AdaptiveConcurrencyLimiter(HostConcurrencyLimiter(2), 'myorg')
+        limiter.observe('dev.azure.com', 429, {'Retry-After': '0.2'}, [])
+        started = time.monotonic()
+
+        self.assertGreater(limiter.pauseSeconds(), 0)
+
+        with limiter.acquire('vssps.dev.azure.com'):
+            self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    def test_caps_in_flight_requests_to_the_window(self):
+        self.limiter.observe('dev.azure.com', 429, {}, [])
+        self.limiter.observe('dev.azure.com', 429, {}, [])
+        self.now[0] = 10
+        self.limiter.observe('dev.azure.com', 429, {}, [])
+        lock = threading.Lock()
+        inFlight = {'total': 0}
+        peak = {'total': 0}
+
+        def request(host: str):
+            with self.limiter.acquire(host):
+                with lock:
+                    inFlight['total'] += 1
+                    peak['total'] = max(peak['total'], inFlight['total'])
+                time.sleep(0.01)
+                with lock:
+                    inFlight['total'] -= 1
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(request, ['dev.azure.com'] * 16))
+
+        self.assertEqual(peak['total'], 2)
+
+    def test_caps_in_flight_async_requests_to_the_window(self):
+        self.limiter.observe('dev.azure.com', 429, {}, [])
+        self.now[0] = 10
+        self.limiter.observe('dev.azure.com', 429, {}, [])
+        inFlight = {'total': 0}
+        peak = {'total': 0}
+
+        async def request(host: str):
+            async with self.limiter.acquireAsync(host):
+                inFlight['total'] += 1
+                peak['total'] = max(peak['total'], inFlight['total'])
+                await asyncio.sleep(0.01)
+                inFlight['total'] -= 1
+
+        async def collect():
+            await asyncio.gather(*(request('dev.azure.com') for _ in range(16)))
+
+        # sync requests taking slots in between share the same window
+        with self.limiter.acquire('dev.azure.com'):
+            self.assertEqual(self.limiter.stats()['in_flight'], 1)
+
+        asyncio.run(collect())
+
+        self.assertEqual(peak['total'], 2)
+        self.assertEqual(self.limiter.stats()['in_flight'], 0)
+
+    def test_retry_after_holds_async_requests_back(self):
+        limiter = AdaptiveConcurrencyLimiter(HostConcurrencyLimiter(2), 'myorg')
+        limiter.observe('dev.azure.com', 429, {'Retry-After': '0.2'}, [])
+        started = time.monotonic()
+
+        async def request():
+            async with limiter.acquireAsync('vssps.dev.azure.com'):
+                return time.monotonic() - started
+
+        self.assertGreaterEqual(asyncio.run(request()), 0.15)
+
+    def test_async_client_requests_hold_a_slot(self):
+        limiter = AdaptiveConcurrencyLimiter(SharedConcurrencyLimiter(threading.BoundedSemaphore(2), 1), 'myorg')
+        lock = threading.Lock()
+        inFlight = {'total': 0}
+        peak = {'total': 0}
+
+        # pylint: disable=unused-argument
+        def pullRequests(path, query):
+            with lock:
+                inFlight['total'] += 1
+                peak['total'] = max(peak['total'], inFlight['total'])
+            time.sleep(0.01)
+            with lock:
+                inFlight['total'] -= 1
+
+            return 200, {'value': [], 'count': 0}, {}
+
+        async def collect(client: AdoPullRequestsClient):
+            async with aiohttp.ClientSession() as session:
+                asyncClient = AsyncApiClient(client, session)
+                await asyncio.gather(*(asyncClient.sendGetRequest(client.ResourcePath(repo="repo1", project="project"), {}) for _ in range(8)))
+
+        with FakeAdoServer() as server:
+            server.addRoute('GET', r'/pullrequests$', pullRequests)
+            asyncio.run(collect(AdoPullRequestsClient("myorg", server.host, "6.0", "token", {}, concurrencyLimiter=limiter, scheme='http')))
+
+            self.assertEqual(server.requestCount(), 8)
+
+        self.assertEqual(peak['total'], 1)
+        self.assertEqual(limiter.stats()['in_flight'], 0)
+
+
+class Test_ThrottlingFeedback(TestCase):
+    def setUp(self):
+        self.server = FakeAdoServer().start()
+        self.server.addRoute('GET', r'/pullrequests$', lambda path, query: (200, {'value': [], 'count': 0}, {'X-RateLimit-Delay': '0.25', 'X-RateLimit-Remaining': '40', 'X-RateLimit-Limit': '200'}))
+        self.instrumentation = MetricsInstrumentation()
+        self.limiter = AdaptiveConcurrencyLimiter(HostConcurrencyLimiter(8), 'myorg', decreaseCooldown=0, instrumentation=self.instrumentation)
+        self.client = AdoPullRequestsClient("myorg", self.server.host, "6.0", "token", {}, concurrencyLimiter=self.limiter, scheme='http', instrumentation=self.instrumentation)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_sync_and_async_clients_feed_the_limiter(self):
+        self.client.getDeserializedDataset(repo="repo1", project="project")
+
+        async def collect():
+            async with aiohttp.ClientSession() as session:
+                return await AsyncApiClient(self.client, session).sendGetRequest(self.client.ResourcePath(repo="repo1", project="project"), {})
+
+        asyncio.run(collect())
+        rateLimits = self.instrumentation.summary()['rate_limits']['myorg']
+
+        self.assertEqual(self.limiter.concurrency, 2)
+        self.assertEqual(rateLimits, {'concurrency': 2, 'min_concurrency': 2, 'throttle_events': {THROTTLE_RATE_LIMIT_DELAY: 2}, 'throttle_delay_seconds': 0.5})
+        self.assertIn('gitinsights_rate_limit_concurrency{org="myorg"} 2', self.instrumentation.toPrometheusText())
+        self.assertIn('gitinsights_throttle_events_total{org="myorg",reason="rate_limit_delay"} 2', self.instrumentation.toPrometheusText())
+
+
+class Test_PooledTransport(TestCase):
+    def setUp(self):
+        self.server = FakeAdoServer().start()
+        self.server.addJsonRoute('GET', r'/pullrequests$', {'value': [], 'count': 0})
+        self.server.addJsonRoute('GET', r'/threads$', {'value': [], 'count': 0})
+
+    def tearDown(self):
+        self.server.stop()
+
+    def sendRequests(self, transport: PooledTransport, requestCount: int):
+        prClient = AdoPullRequestsClient("myorg", self.server.host, "6.0", "token", {}, transport=transport, scheme='http')
+        commentsClient = AdoPullRequestReviewCommentsClient("myorg", self.server.host, "6.0", "token", {}, transport=transport, scheme='http')
+
+        for i in range(requestCount):
+            self.assertEqual(prClient.getDeserializedDataset(repo="repo1", project="project"), [])
+            self.assertEqual(commentsClient.getDeserializedDataset(repo="repo1", project="project", pullRequestId=i), [])
+
+        self.assertIs(prClient.session(), commentsClient.session())
+
+    def test_clients_share_pooled_connections(self):
+        transport = PooledTransport(poolSize=2)
+        self.sendRequests(transport, 10)
+
+        stats = transport.connectionStats()[self.server.host]
+        self.assertEqual(stats['requests'], 20)
+        self.assertEqual(stats['connections_opened'], 1)
+        self.assertEqual(stats['connections_reused'], 19)
+        self.assertEqual(self.server.requestCount(), 20)
+        transport.close()
+        self.assertEqual(transport.connectionStats(), {})
+
+    def test_keep_alive_disabled_opens_connection_per_request(self):
+        transport = PooledTransport(poolSize=2, keepAlive=False)
+        self.sendRequests(transport, 5)
+
+        stats = transport.connectionStats()[self.server.host]
+        self.assertEqual(stats['connections_opened'], 10)
+        self.assertEqual(stats['connections_reused'], 0)
+
+    def test_rejects_non_positive_pool_size(self):
+        with self.assertRaises(ValueError):
+            PooledTransport(0)